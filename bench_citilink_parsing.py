@@ -0,0 +1,97 @@
+"""
+Сравнение способов сбора характеристик ситилинка (execute_script / обход элементов)
+на сохранённых страницах товаров, которые раздаются локальным сервером.
+
+Пример:
+    python bench_citilink_parsing.py --pages fixtures/citilink/products --repeat 5
+Страницы сохраняются из браузера уже с раскрытым блоком «Все характеристики».
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+
+from fixture_server import serve_directory
+from page_scripts import CITILINK_PARAMS_XPATH
+from tools import Tools
+
+
+class CommandCounter:
+    """
+    Подсчёт запросов к WebDriver: каждый вызов command_executor.execute - один HTTP round trip.
+    """
+    def __init__(self, driver):
+        self.count = 0
+        executor = driver.command_executor
+        execute = executor.execute
+
+        def counted(*args, **kwargs):
+            self.count += 1
+            return execute(*args, **kwargs)
+
+        executor.execute = counted
+
+    def reset(self):
+        self.count = 0
+
+
+def measure(tools, counter, url, mode, repeat):
+    # Tools не ждёт загрузки в driver.get (page_load_strategy='none'), поэтому замер начинается
+    # только после появления характеристик, как в Tools.citilink_parsing
+    tools.open(url)
+    tools.waiter.until('citilink_chars', EC.presence_of_element_located((By.XPATH, CITILINK_PARAMS_XPATH)))
+
+    extract = tools.citilink_extract_script if mode == 'script' else tools.citilink_extract_selenium
+
+    times = []
+    result = None
+    counter.reset()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = extract()
+        times.append(time.perf_counter() - start)
+
+    return {
+        'mode': mode,
+        'p50_ms': round(float(np.percentile(times, 50)) * 1000, 1),
+        'round_trips': counter.count // repeat,
+        'params': 0 if result is None else len(result[2]),
+    }, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк сбора характеристик ситилинка')
+    parser.add_argument('--pages', required=True, help='Каталог с сохранёнными страницами товаров (*.html)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-v', '--view-browser', action='store_true')
+    args = parser.parse_args()
+
+    server, base_url = serve_directory(args.pages)
+    tools = Tools(queue.Queue(), threading.Event(), browser_window=args.view_browser)
+    counter = CommandCounter(tools.driver)
+
+    try:
+        for page in sorted(os.listdir(args.pages)):
+            if not page.endswith('.html'):
+                continue
+            url = '%s/%s' % (base_url, page)
+
+            script, script_result = measure(tools, counter, url, 'script', args.repeat)
+            selenium, selenium_result = measure(tools, counter, url, 'selenium', args.repeat)
+
+            same = script_result is not None and script_result[2] == selenium_result[2]
+            print(json.dumps({'page': page, 'script': script, 'selenium': selenium, 'same_params': same},
+                             ensure_ascii=False))
+    finally:
+        tools.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
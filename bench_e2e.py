@@ -0,0 +1,220 @@
+"""
+Сквозной бенчмарк всех этапов на сохранённых страницах, которые раздаются локальными серверами.
+
+Каталог с фикстурами:
+    fixtures/
+        items.csv        - товары, как для gossy_batch.py (query и/или url; url можно давать от корня сайта)
+        citilink/        - страницы поиска и товаров ситилинка, routes.json для адресов поиска
+        goszakupki/      - главная страница, страницы укрупнённых позиций и КТРУ госзакупок, ответы их API
+
+Фикстуры в репозиторий не входят (это копии чужих сайтов, и они устаревают); каталог записывается
+в настоящем браузере скриптом capture_fixtures.py.
+
+Кэш страниц и зеркало КТРУ отключены, чтобы каждый прогон проходил через браузер.
+Результат - JSON с p50/p95 по этапам и целиком, числом запросов к WebDriver,
+числом вызовов модели и пиковой памятью; его можно сохранять и сравнивать между версиями.
+
+Пример:
+    python bench_e2e.py fixtures --latency 80 --jitter 20 --repeat 5 --output bench_e2e.json
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import threading
+import time
+
+import numpy as np
+
+from bench_citilink_parsing import CommandCounter
+from bench_embeddings import peak_rss_mb
+from fixture_server import serve_sites
+from gossy_batch import process_item, read_items
+from pipeline import Scheduler
+from tools import Tools, BASE_URLS, create_embedder
+
+STAGES = ['citilink_search', 'citilink_parsing', 'goszakupki_search', 'goszakupki_parsing', 'total']
+
+
+class EmbeddingCounter:
+    """
+    Подсчёт вызовов модели векторизации и числа строк, ушедших в модель (мимо кэша векторов).
+    """
+    def __init__(self, embedder):
+        self.calls = 0
+        self.texts = 0
+        model = embedder.embedding_model
+        embed_documents = model.embed_documents
+
+        def counted(texts):
+            self.calls += 1
+            self.texts += len(texts)
+            return embed_documents(texts)
+
+        model.embed_documents = counted
+
+    def reset(self):
+        self.calls = 0
+        self.texts = 0
+
+
+class BrowserMemory:
+    """
+    Пиковая память процессов браузера (chromedriver и все его потомки), опрос раз в interval секунд.
+    Нужен psutil; без него замер пропускается.
+    """
+    def __init__(self, driver, interval=0.2):
+        self.peak_mb = None
+        self._stop = threading.Event()
+        try:
+            import psutil
+            self._root = psutil.Process(driver.service.process.pid)
+        except Exception as e:
+            return
+        self.peak_mb = 0.0
+        self._thread = threading.Thread(target=self._poll, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def _poll(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                processes = [self._root] + self._root.children(recursive=True)
+                total = sum(process.memory_info().rss for process in processes)
+            except Exception as e:
+                continue
+            self.peak_mb = max(self.peak_mb, total / 1024 / 1024)
+
+    def stop(self):
+        self._stop.set()
+        return None if self.peak_mb is None else round(self.peak_mb, 1)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    return {
+        'p50_ms': round(float(np.percentile(values, 50)) * 1000, 1),
+        'p95_ms': round(float(np.percentile(values, 95)) * 1000, 1),
+        'n': len(values),
+    }
+
+
+def local_item(item, local_urls):
+    """
+    Ссылки товара переводятся на локальный сервер ситилинка.
+    """
+    url = item['url']
+    if url.startswith(BASE_URLS['citilink']):
+        url = local_urls['citilink'] + url[len(BASE_URLS['citilink']):]
+    elif url.startswith('/'):
+        url = local_urls['citilink'] + url
+    return dict(item, url=url)
+
+
+def run(args):
+    servers, local_urls = serve_sites(args.fixtures, BASE_URLS, args.latency / 1000, args.jitter / 1000)
+    items = [local_item(item, local_urls) for item in read_items(os.path.join(args.fixtures, args.items))]
+
+    embedder = create_embedder(args.embedding_backend)
+    embedding_counter = EmbeddingCounter(embedder)
+
+    tools = Tools(queue.Queue(), threading.Event(), browser_window=args.view_browser, embedder=embedder,
+                  extraction_mode=args.extraction_mode, page_cache=False, ktru_mirror=False,
+                  resource_policy=not args.load_all_resources, page_load_strategy=args.page_load_strategy,
+                  base_urls=local_urls, json_capture=not args.dom_only, citilink_fetch=args.citilink_fetch)
+    command_counter = CommandCounter(tools.driver)
+    browser_memory = BrowserMemory(tools.driver)
+
+    scheduler = Scheduler()
+    timings = {stage: [] for stage in STAGES}
+    round_trips = []
+    embedding_calls = []
+    embedding_texts = []
+    statuses = {}
+
+    try:
+        for repeat in range(args.warmup + args.repeat):
+            for item in items:
+                command_counter.reset()
+                embedding_counter.reset()
+
+                record = process_item(tools, item, scheduler=scheduler)
+
+                if repeat < args.warmup:
+                    continue
+                statuses[record['status']] = statuses.get(record['status'], 0) + 1
+                for stage, seconds in record['timings'].items():
+                    if stage in timings:
+                        timings[stage].append(seconds)
+                round_trips.append(command_counter.count)
+                embedding_calls.append(embedding_counter.calls)
+                embedding_texts.append(embedding_counter.texts)
+    finally:
+        browser_peak = browser_memory.stop()
+        tools.close()
+        scheduler.close()
+        for server in servers:
+            server.shutdown()
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'config': {
+            'items': len(items),
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'latency_ms': args.latency,
+            'jitter_ms': args.jitter,
+            'embedding_backend': args.embedding_backend,
+            'extraction_mode': args.extraction_mode,
+            'page_load_strategy': args.page_load_strategy,
+            'block_resources': not args.load_all_resources,
+            'json_capture': not args.dom_only,
+            'citilink_fetch': args.citilink_fetch,
+        },
+        'statuses': statuses,
+        'stages': {stage: percentiles(values) for stage, values in timings.items()},
+        'webdriver_round_trips': {
+            'mean': round(float(np.mean(round_trips)), 1) if round_trips else None,
+            'max': max(round_trips, default=None),
+        },
+        'embedding': {
+            'calls_mean': round(float(np.mean(embedding_calls)), 2) if embedding_calls else None,
+            'texts_mean': round(float(np.mean(embedding_texts)), 1) if embedding_texts else None,
+        },
+        'peak_rss_mb': {
+            'python': round(peak_rss_mb(), 1),
+            'browser': browser_peak,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сквозной бенчмарк этапов на локальных копиях сайтов')
+    parser.add_argument('fixtures', help='Каталог с фикстурами (citilink/, goszakupki/, items.csv)')
+    parser.add_argument('--items', default='items.csv', help='Файл товаров внутри каталога фикстур')
+    parser.add_argument('--repeat', type=int, default=3, help='Число замеряемых проходов по всем товарам')
+    parser.add_argument('--warmup', type=int, default=1, help='Число проходов для прогрева, не входят в замер')
+    parser.add_argument('--latency', type=float, default=0, help='Задержка каждого ответа сервера, мс')
+    parser.add_argument('--jitter', type=float, default=0, help='Случайный разброс задержки (±), мс')
+    parser.add_argument('--embedding-backend', choices=['torch', 'onnx'], default='torch')
+    parser.add_argument('--extraction-mode', choices=['script', 'selenium'], default='script')
+    parser.add_argument('--page-load-strategy', choices=['none', 'eager', 'normal'], default='none')
+    parser.add_argument('--load-all-resources', action='store_true')
+    parser.add_argument('--citilink-fetch', choices=['browser', 'http'], default='browser')
+    parser.add_argument('--dom-only', action='store_true', help='Не брать данные госзакупок из ответов API')
+    parser.add_argument('-v', '--view-browser', action='store_true')
+    parser.add_argument('--output', help='Дописать результат строкой JSON в этот файл')
+    args = parser.parse_args()
+
+    result = run(args)
+    line = json.dumps(result, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
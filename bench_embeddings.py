@@ -0,0 +1,159 @@
+"""
+Бенчмарк бэкендов модели векторизации (torch / onnx) на названиях характеристик.
+
+Примеры:
+    python bench_embeddings.py                          # оба бэкенда + сравнение векторов
+    python bench_embeddings.py --names names.txt        # свои названия, по одному в строке
+    python bench_embeddings.py --backend onnx --json    # один бэкенд, результат в JSON
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+MODEL_NAME = 'intfloat/multilingual-e5-small'
+
+# Типичные названия характеристик с ситилинка и госзакупок
+SAMPLE_NAMES = [
+    'Объем оперативной памяти', 'Тип процессора', 'Количество ядер процессора', 'Частота процессора',
+    'Диагональ экрана', 'Разрешение экрана', 'Тип матрицы экрана', 'Частота обновления экрана',
+    'Объем накопителя', 'Тип накопителя', 'Видеокарта', 'Объем видеопамяти', 'Операционная система',
+    'Емкость аккумулятора', 'Время автономной работы', 'Вес', 'Цвет корпуса', 'Материал корпуса',
+    'Количество портов USB', 'Наличие HDMI', 'Wi-Fi', 'Bluetooth', 'Веб-камера', 'Подсветка клавиатуры',
+    'Тип оперативной памяти', 'Частота оперативной памяти', 'Максимальный объем оперативной памяти',
+    'Количество слотов памяти', 'Гарантия', 'Страна производства', 'Ширина', 'Высота', 'Глубина',
+    'Мощность блока питания', 'Тип подключения', 'Интерфейс', 'Формат печати', 'Скорость печати',
+    'Разрешение печати', 'Технология печати', 'Объем лотка', 'Двусторонняя печать',
+    'Яркость', 'Контрастность', 'Время отклика', 'Угол обзора', 'Покрытие экрана', 'Сенсорный экран',
+    'Наличие оптического привода', 'Кард-ридер', 'Разъем для наушников', 'Сетевой адаптер Ethernet',
+]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдаёт КБ, macOS - байты
+        return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+
+
+def load_names(path):
+    if path is None:
+        return SAMPLE_NAMES
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def make_model(backend):
+    from embeddings_model import EmbedChunks
+    return EmbedChunks(MODEL_NAME, backend=backend)
+
+
+def run_backend(backend, names, batch_size, repeat):
+    """
+    Замер одного бэкенда в текущем процессе.
+    """
+    start = time.perf_counter()
+    model = make_model(backend)
+    load_time = time.perf_counter() - start
+
+    # прогрев
+    model.embedding_model.embed_documents(names[:batch_size])
+
+    latencies = []
+    total = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for i in range(0, len(names), batch_size):
+            batch = names[i:i + batch_size]
+            t = time.perf_counter()
+            model.embedding_model.embed_documents(batch)
+            latencies.append(time.perf_counter() - t)
+            total += len(batch)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'backend': backend,
+        'batch_size': batch_size,
+        'names': total,
+        'load_s': round(load_time, 3),
+        'names_per_s': round(total / elapsed, 1),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 2),
+        'latency_p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 2),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def compare_backends(names):
+    """
+    Сравнение векторов torch и onnx на одних и тех же строках.
+    """
+    torch_vectors = make_model('torch').embed(names)
+    onnx_vectors = make_model('onnx').embed(names)
+
+    cosine = np.sum(torch_vectors * onnx_vectors, axis=1)
+
+    # совпадение ближайших соседей внутри набора - то, что реально важно для сопоставления
+    torch_nn = np.argsort(-(torch_vectors @ torch_vectors.T), axis=1)[:, 1]
+    onnx_nn = np.argsort(-(onnx_vectors @ onnx_vectors.T), axis=1)[:, 1]
+
+    return {
+        'max_abs_diff': round(float(np.max(np.abs(torch_vectors - onnx_vectors))), 5),
+        'min_cosine': round(float(np.min(cosine)), 5),
+        'mean_cosine': round(float(np.mean(cosine)), 5),
+        'nearest_neighbour_agreement': round(float(np.mean(torch_nn == onnx_nn)), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк бэкендов модели векторизации')
+    parser.add_argument('--backend', choices=['torch', 'onnx'],
+                        help='Замерить один бэкенд в текущем процессе. Без аргумента замеряются оба, '
+                             'каждый в отдельном процессе, чтобы RSS не смешивался')
+    parser.add_argument('--names', help='Файл с названиями характеристик, по одному в строке')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help='Допустимое отклонение косинусной близости векторов onnx от torch')
+    parser.add_argument('--json', action='store_true', help='Вывести результат одной строкой JSON')
+    args = parser.parse_args()
+
+    names = load_names(args.names)
+
+    if args.backend is not None:
+        result = run_backend(args.backend, names, args.batch_size, args.repeat)
+        print(json.dumps(result, ensure_ascii=False) if args.json else result)
+        return
+
+    results = []
+    for backend in ['torch', 'onnx']:
+        cmd = [sys.executable, os.path.abspath(__file__), '--backend', backend, '--json',
+               '--batch-size', str(args.batch_size), '--repeat', str(args.repeat)]
+        if args.names:
+            cmd += ['--names', args.names]
+        output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    comparison = compare_backends(names)
+    comparison['within_tolerance'] = comparison['min_cosine'] >= 1 - args.tolerance
+
+    if args.json:
+        print(json.dumps({'backends': results, 'comparison': comparison}, ensure_ascii=False))
+    else:
+        for result in results:
+            print(result)
+        print(comparison)
+
+    if not comparison['within_tolerance']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Бенчмарк качества и скорости сопоставления характеристик на размеченных парах
+«название на госзакупках -> название на ситилинке».
+
+Набор - CSV (колонки ktru, citilink, необязательно group и candidates) или JSONL с теми же полями.
+group - товар, к которому относится пара: кандидаты для строки КТРУ берутся из названий
+ситилинка того же товара, как в Tools.match_params. Без group кандидаты - все названия ситилинка.
+Кандидаты - все характеристики товара на ситилинке, а не только правильные ответы: иначе задача
+легче настоящей. Их дают колонкой candidates (в CSV через ';', в JSONL списком) или строками
+без ktru - характеристиками, у которых нет пары в КТРУ.
+
+Для каждого бэкенда и способа поиска считаются top-1 / top-k точность, названий в секунду
+и пиковая память; скорость векторизации замеряется на нескольких размерах пакета.
+Для assignment дополнительно считаются доля строк, получивших пару, и точность среди них -
+по ним подбирается tools.ASSIGNMENT_MIN_SIMILARITY (--min-similarity с несколькими порогами).
+
+Примеры:
+    python bench_matching.py                              # встроенный небольшой набор
+    python bench_matching.py --pairs pairs.csv --top-k 3 --json
+    python bench_matching.py --pairs pairs.csv --method assignment --min-similarity 0.75,0.8,0.85,0.9
+"""
+import argparse
+import csv
+import functools
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from bench_embeddings import MODEL_NAME, peak_rss_mb
+
+METHODS = ['matrix', 'assignment', 'nearest']
+
+# Небольшой набор для проверки работоспособности; для выводов нужен набор из истории поисков
+SAMPLE_PAIRS = [
+    ('notebook', 'Объем оперативной памяти', 'Оперативная память'),
+    ('notebook', 'Тип процессора', 'Модель процессора'),
+    ('notebook', 'Количество ядер процессора', 'Количество ядер'),
+    ('notebook', 'Диагональ экрана', 'Диагональ экрана'),
+    ('notebook', 'Разрешение экрана', 'Разрешение экрана'),
+    ('notebook', 'Общий объем твердотельных накопителей (SSD)', 'Объем SSD'),
+    ('notebook', 'Тип видеоадаптера', 'Видеокарта'),
+    ('notebook', 'Время автономной работы', 'Время работы от аккумулятора'),
+    ('notebook', 'Вес', 'Вес'),
+    ('notebook', 'Наличие веб-камеры', 'Веб-камера'),
+    ('printer', 'Технология печати', 'Технология печати'),
+    ('printer', 'Максимальный формат печати', 'Формат'),
+    ('printer', 'Скорость черно-белой печати в формате А4', 'Скорость печати'),
+    ('printer', 'Наличие автоматической двусторонней печати', 'Двусторонняя печать'),
+    ('printer', 'Тип подключения', 'Интерфейсы'),
+    ('monitor', 'Диагональ', 'Диагональ экрана'),
+    ('monitor', 'Тип матрицы', 'Технология изготовления матрицы'),
+    ('monitor', 'Максимальная частота обновления экрана', 'Частота обновления'),
+    ('monitor', 'Время отклика', 'Время отклика пикселя'),
+    ('monitor', 'Яркость', 'Яркость'),
+]
+
+# Остальные характеристики тех же товаров на ситилинке: без них кандидатами были бы только правильные ответы
+SAMPLE_CANDIDATES = {
+    'notebook': ['Тип оперативной памяти', 'Частота процессора', 'Объем видеопамяти', 'Тип экрана',
+                 'Частота обновления экрана', 'Емкость аккумулятора', 'Операционная система', 'Цвет',
+                 'Материал корпуса', 'Подсветка клавиатуры', 'Толщина', 'Гарантия'],
+    'printer': ['Цветность печати', 'Разрешение печати', 'Емкость лотка подачи', 'Ресурс картриджа',
+                'Время выхода первой страницы', 'Потребляемая мощность', 'Габариты', 'Вес'],
+    'monitor': ['Разрешение экрана', 'Соотношение сторон', 'Контрастность', 'Углы обзора', 'Покрытие экрана',
+                'Интерфейсы', 'Изогнутый экран', 'Регулировка по высоте', 'Вес'],
+}
+
+
+def load_pairs(path):
+    """
+    :return: (list[(group, ktru, citilink)], {group: list[str]} - остальные характеристики товаров на ситилинке)
+    """
+    if path is None:
+        return list(SAMPLE_PAIRS), {group: list(names) for group, names in SAMPLE_CANDIDATES.items()}
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    pairs = []
+    candidates = defaultdict(list)
+    for row in rows:
+        group = row.get('group') or ''
+        names = row.get('candidates') or []
+        if isinstance(names, str):
+            names = names.split(';')
+        candidates[group].extend(name.strip() for name in names if name.strip())
+
+        if row.get('ktru') and row.get('citilink'):
+            pairs.append((group, row['ktru'].strip(), row['citilink'].strip()))
+        elif row.get('citilink'):
+            candidates[group].append(row['citilink'].strip())
+    return pairs, dict(candidates)
+
+
+def make_groups(pairs, candidates):
+    """
+    Группировка пар по товарам: {group: (строки КТРУ, правильные ответы, кандидаты ситилинка)}.
+    Кандидаты - характеристики товара из candidates вместе с правильными ответами.
+    """
+    groups = defaultdict(lambda: ([], [], []))
+    for group, ktru, citilink in pairs:
+        lines, answers, keys = groups[group]
+        lines.append(ktru)
+        answers.append(citilink)
+        if citilink not in keys:
+            keys.append(citilink)
+
+    for group, (lines, answers, keys) in groups.items():
+        extra = [name for name in dict.fromkeys(candidates.get(group, [])) if name not in keys]
+        if not extra:
+            print('Группа %r: кандидаты - только правильные ответы, точность будет завышена' % group,
+                  file=sys.stderr)
+        keys.extend(extra)
+    return dict(groups)
+
+
+def match_matrix(model, lines, keys, top_k):
+    _, top = model.match_many(lines, keys, top_k=top_k)
+    return [[key for key, _ in row] for row in top]
+
+
+def match_nearest(model, lines, keys, top_k):
+    # прежний способ: отдельный поиск ближайшего для каждой строки
+    key_vectors = dict(zip(keys, model.embed(keys)))
+    result = []
+    for line in lines:
+        nearest = model.get_nearest(line, key_vectors, top_k=max(top_k, 2))
+        result.append([key for key, _ in nearest][:top_k])
+    return result
+
+
+def match_assignment(model, lines, keys, top_k, min_similarity=None):
+    # один к одному: у каждой строки не больше одного кандидата, top-k совпадает с top-1
+    from tools import ASSIGNMENT_MIN_SIMILARITY
+
+    if min_similarity is None:
+        min_similarity = ASSIGNMENT_MIN_SIMILARITY
+    _, pairs = model.assign(lines, keys, min_similarity)
+    return [[pair[0]] if pair is not None else [] for pair in pairs]
+
+
+MATCHERS = {'matrix': match_matrix, 'assignment': match_assignment, 'nearest': match_nearest}
+
+
+def evaluate(model, groups, method, top_k, min_similarity=None):
+    matcher = MATCHERS[method]
+    if min_similarity is not None:
+        matcher = functools.partial(matcher, min_similarity=min_similarity)
+    top1 = topk = assigned = total = 0
+
+    start = time.perf_counter()
+    for lines, answers, keys in groups.values():
+        for answer, found in zip(answers, matcher(model, lines, keys, top_k)):
+            top1 += bool(found) and found[0] == answer
+            topk += answer in found
+            assigned += bool(found)
+            total += 1
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'method': method,
+        'pairs': total,
+        'top1': round(top1 / total, 4) if total else None,
+        'top%d' % top_k: round(topk / total, 4) if total else None,
+        'names_per_s': round(total / elapsed, 1),
+    }
+    if method == 'assignment':
+        # порог отбрасывает пары: чем он выше, тем меньше строк с парой и тем точнее оставшиеся
+        from tools import ASSIGNMENT_MIN_SIMILARITY
+
+        result['min_similarity'] = ASSIGNMENT_MIN_SIMILARITY if min_similarity is None else min_similarity
+        result['assigned'] = round(assigned / total, 4) if total else None
+        result['precision'] = round(top1 / assigned, 4) if assigned else None
+    return result
+
+
+def batch_scaling(model, names, batch_sizes, repeat):
+    result = []
+    for batch_size in batch_sizes:
+        total = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for i in range(0, len(names), batch_size):
+                total += len(model.embed(names[i:i + batch_size]))
+        result.append({'batch_size': batch_size, 'names_per_s': round(total / (time.perf_counter() - start), 1)})
+    return result
+
+
+def run_backend(backend, pairs, candidates, methods, top_k, batch_sizes, repeat, thresholds=None):
+    """
+    Замер одного бэкенда в текущем процессе. Кэш векторов отключён, чтобы замерялась сама модель.
+    """
+    from embeddings_model import EmbedChunks
+
+    start = time.perf_counter()
+    model = EmbedChunks(MODEL_NAME, backend=backend)
+    load_time = time.perf_counter() - start
+
+    groups = make_groups(pairs, candidates)
+    names = sorted({name for lines, _, keys in groups.values() for name in lines + keys})
+
+    # прогрев
+    model.embed(names[:max(batch_sizes)])
+
+    return {
+        'backend': backend,
+        'load_s': round(load_time, 3),
+        'groups': len(groups),
+        'methods': [evaluate(model, groups, method, top_k, threshold)
+                    for method in methods
+                    for threshold in (thresholds or [None] if method == 'assignment' else [None])],
+        'batch_scaling': batch_scaling(model, names, batch_sizes, repeat),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк качества и скорости сопоставления характеристик')
+    parser.add_argument('--pairs', help='CSV / JSONL с размеченными парами (ktru, citilink, group, candidates)')
+    parser.add_argument('--backend', choices=['torch', 'onnx'],
+                        help='Замерить один бэкенд в текущем процессе. Без аргумента замеряются оба, '
+                             'каждый в отдельном процессе, чтобы RSS не смешивался')
+    parser.add_argument('--method', choices=METHODS, action='append',
+                        help='Способ поиска (можно несколько); по умолчанию все')
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--min-similarity',
+                        help='Пороги близости для assignment через запятую; по умолчанию tools.ASSIGNMENT_MIN_SIMILARITY')
+    parser.add_argument('--batch-sizes', default='1,8,32,100', help='Размеры пакета через запятую')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='Вывести результат одной строкой JSON')
+    args = parser.parse_args()
+
+    methods = args.method or METHODS
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    thresholds = [float(value) for value in args.min_similarity.split(',')] if args.min_similarity else None
+
+    if args.backend is not None:
+        pairs, candidates = load_pairs(args.pairs)
+        result = run_backend(args.backend, pairs, candidates, methods, args.top_k, batch_sizes, args.repeat,
+                             thresholds)
+        print(json.dumps(result, ensure_ascii=False) if args.json else result)
+        return
+
+    results = []
+    for backend in ['torch', 'onnx']:
+        cmd = [sys.executable, os.path.abspath(__file__), '--backend', backend, '--json',
+               '--top-k', str(args.top_k), '--batch-sizes', args.batch_sizes, '--repeat', str(args.repeat)]
+        for method in methods:
+            cmd += ['--method', method]
+        if args.pairs:
+            cmd += ['--pairs', args.pairs]
+        if args.min_similarity:
+            cmd += ['--min-similarity', args.min_similarity]
+        output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps({'backends': results}, ensure_ascii=False))
+    else:
+        for result in results:
+            print(result)
+
+
+if __name__ == '__main__':
+    main()
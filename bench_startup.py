@@ -0,0 +1,92 @@
+"""
+Замер времени запуска приложения: импорты модуля gossy_start, время до готовности окна
+и до готовности браузера и модели. Завершается с кодом 1, если окно готово позже бюджета
+или если при импорте gossy_start подтягиваются тяжёлые модули - их место в фоновых потоках.
+
+Пример:
+    python bench_startup.py --repeat 3 --budget 1.0
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Модули, которые не должны загружаться до появления окна
+HEAVY_MODULES = ['torch', 'transformers', 'langchain_huggingface', 'onnxruntime', 'selenium', 'scipy', 'tools']
+
+IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_times(module):
+    """
+    Разбор вывода python -X importtime.
+    :return: (cumulative_s, {модуль: собственное время, с}); cumulative_s - None, если импорт не удался
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                             cwd=ROOT, capture_output=True, text=True)
+    if process.returncode != 0:
+        return None, {}
+    output = process.stderr
+
+    own = {}
+    cumulative = None
+    for line in output.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match is None:
+            continue
+        own[match[4]] = int(match[1]) / 1e6
+        if match[4] == module:
+            cumulative = int(match[2]) / 1e6
+    return cumulative, own
+
+
+def measure_run(extra_args):
+    output = subprocess.run([sys.executable, os.path.join(ROOT, 'gossy_start.py'), '--measure-startup'] + extra_args,
+                            cwd=ROOT, capture_output=True, text=True).stdout
+    for line in reversed(output.strip().splitlines()):
+        if line.startswith('{'):
+            return json.loads(line)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер времени запуска приложения')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=1.0, help='Допустимое время до готовности окна, с')
+    parser.add_argument('--imports-only', action='store_true', help='Только импорты, без запуска окна')
+    parser.add_argument('--embedding-backend', choices=['torch', 'onnx'], default='torch')
+    args = parser.parse_args()
+
+    cumulative, own = import_times('gossy_start')
+    heavy = [module for module in HEAVY_MODULES if module in own]
+    result = {
+        'import_s': cumulative,
+        'slowest_imports': {module: round(seconds, 4) for module, seconds in
+                            sorted(own.items(), key=lambda item: -item[1])[:10]},
+        'heavy_imports': heavy,
+    }
+
+    ok = cumulative is not None and not heavy
+    if not args.imports_only:
+        runs = [run for run in (measure_run(['--embedding-backend', args.embedding_backend])
+                                for _ in range(args.repeat)) if run is not None]
+        for key in ['imports', 'interactive', 'browser', 'model']:
+            values = [run[key] for run in runs if key in run]
+            result[key + '_p50_s'] = round(float(np.percentile(values, 50)), 3) if values else None
+        result['errors'] = [run['error'] for run in runs if 'error' in run]
+        ok = ok and result['interactive_p50_s'] is not None and result['interactive_p50_s'] <= args.budget
+
+    result['within_budget'] = ok
+    print(json.dumps(result, ensure_ascii=False))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Запись фикстур для bench_e2e.py: товары проходят все этапы в настоящем браузере, а ответы сайтов
+(страницы, скрипты, стили и ответы API - XHR / fetch) сохраняются в каталог фикстур с routes.json,
+по которому fixture_server отдаёт их на те же адреса.
+
+Готовые фикстуры в репозиторий не входят: копии страниц ситилинка и госзакупок принадлежат этим сайтам
+и устаревают вместе с их разметкой и API, поэтому каталог записывается этим скриптом перед замерами
+и пересобирается, когда сайты меняются.
+
+Пример:
+    python capture_fixtures.py items.csv fixtures
+    python bench_e2e.py fixtures --latency 80 --repeat 5
+"""
+import argparse
+import base64
+import csv
+import hashlib
+import json
+import os
+import queue
+import threading
+from urllib.parse import unquote, urlsplit
+
+from fixture_server import ROUTES_FILE, load_routes
+from gossy_batch import process_item, read_items
+from logging_config import logger
+from pipeline import Scheduler
+from tools import Tools, BASE_URLS
+
+# Ответы, без которых страница не отрисуется и не получит данные
+RECORDED_TYPES = ('Document', 'Script', 'Stylesheet', 'XHR', 'Fetch')
+
+EXTENSIONS = {
+    'text/html': '.html',
+    'application/json': '.json',
+    'text/javascript': '.js',
+    'application/javascript': '.js',
+    'text/css': '.css',
+}
+
+# Буфер тел ответов в браузере: тела забираются не сразу, а перед переходом на следующую страницу
+BUFFER_SIZES = {'maxTotalBufferSize': 200 * 1024 * 1024, 'maxResourceBufferSize': 20 * 1024 * 1024}
+
+
+class ResponseRecorder:
+    """
+    Сохранение ответов сайтов по событиям DevTools из NetworkLog Tools.
+    """
+    def __init__(self, driver, network_log, base_urls, output_dir):
+        """
+        :param base_urls: dict - {сайт: адрес}, ответы с других хостов не записываются
+        :param output_dir: str - каталог фикстур, у каждого сайта свой подкаталог
+        """
+        self.driver = driver
+        self.network_log = network_log
+        self.output_dir = output_dir
+        self.hosts = {urlsplit(url).netloc: site for site, url in base_urls.items()}
+        self.routes = {site: load_routes(os.path.join(output_dir, site)) for site in base_urls}
+        self.saved = 0
+        self._pending = {}
+        self._finished = []
+        driver.execute_cdp_cmd('Network.enable', BUFFER_SIZES)
+        network_log.listen(self.on_event)
+
+    def on_event(self, method, params):
+        if method == 'Network.responseReceived':
+            response = params.get('response', {})
+            parts = urlsplit(response.get('url', ''))
+            site = self.hosts.get(parts.netloc)
+            if site is None or response.get('status') != 200 or params.get('type') not in RECORDED_TYPES:
+                return
+            self._pending[params['requestId']] = (site, parts, response.get('mimeType', ''))
+        elif method == 'Network.loadingFinished' and params['requestId'] in self._pending:
+            self._finished.append(params['requestId'])
+
+    def flush(self):
+        """
+        Запись тел ответов, загруженных к этому моменту.
+        """
+        self.network_log.drain()
+        while self._finished:
+            request_id = self._finished.pop(0)
+            site, parts, mime_type = self._pending.pop(request_id)
+            try:
+                body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+            except Exception as e:
+                logger.warning('Не удалось прочитать ответ %s: %s' % (parts.geturl(), e))
+                continue
+            data = base64.b64decode(body['body']) if body.get('base64Encoded') else body['body'].encode('utf-8')
+            self.save(site, parts, mime_type, data)
+
+    def save(self, site, parts, mime_type, data):
+        route = unquote(parts.path + ('?' + parts.query if parts.query else ''))
+        extension = EXTENSIONS.get(mime_type.split(';')[0].strip(), os.path.splitext(parts.path)[1] or '.bin')
+        # адреса с параметрами не ложатся на файлы, поэтому все ответы отдаются через routes.json
+        name = 'recorded/%s%s' % (hashlib.sha1(route.encode('utf-8')).hexdigest()[:16], extension)
+
+        path = os.path.join(self.output_dir, site, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.routes[site][route] = name
+        self.saved += 1
+
+    def write_routes(self):
+        for site, routes in self.routes.items():
+            if not routes:
+                continue
+            with open(os.path.join(self.output_dir, site, ROUTES_FILE), 'w', encoding='utf-8') as f:
+                json.dump(routes, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def write_items(items, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, ['query', 'url'])
+        writer.writeheader()
+        for item in items:
+            writer.writerow({'query': item['query'], 'url': item['url']})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запись локальных копий сайтов для bench_e2e.py')
+    parser.add_argument('items', help='CSV или JSONL с товарами, как для gossy_batch.py')
+    parser.add_argument('output', help='Каталог фикстур (citilink/, goszakupki/, items.csv)')
+    parser.add_argument('--view-browser', action='store_true', help='Показывать окно браузера')
+    args = parser.parse_args()
+
+    items = read_items(args.items)
+    # страницы и ответы API должны пройти через браузер, поэтому кэши, блокировка ресурсов
+    # и получение ситилинка по HTTP отключены
+    tools = Tools(queue.Queue(), threading.Event(), browser_window=args.view_browser, page_cache=False,
+                  ktru_mirror=False, resource_policy=False, citilink_fetch='browser')
+    recorder = ResponseRecorder(tools.driver, tools.network_log, BASE_URLS, args.output)
+
+    # ответы страницы забираются перед переходом на следующую
+    open_page = tools.open
+
+    def recorded_open(url):
+        recorder.flush()
+        open_page(url)
+
+    tools.open = recorded_open
+
+    scheduler = Scheduler()
+    try:
+        for item in items:
+            record = process_item(tools, item, scheduler=scheduler)
+            recorder.flush()
+            logger.info('%s: %s, записано ответов: %d' % (item['query'] or item['url'], record['status'], recorder.saved))
+    finally:
+        recorder.write_routes()
+        tools.close()
+        scheduler.close()
+
+    write_items(items, os.path.join(args.output, 'items.csv'))
+    print('Записано ответов: %d в %s' % (recorder.saved, args.output))
+
+
+if __name__ == '__main__':
+    main()
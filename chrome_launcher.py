@@ -0,0 +1,179 @@
+"""
+Постоянный Chrome, к которому подключаются запуски приложения и пакетного режима.
+
+Браузер запускается один раз с --remote-debugging-port и постоянным профилем и продолжает работать
+после выхода приложения: следующие запуски подключаются к нему (Tools(debugger_address=...))
+с уже прогретыми DNS, TLS-сессиями и HTTP-кэшем citilink.ru и moy-zakupki.ru.
+
+Пример:
+    python chrome_launcher.py --port 9222          # запустить (или проверить, что уже запущен)
+    python gossy_start.py --attach 127.0.0.1:9222
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+from logging_config import logger
+
+DEFAULT_PORT = 9222
+
+# Размер HTTP-кэша на диске, байт
+DISK_CACHE_SIZE = 512 * 1024 * 1024
+
+CHROME_NAMES = ['google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome']
+CHROME_PATHS = [
+    r'C:\Program Files\Google\Chrome\Application\chrome.exe',
+    r'C:\Program Files (x86)\Google\Chrome\Application\chrome.exe',
+    '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+]
+
+# Файлы, которые Chrome держит в каталоге профиля, пока он открыт
+PROFILE_LOCKS = ['SingletonLock', 'lockfile']
+
+
+def find_chrome():
+    """
+    Путь к исполняемому файлу Chrome: переменная CHROME_BINARY, PATH или стандартные места установки.
+    """
+    if os.environ.get('CHROME_BINARY'):
+        return os.environ['CHROME_BINARY']
+    for name in CHROME_NAMES:
+        if (path := shutil.which(name)) is not None:
+            return path
+    for path in CHROME_PATHS:
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError('Chrome не найден, укажите путь в переменной CHROME_BINARY')
+
+
+# Каталоги профилей, выданные браузерам этого процесса: Chrome создаёт свой SingletonLock не сразу,
+# и до этого профиль занят только здесь
+_reserved = set()
+_reserved_lock = threading.Lock()
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def lock_stale(path):
+    """
+    Блокировка профиля осталась от Chrome, который уже не работает (например, после падения).
+    SingletonLock - ссылка на "хост-pid", lockfile под Windows удаляется, только если его никто не держит открытым.
+    """
+    if os.path.islink(path):
+        host, _, pid = os.readlink(path).rpartition('-')
+        return host == socket.gethostname() and pid.isdigit() and not pid_alive(int(pid))
+    if sys.platform == 'win32':
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        return True
+    return False
+
+
+def profile_in_use(profile_dir):
+    for lock in PROFILE_LOCKS:
+        path = os.path.join(profile_dir, lock)
+        if os.path.lexists(path) and not lock_stale(path):
+            return True
+    return False
+
+
+def reserve_profile_dir(profile_dir):
+    """
+    Каталог профиля, который не занят ни другим Chrome, ни браузером этого процесса, который ещё запускается:
+    сам profile_dir или profile_dir-1, -2, ... Один профиль не может быть открыт двумя браузерами,
+    а пул и второй браузер запускаются с одинаковыми настройками. Каталог занят до release_profile_dir.
+    """
+    with _reserved_lock:
+        candidate, n = profile_dir, 0
+        while candidate in _reserved or profile_in_use(candidate):
+            n += 1
+            candidate = '%s-%d' % (profile_dir, n)
+        _reserved.add(candidate)
+    return candidate
+
+
+def release_profile_dir(profile_dir):
+    with _reserved_lock:
+        _reserved.discard(profile_dir)
+
+
+def is_running(address, timeout=1.0):
+    """
+    Отвечает ли Chrome на адресе отладки, например '127.0.0.1:9222'.
+    """
+    try:
+        with urllib.request.urlopen('http://%s/json/version' % address, timeout=timeout) as response:
+            return 'Browser' in json.load(response)
+    except Exception as e:
+        return False
+
+
+def launch(profile_dir, port=DEFAULT_PORT, headless=False, timeout=20):
+    """
+    Запуск Chrome с адресом отладки и постоянным профилем, если он ещё не запущен.
+    Процесс не привязан к вызывающему и переживает его.
+    :return: str - адрес отладки для Tools(debugger_address=...)
+    """
+    address = '127.0.0.1:%d' % port
+    if is_running(address):
+        return address
+
+    os.makedirs(profile_dir, exist_ok=True)
+    args = [
+        find_chrome(),
+        '--remote-debugging-port=%d' % port,
+        '--user-data-dir=%s' % os.path.abspath(profile_dir),
+        '--disk-cache-size=%d' % DISK_CACHE_SIZE,
+        '--no-first-run',
+        '--no-default-browser-check',
+    ]
+    if headless:
+        args += ['--headless=new', '--window-size=1920,1080']
+
+    logger.info('Запускаю постоянный Chrome на %s с профилем %s' % (address, profile_dir))
+    kwargs = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+    if sys.platform == 'win32':
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    subprocess.Popen(args, **kwargs)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if is_running(address):
+            return address
+        time.sleep(0.2)
+    raise TimeoutError('Chrome не ответил на %s за %d с' % (address, timeout))
+
+
+def main():
+    from tools import CACHE_DIR
+
+    parser = argparse.ArgumentParser(description='Запуск постоянного Chrome для подключения приложения')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--profile', default=os.path.join(CACHE_DIR, 'chrome-profile'), help='Каталог профиля')
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args()
+
+    print(launch(args.profile, args.port, args.headless))
+
+
+if __name__ == '__main__':
+    main()
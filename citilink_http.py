@@ -0,0 +1,221 @@
+"""
+Получение страниц ситилинка без браузера: страницы поиска и товара рисуются на сервере,
+поэтому ссылку, название, цену и характеристики можно взять из HTML одним HTTP-запросом.
+
+Соединения переиспользуются (keep-alive) между запросами к одному сайту, HTML разбирается lxml
+по тем же XPath, что и в браузере. Если сайт ответил страницей защиты от ботов или разметка
+не распознана, поднимается CitilinkFetchError, и Tools переходит на браузер.
+Нужен lxml (pip install lxml).
+"""
+import gzip
+import http.client
+import re
+import threading
+import zlib
+from urllib.parse import quote, urljoin, urlsplit
+
+from page_scripts import CITILINK_ALL_CHARS_XPATH, CITILINK_PARAMS_XPATH, CITILINK_SEARCH_LINK_XPATH
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Признаки страницы проверки вместо настоящей: статусы и заголовок страницы
+ANTIBOT_STATUSES = (401, 403, 429, 503)
+ANTIBOT_TITLE_RE = re.compile(r'captcha|qrator|ddos-guard|just a moment|проверка браузера|доступ ограничен', re.IGNORECASE)
+
+CHARSET_RE = re.compile(r'charset=([\w-]+)', re.IGNORECASE)
+
+
+class CitilinkFetchError(Exception):
+    """
+    Страница получена не та, что ожидалась: защита от ботов, ошибка или незнакомая разметка.
+    """
+
+
+class HttpPool:
+    """
+    Пул keep-alive соединений http.client по сайтам.
+    Соединение одновременно обслуживает один запрос, поэтому пул можно разделить между потоками.
+    """
+    def __init__(self, headers=None, timeout=10, max_redirects=5):
+        self.headers = dict(headers or {})
+        self.headers.setdefault('Accept-Encoding', 'gzip, deflate')
+        self.headers.setdefault('Connection', 'keep-alive')
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, scheme, netloc):
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(netloc, timeout=self.timeout)
+
+    def _acquire(self, site):
+        with self._lock:
+            idle = self._idle.get(site)
+            if idle:
+                return idle.pop(), True
+        return self._connect(*site), False
+
+    def _release(self, site, connection):
+        with self._lock:
+            self._idle.setdefault(site, []).append(connection)
+
+    def _request(self, site, path):
+        connection, reused = self._acquire(site)
+        try:
+            connection.request('GET', path, headers=self.headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError) as e:
+            connection.close()
+            if not reused:
+                raise
+            # сервер мог закрыть соединение за время простоя - повторяем на новом
+            connection = self._connect(*site)
+            try:
+                connection.request('GET', path, headers=self.headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(site, connection)
+        return response, body
+
+    def get(self, url):
+        """
+        GET с переходом по перенаправлениям.
+        :return: (status, итоговый url, текст ответа)
+        """
+        for _ in range(self.max_redirects + 1):
+            parts = urlsplit(url)
+            path = quote(parts.path or '/', safe="/%:@!$&'()*+,;=-._~")
+            if parts.query:
+                path += '?' + quote(parts.query, safe="/%:@!$&'()*+,;=-._~?")
+
+            response, body = self._request((parts.scheme, parts.netloc), path)
+
+            location = response.getheader('Location')
+            if response.status in REDIRECT_STATUSES and location:
+                url = urljoin(url, location)
+                continue
+            return response.status, url, self._decode(response, body)
+
+        raise CitilinkFetchError('Слишком много перенаправлений: %s' % url)
+
+    @staticmethod
+    def _decode(response, body):
+        encoding = (response.getheader('Content-Encoding') or '').lower()
+        charset = CHARSET_RE.search(response.getheader('Content-Type') or '')
+        try:
+            if encoding == 'gzip':
+                body = gzip.decompress(body)
+            elif encoding == 'deflate':
+                body = zlib.decompress(body)
+            return body.decode(charset[1] if charset else 'utf-8', errors='replace')
+        except (OSError, EOFError, zlib.error, LookupError) as e:
+            # битое сжатие или незнакомая кодировка - как незнакомая страница, Tools перейдёт на браузер
+            raise CitilinkFetchError('Не удалось декодировать ответ: %s: %s' % (type(e).__name__, e))
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle = {}
+
+
+def first_text(context, xpath):
+    """
+    Первый непустой текст среди найденных элементов, как firstText в CITILINK_EXTRACT_JS.
+    """
+    for element in context.xpath(xpath):
+        text = element.text_content().strip()
+        if text:
+            return text
+    return ''
+
+
+class CitilinkHttp:
+    """
+    Поиск товара и сбор его характеристик на ситилинке по HTTP.
+    """
+    def __init__(self, base_url, user_agent, timeout=10):
+        import lxml.html
+
+        self._parse = lxml.html.fromstring
+        self.base_url = base_url
+        self.pool = HttpPool({
+            'User-Agent': user_agent,
+            'Accept': 'text/html,application/xhtml+xml',
+            'Accept-Language': 'ru-RU,ru;q=0.9',
+        }, timeout=timeout)
+
+    def page(self, url):
+        """
+        :return: (итоговый url, разобранная страница)
+        """
+        status, url, text = self.pool.get(url)
+        if status in ANTIBOT_STATUSES:
+            raise CitilinkFetchError('Страница проверки вместо %s (статус %d)' % (url, status))
+        if status != 200:
+            raise CitilinkFetchError('Статус %d для %s' % (status, url))
+
+        try:
+            document = self._parse(text)
+        except Exception as e:
+            raise CitilinkFetchError('Не удалось разобрать %s: %s' % (url, e))
+        if ANTIBOT_TITLE_RE.search(document.findtext('.//title') or ''):
+            raise CitilinkFetchError('Страница проверки вместо %s' % url)
+        return url, document
+
+    def search(self, product_name):
+        """
+        :return: str - ссылка на первый товар в выдаче поиска
+        """
+        url, document = self.page('%s/search/?text=%s' % (self.base_url, quote(product_name)))
+        links = document.xpath(CITILINK_SEARCH_LINK_XPATH)
+        if not links:
+            raise CitilinkFetchError('В выдаче поиска %s не найден товар' % url)
+        return urljoin(url, links[0].get('href'))
+
+    def product(self, product_url):
+        """
+        Название, цена и характеристики товара. Полный список характеристик, который в браузере
+        раскрывается кнопкой «Все характеристики», берётся со страницы properties/, если на странице товара
+        есть эта кнопка (там только часть характеристик) или характеристик нет совсем.
+        :return: (name, price, parameters)
+        """
+        url, document = self.page(product_url)
+        name = first_text(document, '//h1')
+        price = first_text(document, '//div[@data-meta-name="PriceBlock__price"]')
+        if not name:
+            raise CitilinkFetchError('Не распознана страница товара %s' % url)
+
+        parameters = self.parameters(document)
+        if not parameters or document.xpath(CITILINK_ALL_CHARS_XPATH):
+            _, properties = self.page(urljoin(url.split('?')[0].rstrip('/') + '/', 'properties/'))
+            # неполный список с превью не возвращается: он попал бы в кэш страниц
+            parameters = self.parameters(properties)
+        if not parameters:
+            raise CitilinkFetchError('Не найдены характеристики товара %s' % url)
+
+        return name, price, parameters
+
+    @staticmethod
+    def parameters(document):
+        parameters = {}
+        for ul in document.xpath(CITILINK_PARAMS_XPATH):
+            for li in ul.xpath('.//li'):
+                param_name = first_text(li, './/div/div')
+                param_value = first_text(li, './div/span')
+                if param_name and param_value:
+                    parameters[param_name] = param_value
+        return parameters
+
+    def close(self):
+        self.pool.close()
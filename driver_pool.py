@@ -0,0 +1,143 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from logging_config import logger
+from pipeline import stage_context
+from tools import Tools, create_embedder
+
+# Сколько ждать при возврате в пул, пока этап, остановленный по времени, отпустит браузер, с
+STAGE_RETURN_TIMEOUT = 30
+
+
+class ToolsPool:
+    """
+    Ограниченный пул экземпляров Tools, у каждого свой браузер и своя очередь результатов.
+    Модель векторизации общая для всех. Браузеры запускаются по мере надобности, перед выдачей
+    проверяются и при необходимости перезапускаются.
+    """
+    def __init__(self, size, cancel_flag, embedder=None, embedding_backend='torch', **tools_kwargs):
+        """
+        :param size: int - максимальное число браузеров
+        :param cancel_flag: threading.Event - общий флаг остановки
+        :param embedder: EmbedChunks | None - общая модель; None - создаётся одна на пул
+        :param tools_kwargs: остальные параметры Tools (browser_window, extraction_mode, ...)
+        """
+        self.size = size
+        self.cancel_flag = cancel_flag
+        self.embedder = embedder if embedder is not None else create_embedder(embedding_backend)
+        self.tools_kwargs = tools_kwargs
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._all = []
+        self._closed = False
+
+    def _create(self):
+        tools = Tools(queue.Queue(), self.cancel_flag, embedder=self.embedder, **self.tools_kwargs)
+        with self._lock:
+            self._all.append(tools)
+        logger.debug('Запущен браузер %d из %d' % (len(self._all), self.size))
+        return tools
+
+    def _discard(self, tools):
+        with self._lock:
+            if tools in self._all:
+                self._all.remove(tools)
+            self._created -= 1
+        tools.close()
+
+    @staticmethod
+    def is_healthy(tools):
+        """
+        Проверка, что браузер жив и отвечает.
+        """
+        try:
+            return tools.driver.execute_script('return 1') == 1
+        except Exception as e:
+            return False
+
+    def acquire(self, timeout=None):
+        """
+        Получение свободного Tools. Если свободных нет и предел не достигнут - запускается новый браузер.
+        :param timeout: float | None - сколько ждать освобождения, с
+        :return: Tools
+        """
+        if self._closed:
+            raise RuntimeError('Пул браузеров закрыт')
+
+        while True:
+            try:
+                tools = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        return self._create()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                tools = self._idle.get(timeout=timeout)
+
+            if self.is_healthy(tools):
+                # результаты прошлого товара не должны попасть в следующий
+                while not tools.results_queue.empty():
+                    tools.results_queue.get_nowait()
+                return tools
+
+            logger.warning('Браузер не отвечает, перезапускаю')
+            self._discard(tools)
+
+    def release(self, tools):
+        # браузер, которым ещё пользуется остановленный по времени этап, не выдаётся следующему товару
+        if not stage_context(tools).wait_idle(STAGE_RETURN_TIMEOUT):
+            logger.warning('Этап не вернул браузер за %d с, перезапускаю браузер' % STAGE_RETURN_TIMEOUT)
+            self._discard(tools)
+        elif self._closed:
+            self._discard(tools)
+        else:
+            self._idle.put(tools)
+
+    @contextmanager
+    def worker(self, timeout=None):
+        tools = self.acquire(timeout)
+        try:
+            yield tools
+        finally:
+            self.release(tools)
+
+    def map(self, fn, items):
+        """
+        Обработка элементов параллельно: каждый элемент целиком обрабатывается одним браузером.
+        :param fn: callable(tools, item) - обработка одного элемента
+        :param items: iterable - элементы
+        :return: итератор результатов в порядке элементов
+        """
+        def run(item):
+            with self.worker() as tools:
+                return fn(tools, item)
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = [executor.submit(run, item) for item in items]
+            for future in futures:
+                yield future.result()
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            all_tools = list(self._all)
+            self._all = []
+        for tools in all_tools:
+            tools.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
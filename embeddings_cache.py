@@ -0,0 +1,295 @@
+import hashlib
+import os
+import struct
+import threading
+import unicodedata
+
+import numpy as np
+
+from logging_config import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+MAGIC = b'GEMB'
+VERSION = 1
+# magic, версия, размерность векторов, поколение (меняется при вытеснении)
+HEADER = struct.Struct('<4sIII')
+# хеш ключа + номер строки в файле векторов
+RECORD = struct.Struct('<16sI')
+
+
+def normalize_text(text):
+    """
+    Нормализация текста перед построением ключа кэша:
+    unicode NFC, схлопывание пробелов, обрезка по краям.
+    """
+    text = unicodedata.normalize('NFC', text)
+    return ' '.join(text.split())
+
+
+def make_key(model_name, text):
+    return hashlib.blake2b(
+        (model_name + '\0' + normalize_text(text)).encode('utf-8'),
+        digest_size=16
+    ).digest()
+
+
+class _FileLock:
+    """
+    Межпроцессная блокировка на отдельном файле.
+    Разделяемая блокировка (shared) допускает других читателей, но не писателя;
+    под Windows msvcrt умеет только исключительную.
+    """
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+
+class EmbeddingCache:
+    """
+    Персистентный кэш векторов на диске.
+
+    vectors.f32 - append-only массив float32 (len, dim), читается через np.memmap.
+    index.bin   - заголовок + append-only записи (хеш ключа, номер строки).
+    Несколько процессов могут работать с одним каталогом: запись идёт под исключительной файловой
+    блокировкой, чтение - под разделяемой и подхватывает новые записи по размеру index.bin.
+    При превышении max_items кэш уплотняется, оставляя недавно использованные векторы: оба файла
+    заменяются целиком, поэтому memmap открыт только на время чтения и не держит старый файл
+    (под Windows открытый memmap не даёт заменить файл).
+    """
+    def __init__(self, cache_dir, model_name, max_items=200_000):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.max_items = max_items
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_path = os.path.join(cache_dir, 'index.bin')
+        self.vectors_path = os.path.join(cache_dir, 'vectors.f32')
+        self.lock = _FileLock(os.path.join(cache_dir, 'lock'))
+        self.read_lock = _FileLock(os.path.join(cache_dir, 'lock'), shared=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._thread_lock = threading.Lock()
+        self._index = {}
+        self._last_used = {}
+        self._tick = 0
+        self._dim = 0
+        self._generation = None
+        self._index_size = 0
+
+    def _read_header(self, f):
+        data = f.read(HEADER.size)
+        if len(data) < HEADER.size:
+            return None
+        magic, version, dim, generation = HEADER.unpack(data)
+        if magic != MAGIC or version != VERSION:
+            return None
+        return dim, generation
+
+    def _refresh(self):
+        """
+        Подтягивает записи, добавленные в index.bin (в том числе другими процессами).
+        """
+        try:
+            f = open(self.index_path, 'rb')
+        except OSError:
+            return
+
+        with f:
+            header = self._read_header(f)
+            if header is None:
+                return
+            dim, generation = header
+            size = os.fstat(f.fileno()).st_size
+
+            if generation == self._generation and size == self._index_size:
+                return
+
+            # после уплотнения номера строк поменялись - перечитываем всё
+            if generation != self._generation or size < self._index_size:
+                self._index = {}
+                self._last_used = {}
+                self._index_size = HEADER.size
+                self._generation = generation
+                self._dim = dim
+
+            f.seek(self._index_size)
+            data = f.read(size - self._index_size)
+
+        n_records = len(data) // RECORD.size
+        for key, row in RECORD.iter_unpack(data[:n_records * RECORD.size]):
+            self._index[key] = row
+        self._index_size += n_records * RECORD.size
+
+    def _read_rows(self, rows):
+        """
+        Копии векторов по номерам строк; строки за концом файла пропускаются.
+        :return: dict {номер строки: вектор}
+        """
+        n_rows = os.path.getsize(self.vectors_path) // (4 * self._dim)
+        rows = sorted(row for row in set(rows) if row < n_rows)
+        if not rows:
+            return {}
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(n_rows, self._dim))
+        data = np.array(vectors[rows])
+        # отображение закрывается, как только на него не остаётся ссылок: возвращаются только копии,
+        # иначе файл нельзя было бы заменить при уплотнении
+        del vectors
+        return dict(zip(rows, data))
+
+    def get_many(self, texts):
+        """
+        Поиск векторов в кэше.
+        :param texts: list[str] - строки
+        :return: dict {номер строки в texts: вектор} - только найденные
+        """
+        found = {}
+        # индекс и векторы читаются под одной блокировкой: уплотнение не заменит файлы между ними
+        with self._thread_lock, self.read_lock:
+            self._refresh()
+            if not self._index:
+                self.misses += len(texts)
+                return found
+
+            rows = {}
+            for i, text in enumerate(texts):
+                row = self._index.get(make_key(self.model_name, text))
+                if row is not None:
+                    rows[i] = row
+
+            if rows:
+                # запись в индексе могла обогнать данные, если писатель упал - такие строки не читаются
+                vectors = self._read_rows(rows.values())
+                for i, row in rows.items():
+                    if row in vectors:
+                        found[i] = vectors[row]
+                        self._tick += 1
+                        self._last_used[row] = self._tick
+
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, texts, vectors):
+        """
+        Добавление векторов в кэш.
+        :param texts: list[str] - строки
+        :param vectors: array-like (len(texts), dim) - векторы
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+
+        with self._thread_lock, self.lock:
+            self._refresh()
+
+            if self._generation is None:
+                self._dim = vectors.shape[1]
+                self._write_new(self._dim, 0, np.zeros((0, self._dim), dtype=np.float32), [])
+            elif vectors.shape[1] != self._dim:
+                logger.warning('Размерность векторов (%d) не совпадает с кэшем (%d), кэш не пополняется'
+                               % (vectors.shape[1], self._dim))
+                return
+
+            n_rows = os.path.getsize(self.vectors_path) // (4 * self._dim)
+            records = []
+            new_vectors = []
+            for text, vector in zip(texts, vectors):
+                key = make_key(self.model_name, text)
+                if key in self._index:
+                    continue
+                records.append(RECORD.pack(key, n_rows + len(new_vectors)))
+                new_vectors.append(vector)
+                self._index[key] = n_rows + len(new_vectors) - 1
+
+            if not records:
+                return
+
+            # сначала данные, потом индекс: читатель не увидит ключ без вектора
+            with open(self.vectors_path, 'ab') as f:
+                f.write(np.asarray(new_vectors, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, 'ab') as f:
+                f.write(b''.join(records))
+            self._index_size += len(records) * RECORD.size
+
+            if len(self._index) > self.max_items:
+                self._evict()
+
+    def _evict(self):
+        """
+        Уплотнение кэша: остаётся 3/4 от max_items наиболее недавно использованных векторов.
+        Строки без обращений в текущем процессе упорядочиваются по времени добавления.
+        """
+        keep = int(self.max_items * 0.75)
+
+        order = sorted(
+            self._index.items(),
+            key=lambda item: (self._last_used.get(item[1], 0), item[1]),
+            reverse=True
+        )[:keep]
+        order.sort(key=lambda item: item[1])
+
+        vectors = self._read_rows(row for _, row in order)
+        keys = [key for key, row in order if row in vectors]
+        kept = np.asarray([vectors[row] for _, row in order if row in vectors], dtype=np.float32)
+        kept = kept.reshape(-1, self._dim)
+
+        self.evictions += len(self._index) - len(keys)
+        logger.debug('Кэш векторов уплотнён: %d -> %d' % (len(self._index), len(keys)))
+
+        self._write_new(self._dim, self._generation + 1, kept, keys)
+
+    def _write_new(self, dim, generation, vectors, keys):
+        tmp_vectors = self.vectors_path + '.tmp'
+        tmp_index = self.index_path + '.tmp'
+
+        with open(tmp_vectors, 'wb') as f:
+            f.write(vectors.tobytes())
+        with open(tmp_index, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, dim, generation))
+            f.write(b''.join(RECORD.pack(key, row) for row, key in enumerate(keys)))
+
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_index, self.index_path)
+
+        self._index = {key: row for row, key in enumerate(keys)}
+        self._last_used = {}
+        self._generation = generation
+        self._index_size = HEADER.size + len(keys) * RECORD.size
+
+    def stats(self):
+        return {
+            'items': len(self._index),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -1,30 +1,187 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from scipy.spatial.distance import cosine
+import os
+
+import numpy as np
+
+from embeddings_cache import EmbeddingCache
+import tracing
+
+BACKENDS = ('torch', 'onnx')
+
+# Каталог экспортированных ONNX-моделей, по подкаталогу на модель
+ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'onnx')
+
+
+def default_onnx_dir(model_name):
+    return os.path.join(ONNX_DIR, model_name.replace('/', '__'))
 
 
 class EmbedChunks:
-    def __init__(self, model_name):
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=model_name,
-            model_kwargs={"device": "cpu"},
-            encode_kwargs={"device": "cpu", "batch_size": 100})
+    def __init__(self, model_name, cache_dir=None, cache_max_items=200_000, backend='torch', onnx_dir=None):
+        """
+        :param model_name: str - имя модели HuggingFace
+        :param cache_dir: str | None - каталог персистентного кэша векторов; None - без кэша
+        :param cache_max_items: int - максимальное число векторов в кэше
+        :param backend: str - 'torch' (HuggingFaceEmbeddings) или 'onnx' (квантизованная модель в ONNX Runtime)
+        :param onnx_dir: str | None - каталог ONNX-модели; None - default_onnx_dir(model_name).
+                         Если модели нет, она будет экспортирована
+        """
+        if backend not in BACKENDS:
+            raise ValueError('Неизвестный бэкенд %s, доступны: %s' % (backend, ', '.join(BACKENDS)))
+
+        self.model_name = model_name
+        self.backend = backend
+
+        if backend == 'onnx':
+            from onnx_embeddings import OnnxEmbeddings, export_onnx_model
+
+            onnx_dir = onnx_dir or default_onnx_dir(model_name)
+            if not os.path.exists(os.path.join(onnx_dir, 'model_int8.onnx')):
+                export_onnx_model(model_name, onnx_dir)
+            self.embedding_model = OnnxEmbeddings(onnx_dir, batch_size=100)
+        else:
+            from langchain_huggingface import HuggingFaceEmbeddings
+
+            self.embedding_model = HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={"device": "cpu"},
+                encode_kwargs={"device": "cpu", "batch_size": 100})
+
+        # векторы разных бэкендов немного отличаются, поэтому в кэше они не смешиваются
+        cache_model_name = model_name if backend == 'torch' else model_name + ':onnx-int8'
+        self.cache = EmbeddingCache(cache_dir, cache_model_name, cache_max_items) if cache_dir else None
 
     def __call__(self, text):
-        embeddings = self.embedding_model.embed_documents(text)
-        return {"text": text, "embeddings": embeddings}
+        if self.cache is None:
+            with tracing.span('embed:model', batch=len(text), backend=self.backend):
+                embeddings = self.embedding_model.embed_documents(text)
+            return {"text": text, "embeddings": embeddings}
 
-    def get_nearest(self, line: str, vectors_dict: dict, top_k=1):
+        # модель вызывается только для строк, которых нет в кэше
+        with tracing.span('embed:cache_lookup', batch=len(text)):
+            embeddings = self.cache.get_many(text)
+        missed = [i for i in range(len(text)) if i not in embeddings]
+
+        if missed:
+            with tracing.span('embed:model', batch=len(missed), backend=self.backend):
+                computed = self.embedding_model.embed_documents([text[i] for i in missed])
+            self.cache.put_many([text[i] for i in missed], computed)
+            for i, vector in zip(missed, computed):
+                embeddings[i] = vector
+
+        return {"text": text, "embeddings": [embeddings[i] for i in range(len(text))]}
 
-        line_vector = self([line])["embeddings"][0]
+    def embed(self, lines):
+        """
+        Векторизация списка строк за один вызов модели.
+        :param lines: list[str] - строки
+        :return: np.ndarray - матрица (len(lines), dim) с нормированными строками
+        """
+        if len(lines) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        vectors = np.asarray(self(list(lines))["embeddings"], dtype=np.float32)
+        return self.normalize(vectors)
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def similarity_matrix(self, lines, keys):
+        """
+        Матрица косинусной близости всех строк со всеми ключами.
+        Модель вызывается дважды: для строк и для ключей.
+        :param lines: list[str] - строки (например, названия характеристик госзакупок)
+        :param keys: list[str] | np.ndarray - ключи (например, названия характеристик ситилинка)
+                     или уже посчитанная методом embed матрица ключей
+        :return: np.ndarray - матрица (len(lines), len(keys))
+        """
+        key_vectors = keys if isinstance(keys, np.ndarray) else self.embed(keys)
+
+        if len(lines) == 0 or len(key_vectors) == 0:
+            return np.zeros((len(lines), len(key_vectors)), dtype=np.float32)
+
+        line_vectors = self.embed(lines)
+        with tracing.span('similarity', lines=len(lines), keys=len(key_vectors)):
+            return line_vectors @ key_vectors.T
+
+    def match_many(self, lines, keys, top_k=1):
+        """
+        Поиск ближайших ключей для каждой строки.
+        :param lines: list[str] - строки
+        :param keys: list[str] - ключи
+        :param top_k: int - число ближайших ключей для каждой строки
+        :return: (similarity, top) - полная матрица близости и список вида
+                 [[(key, similarity), ...], ...] длины len(lines)
+        """
+        keys = list(keys)
+        similarity = self.similarity_matrix(lines, keys)
+
+        top_k = min(top_k, len(keys))
+        if top_k == 0:
+            return similarity, [[] for _ in lines]
+
+        # argpartition дешевле полной сортировки, сортируем только top_k
+        top_idx = np.argpartition(-similarity, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(similarity, top_idx, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top_idx = np.take_along_axis(top_idx, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        top = [
+            [(keys[j], float(score)) for j, score in zip(row_idx, row_scores)]
+            for row_idx, row_scores in zip(top_idx, top_scores)
+        ]
+        return similarity, top
+
+    def assign(self, lines, keys, min_similarity=None):
+        """
+        Глобальное сопоставление один к одному по матрице близости (linear_sum_assignment):
+        каждой строке достаётся не больше одного ключа, каждый ключ - не больше чем одной строке,
+        суммарная близость пар максимальна.
+        :param lines: list[str] - строки
+        :param keys: list[str] - ключи
+        :param min_similarity: float | None - пары с близостью ниже порога отбрасываются
+        :return: (similarity, pairs) - полная матрица близости и список длины len(lines)
+                 из (key, similarity) или None для строк без пары
+        """
+        from scipy.optimize import linear_sum_assignment
+
+        keys = list(keys)
+        similarity = self.similarity_matrix(lines, keys)
+        pairs = [None] * len(lines)
+        if similarity.size == 0:
+            return similarity, pairs
+
+        with tracing.span('assignment', lines=len(lines), keys=len(keys)):
+            weights = similarity
+            if min_similarity is not None:
+                # пары ниже порога не должны вытеснять допустимые
+                weights = np.where(similarity >= min_similarity, similarity, -len(lines) - 1)
+            rows, cols = linear_sum_assignment(weights, maximize=True)
+
+        for i, j in zip(rows, cols):
+            if min_similarity is None or similarity[i, j] >= min_similarity:
+                pairs[i] = (keys[j], float(similarity[i, j]))
+        return similarity, pairs
+
+    def get_nearest(self, line: str, vectors_dict: dict, top_k=1):
+        """
+        Поиск ближайшей строки из словаря {строка: вектор}.
+        Возвращает строку и косинусное расстояние до неё.
+        """
+        line_vector = self.embed([line])[0]
 
-        vectors = list(vectors_dict.values())
         lines = list(vectors_dict.keys())
+        vectors = self.normalize(list(vectors_dict.values()))
 
-        cosine_similarity = [cosine(line_vector, vector) for vector in vectors]
+        cosine_distance = 1 - vectors @ line_vector
 
-        sort_lines = sorted(zip(lines, cosine_similarity), key=lambda x: x[1])[:5]
+        sort_lines = sorted(zip(lines, cosine_distance.tolist()), key=lambda x: x[1])[:5]
 
         if top_k == 1:
             return sort_lines[0][0], sort_lines[0][1]
         else:
-            return sort_lines[:top_k][0], sort_lines[:top_k][1]
+            return sort_lines[:top_k]
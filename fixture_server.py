@@ -0,0 +1,132 @@
+"""
+Локальный HTTP-сервер для сохранённых страниц ситилинка и госзакупок.
+Используется бенчмарками, чтобы замеры не зависели от сети и изменений на сайтах.
+
+Каталог сайта может содержать routes.json - соответствие запросов файлам для адресов,
+которые не ложатся на файловую структуру (поиск с параметрами, ответы API):
+    {"/search/?text=ноутбук": "search/noutbuk.html"}
+Такой каталог вместе со страницами и ответами API записывает capture_fixtures.py.
+"""
+import functools
+import json
+import os
+import random
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+ROUTES_FILE = 'routes.json'
+
+# Файлы, в которых адреса настоящих сайтов заменяются на локальные, и их тип содержимого
+REWRITTEN_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.json': 'application/json; charset=utf-8',
+}
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureHandler(QuietHandler):
+    """
+    Раздача сохранённых страниц с искусственной задержкой ответа
+    и заменой адресов настоящих сайтов на адреса локальных серверов.
+    """
+    # keep-alive, как у настоящих сайтов: и браузер, и HTTP-клиент переиспользуют соединения
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, *args, latency=0.0, jitter=0.0, routes=None, rewrite=None, **kwargs):
+        self.latency = latency
+        self.jitter = jitter
+        self.routes = routes or {}
+        self.rewrite = rewrite or {}
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        route = self.routes.get(unquote(self.path))
+        if route is not None:
+            self.path = '/' + route
+
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        content_type = REWRITTEN_TYPES.get(os.path.splitext(path)[1])
+        if not self.rewrite or content_type is None or not os.path.isfile(path):
+            return super().do_GET()
+
+        with open(path, encoding='utf-8') as f:
+            body = f.read()
+        for origin, replacement in self.rewrite.items():
+            body = body.replace(origin, replacement)
+        data = body.encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def load_routes(directory):
+    path = os.path.join(directory, ROUTES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def serve_directory(directory, port=0, latency=0.0, jitter=0.0, rewrite=None):
+    """
+    Запуск сервера в фоновом потоке.
+    :param directory: str - каталог с сохранёнными страницами
+    :param port: int - порт; 0 - любой свободный
+    :param latency: float - задержка каждого ответа, с
+    :param jitter: float - случайный разброс задержки (±), с
+    :param rewrite: dict | None - {адрес настоящего сайта: адрес локального сервера} для ссылок в страницах
+    :return: (server, base_url) - сервер (остановка через server.shutdown()) и его адрес
+    """
+    handler = functools.partial(FixtureHandler, directory=directory, latency=latency, jitter=jitter,
+                                routes=load_routes(directory), rewrite=rewrite)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server, 'http://127.0.0.1:%d' % server.server_address[1]
+
+
+def serve_sites(fixtures_dir, base_urls, latency=0.0, jitter=0.0):
+    """
+    Отдельный сервер для каждого сайта из fixtures_dir/<сайт> (citilink, goszakupki),
+    чтобы относительные ссылки внутри сохранённых страниц работали как на настоящем сайте.
+    Абсолютные ссылки на один сайт со страниц другого переписываются на локальные адреса.
+    :param base_urls: dict - {сайт: настоящий адрес}, см. tools.BASE_URLS
+    :return: (servers, local_base_urls)
+    """
+    sites = [site for site in base_urls if os.path.isdir(os.path.join(fixtures_dir, site))]
+
+    # порты нужны заранее, чтобы каждый сервер мог переписывать ссылки на все остальные
+    servers = {}
+    for site in sites:
+        servers[site] = ThreadingHTTPServer(('127.0.0.1', 0), QuietHandler)
+    local = {site: 'http://127.0.0.1:%d' % server.server_address[1] for site, server in servers.items()}
+    rewrite = {base_urls[site]: local[site] for site in sites}
+
+    for site, server in servers.items():
+        directory = os.path.join(fixtures_dir, site)
+        server.RequestHandlerClass = functools.partial(
+            FixtureHandler, directory=directory, latency=latency, jitter=jitter,
+            routes=load_routes(directory), rewrite=rewrite
+        )
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    return list(servers.values()), local
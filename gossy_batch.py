@@ -0,0 +1,233 @@
+"""
+Пакетная обработка списка товаров без графического интерфейса.
+
+Вход - CSV (колонки query и/или url, необязательно id) или JSONL с теми же полями.
+Выход - JSONL: по строке на товар со статусом, результатами этапов и временем каждого этапа.
+Уже обработанные товары из выходного файла пропускаются, поэтому прерванный запуск можно продолжить.
+
+Пример:
+    python gossy_batch.py items.csv results.jsonl --workers 2
+"""
+import argparse
+import csv
+import json
+import os
+import signal
+import threading
+import time
+
+from logging_config import logger
+from driver_pool import ToolsPool
+from speculation import SpeculativeLookup
+from pipeline import Scheduler, StageError, stage_context
+from chrome_launcher import DEFAULT_PORT
+import tracing
+
+# Статусы, после которых товар не обрабатывается повторно
+DONE_STATUSES = ('ok', 'needs_choice')
+
+# Выходы этапов, которые сохраняются в записи товара
+RECORD_VALUES = ['citilink_url', 'name', 'price', 'characteristics', 'goszakupki_query',
+                 'goszakupki_url', 'goszakupki_name']
+
+
+def read_items(path):
+    """
+    Чтение списка товаров.
+    :param path: str - путь к CSV или JSONL
+    :return: list[dict] - [{'id': str, 'query': str, 'url': str}, ...]
+    """
+    items = []
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            reader = csv.DictReader(f)
+            if {'query', 'url'} & set(reader.fieldnames or []):
+                rows = list(reader)
+            else:
+                # файл без заголовка: ссылка или название в первой колонке
+                f.seek(0)
+                rows = [{'value': row[0]} for row in csv.reader(f) if row]
+
+    for row in rows:
+        query = (row.get('query') or '').strip()
+        url = (row.get('url') or '').strip()
+        if 'value' in row:
+            value = row['value'].strip()
+            url, query = (value, '') if value.startswith('http') else ('', value)
+        if not query and not url:
+            continue
+        # без явного id товар опознаётся по ссылке или запросу - так продолжение не зависит от порядка строк
+        items.append({'id': str(row.get('id') or url or query), 'query': query, 'url': url})
+
+    return items
+
+
+def read_done(path):
+    """
+    Идентификаторы товаров, уже обработанных в предыдущих запусках.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # последняя строка могла оборваться при аварийном завершении
+                continue
+            if record.get('status') in DONE_STATUSES:
+                done.add(record['id'])
+    return done
+
+
+def process_item(tools, item, speculation=None, scheduler=None):
+    """
+    Полный пайплайн для одного товара на общем планировщике этапов (pipeline.PRODUCT_STAGES):
+    citilink_search -> citilink_parsing -> goszakupki_search -> goszakupki_parsing
+    :param speculation: SpeculativeLookup | None - заблаговременный поиск на госзакупках во втором браузере
+    :param scheduler: Scheduler | None - общий планировщик; None - свой на время обработки товара
+    """
+    timings = {}
+    record = {'id': item['id'], 'query': item['query'], 'status': 'ok', 'timings': timings}
+    start = time.perf_counter()
+    started = {}
+
+    def on_event(status, stage, results):
+        if status == 'started':
+            started[stage] = time.perf_counter()
+        elif stage in started:
+            timings[stage] = round(time.perf_counter() - started.pop(stage), 3)
+        if status == 'success':
+            # выходы этапов попадают в запись и тогда, когда пайплайн дальше не прошёл
+            record.update({name: results[name] for name in RECORD_VALUES if name in results})
+
+    own_scheduler = scheduler is None
+    if own_scheduler:
+        scheduler = Scheduler()
+
+    values = {'query': item['query']}
+    if item['url']:
+        # ссылка на товар уже есть - поиск на ситилинке не нужен
+        values['citilink_url'] = item['url']
+        record['citilink_url'] = item['url']
+
+    try:
+        if speculation is not None:
+            speculation.start(speculation.guess_query(item['query']))
+
+        try:
+            values = scheduler.run(stage_context(tools, speculation), values, ['rows'], on_event)
+        except StageError as e:
+            if e.status != 'fail':
+                raise
+            # неукрупнённую позицию нужно выбрать вручную
+            category, options = e.results
+            record.update({'status': 'needs_choice', 'category': category,
+                           'options': {key: ref for key, (ref, _) in options.items()}})
+            return record
+
+        record['rows'] = [
+            {'name': row['name'], 'value': row['default_value'], 'citilink_name': row['description'],
+             'score': row['score']}
+            for row in values['rows']
+        ]
+
+    except StageError as e:
+        record.update({'status': e.status, 'error': str(e)})
+    except Exception as e:
+        logger.exception('Ошибка при обработке %s' % item['id'])
+        record.update({'status': 'error', 'error': '%s: %s' % (type(e).__name__, e)})
+    finally:
+        timings['total'] = round(time.perf_counter() - start, 3)
+        if own_scheduler:
+            scheduler.close()
+
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетный подбор характеристик для списка товаров')
+    parser.add_argument('input', help='CSV или JSONL со списком товаров (поля query / url / id)')
+    parser.add_argument('output', help='JSONL с результатами; дописывается, обработанные товары пропускаются')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Число параллельных браузеров; каждый обрабатывает товар целиком')
+    parser.add_argument('-v', '--view-browser', action='store_true', help='Показывать окна браузера')
+    parser.add_argument('--embedding-backend', choices=['torch', 'onnx'], default='torch')
+    parser.add_argument('--speculative', action='store_true',
+                        help='Искать позицию на госзакупках во втором браузере параллельно со сбором характеристик')
+    parser.add_argument('--no-cache', action='store_true', help='Не брать результаты из локального кэша страниц и зеркала КТРУ')
+    parser.add_argument('--load-all-resources', action='store_true',
+                        help='Не блокировать картинки, шрифты и счётчики на страницах')
+    parser.add_argument('--matching', choices=['assignment', 'nearest'], default='assignment',
+                        help='Сопоставление характеристик: один к одному по общей матрице или ближайшая для каждой')
+    parser.add_argument('--chrome-profile', nargs='?', const=True, metavar='DIR',
+                        help='Постоянный профиль Chrome с HTTP-кэшем на диске (по умолчанию .cache/chrome-profile)')
+    parser.add_argument('--attach', nargs='?', const='127.0.0.1:%d' % DEFAULT_PORT, metavar='HOST:PORT',
+                        help='Работать во вкладках постоянного Chrome; локальный запускается, если ещё не запущен')
+    parser.add_argument('--citilink-fetch', choices=['browser', 'http'], default='browser',
+                        help='Страницы ситилинка через браузер или HTTP-запросом без браузера (при неудаче - браузер)')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='Записать трассу этапов (Chrome Trace Event JSON) в файл для chrome://tracing или Perfetto')
+    args = parser.parse_args()
+
+    if args.trace:
+        tracing.enable(args.trace)
+
+    items = read_items(args.input)
+    done = read_done(args.output)
+    todo = [item for item in items if item['id'] not in done]
+    logger.info('Товаров: %d, уже обработано: %d, осталось: %d' % (len(items), len(items) - len(todo), len(todo)))
+    if not todo:
+        return
+
+    cancel_flag = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: cancel_flag.set())
+
+    write_lock = threading.Lock()
+    # у каждого этапа столько потоков, сколько браузеров: товары идут по этапам параллельно
+    scheduler = Scheduler(workers=min(args.workers, len(todo)))
+    # у каждого браузера пула свой второй браузер для заблаговременного поиска
+    speculations = {}
+
+    # одни и те же параметры у браузеров пула и у вторых браузеров
+    tools_kwargs = dict(browser_window=args.view_browser, cache_bypass=args.no_cache,
+                        resource_policy=not args.load_all_resources, matching=args.matching,
+                        profile_dir=args.chrome_profile, debugger_address=args.attach,
+                        citilink_fetch=args.citilink_fetch)
+
+    with open(args.output, 'a', encoding='utf-8') as out, \
+            ToolsPool(min(args.workers, len(todo)), cancel_flag, embedding_backend=args.embedding_backend,
+                      **tools_kwargs) as pool:
+
+        def worker(tools, item):
+            if cancel_flag.is_set():
+                return
+            speculation = None
+            if args.speculative:
+                with write_lock:
+                    speculation = speculations.get(id(tools))
+                    if speculation is None:
+                        speculation = speculations[id(tools)] = SpeculativeLookup(
+                            cancel_flag, tools.get_embedding, **tools_kwargs
+                        )
+            with tracing.span('item', id=item['id']):
+                record = process_item(tools, item, speculation, scheduler)
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+            logger.info('%s: %s за %.1f с' % (item['id'], record['status'], record['timings']['total']))
+
+        try:
+            list(pool.map(worker, todo))
+        finally:
+            for speculation in speculations.values():
+                speculation.close()
+            scheduler.close()
+            tracing.save()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,96 @@
-import re
-from tools import Tools
+import time
+
+# Отсчёт времени до готовности окна - с самого начала загрузки модуля
+PROCESS_START = time.perf_counter()
+
+from resource_policy import ResourcePolicy
+from chrome_launcher import DEFAULT_PORT
+from virtual_list import VirtualList
+from pipeline import Scheduler, StageContext
 import threading
 import queue
+from concurrent.futures import ThreadPoolExecutor
+import json
 import customtkinter as ctk
 import pyperclip
 import tkinter as tk
 from logging_config import logger
 import argparse
+import tracing
+
+# Событие Tk, которым рабочие потоки сообщают о новом результате в очереди
+RESULT_EVENT = '<<ToolsResult>>'
+
+# Резервный опрос очереди на случай, если событие не удалось сгенерировать из рабочего потока, мс
+QUEUE_FALLBACK_MS = 1000
+
+# Период анимации строки статуса, мс
+SPINNER_INTERVAL_MS = 120
+
+# Высота строк в столбцах характеристик вместе с отступами, px
+CITILINK_ROW_HEIGHT = 110
+GOSZAKUPKI_ROW_HEIGHT = 130
+
+# Строка статуса на время этапа
+STAGE_STATUS = {
+    'citilink_search': "Шаг 1 из 4.\nИщу товар на сайте Ситилинк. . .",
+    'citilink_parsing': "Шаг 2 из 4.\nСобираю характеристики с сайта Ситилинк. . .",
+    'goszakupki_search': "Шаг 3 из 4.\nИщу товар на сайте гос. закупки. . .",
+    'goszakupki_parsing': "Шаг 4 из 4.\nРасставляю значения характеристик. . .",
+}
+
+
+class NotifyingQueue(queue.Queue):
+    """
+    Очередь результатов, которая после каждого put вызывает notify.
+    """
+    def __init__(self, notify=None):
+        super().__init__()
+        self.notify = notify
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        if self.notify is not None:
+            self.notify()
 
 
 class App:
     """
     Класс реализует UI интерфейс и логику работы приложения
     """
-    def __init__(self, root, view_browser=False):
-        # Очередь, в которую помещаются результаты работы методов из класса Tools
-        self.result_queue = queue.Queue()
+    def __init__(self, root, view_browser=False, embedding_backend='torch', speculative=False, cache_bypass=False,
+                 resource_policy=True, matching='assignment', measure_startup=False, profile_dir=None,
+                 debugger_address=None, citilink_fetch='browser'):
+        # Очередь, в которую помещаются результаты работы методов из класса Tools;
+        # каждый результат сразу будит главный цикл через RESULT_EVENT
+        self.result_queue = NotifyingQueue(self.notify_result)
 
         # Флаг, который активируется при нажатии на кнопку "Остановить"
         self.cancel_flag = threading.Event()
 
-        # Модуль с методами для парсинга и соотнесения параметров
-        self.tools = Tools(self.result_queue, self.cancel_flag, browser_window=view_browser)
+        # Браузер и модель запускаются в фоне, чтобы окно появилось сразу. Этапы ждут только то, что им нужно:
+        # поиск на ситилинке - браузер, сопоставление характеристик - ещё и модель
+        self.startup = ThreadPoolExecutor(max_workers=2, thread_name_prefix='startup')
+        self.components = {'browser': None, 'model': None}
+        # Время от старта процесса до готовности окна и компонентов, с; при measure_startup выводится в JSON
+        self.startup_times = {}
+        self.measure_startup = measure_startup
+        self.embedder_future = self.startup.submit(self.load_embedder, embedding_backend)
+
+        # Модуль с методами для парсинга и соотнесения параметров, см. свойство tools
+        self.tools_future = self.startup.submit(
+            self.load_tools, speculative, browser_window=view_browser, cache_bypass=cache_bypass,
+            resource_policy=resource_policy, matching=matching, profile_dir=profile_dir,
+            debugger_address=debugger_address, citilink_fetch=citilink_fetch
+        )
+
+        # Этапы поиска запускает общий с пакетным режимом планировщик; браузер в них занят одним этапом за раз
+        self.scheduler = Scheduler()
+        self.stage_context = StageContext(self.tools_future)
+
+        # Заблаговременный поиск на госзакупках во втором браузере, пока собираются характеристики ситилинка;
+        # создаётся вместе с основным браузером
+        self.speculation = None
 
         # Результаты работы методов из класса Tools хранятся здесь
         self.steps = {
@@ -109,6 +178,16 @@ class App:
         self.current_operation.pack(pady=2)
         self.current_text = ''
 
+        # Готовность браузера и модели, пока они запускаются в фоне
+        self.readiness_label = ctk.CTkLabel(
+            master=self.scrollable_frame,
+            text='',
+            font=("Roboto", 11),
+            text_color="gray"
+        )
+        self.readiness_label.pack(pady=0)
+        self.show_readiness()
+
         # Контейнер для результатов (изначально скрыт)
 
         self.frames: dict[str, ctk.CTkFrame | ctk.CTkLabel | ctk.CTkButton | None] = {
@@ -125,6 +204,9 @@ class App:
 
         # Автоматически проставленные характеристики
         self.selected_values = {}
+        # Значения, которые действительно выбраны на странице госзакупок: к ним возвращается отметка,
+        # если выбор из окна не удался
+        self.applied_values = {}
 
         self.gu_buttons_deactivate = False
         self.is_resizable = True
@@ -134,8 +216,13 @@ class App:
         self.current_state = 0
         self.wave = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
 
-        # Проверка очереди
+        # Окно готово к вводу, когда главный цикл впервые освободился
+        self.root.after_idle(self.on_interactive)
+
+        # Результаты разбираются по событию от рабочих потоков, анимация статуса - на своём таймере
+        self.root.bind(RESULT_EVENT, self.check_queue)
         self.check_queue()
+        self.animate_status()
 
     def clear_button_command(self, idx=0):
         """
@@ -204,70 +291,136 @@ class App:
             self.main_button.configure(text="...")
             self.current_text = "Остановка. . ."
             self.cancel_flag.set()
+            # ожидания в Tools замечают флаг за один опрос, а window.stop() обрывает текущую загрузку
+            if self.tools_future.done() and self.tools_future.exception() is None:
+                threading.Thread(target=self.tools.interrupt, daemon=True).start()
+            if self.speculation is not None:
+                self.speculation.discard()
             if not self.in_work:
                 self.main_button.configure(text="Поиск")
 
     def start_citilink_search(self, search_name):
         """
-        Запуск потока, ищущего URL товара по имени
+        Запуск поиска с первого шага: URL товара по имени и все следующие этапы
         search_name: str - имя на товар
         :return:
         """
         self.in_work = True
-        self.current_text = "Шаг 1 из 4.\nИщу товар на сайте Ситилинк. . ."
         self.clear_button_command()
 
         self.steps['citilink_query'] = search_name
 
-        computation_thread = threading.Thread(target=self.tools.get_citilink_url, args=(search_name,))
-        computation_thread.daemon = True  # Поток завершится при закрытии приложения
-        computation_thread.start()
+        if self.speculation is not None:
+            self.speculation.start(self.speculation.guess_query(search_name))
+
+        self.run_stages({'query': search_name})
 
     def start_citilink_parsing(self, product_url):
         """
-        Запуск потока, проводящего парсинг сайта ситилинк
+        Запуск поиска со сбора характеристик на сайте ситилинк
         product_url: str - URL на товар
         :return: None
         """
         self.in_work = True
-        self.current_text = "Шаг 2 из 4.\nСобираю характеристики с сайта Ситилинк. . ."
         self.clear_button_command()
 
         self.steps['citilink_url'] = product_url
 
-        computation_thread = threading.Thread(target=self.tools.citilink_parsing, args=(product_url,))
-        computation_thread.daemon = True  # Поток завершится при закрытии приложения
-        computation_thread.start()
+        self.run_stages({'citilink_url': product_url})
 
-    def start_goszakupki_search(self, search_name):
+    def start_goszakupki_parsing(self, goszakupki_ref):
         """
-        Запуск потока, ищущего неукрупнённую позиции госзакупки
-        :param search_name: str - Название товара
+        Запуск парсинга госзакупок + происходит связывание характеристик
+        с сайта ситилинк и характеристик ссайта госзакупки.
+        :param goszakupki_ref: ссылка на неукрупнённую позицию.
         :return: None
         """
         self.in_work = True
-        self.current_text = "Шаг 3 из 4.\nИщу товар на сайте гос. закупки. . ."
 
-        computation_thread = threading.Thread(target=self.tools.get_goszakupki_links,
-                                              args=(search_name, self.citilink_characters))
-        computation_thread.daemon = True  # Поток завершится при закрытии приложения
-        computation_thread.start()
+        self.steps['goszakupki_url'] = goszakupki_ref
 
-    def start_goszakupki_parsing(self, goszakupki_ref):
+        self.run_stages({'characteristics': self.citilink_characters, 'goszakupki_url': goszakupki_ref})
+
+    def run_stages(self, values):
         """
-        Запуск потока для парсинга госзакупок + происходит связывание характеристик
-        с сайта ситилинк и характеристик ссайта госзакупки.
-        :param goszakupki_ref: ссылка на неукрупнённую позицию.
+        Запуск этапов, которые нужны для расстановки значений характеристик из известных значений.
+        Начало, результат и остановка каждого этапа приходят в очередь результатов.
+        :param values: dict - известные значения, см. pipeline.PRODUCT_STAGES
         :return: None
         """
-        self.in_work = True
-        self.current_text = "Шаг 4 из 4.\nРасставляю значения характеристик. . ."
+        self.scheduler.submit(self.stage_context, values, ['rows'],
+                              lambda status, stage, results: self.result_queue.put((status, stage, results)))
+
+    @property
+    def tools(self):
+        """
+        Модуль с методами для парсинга и соотнесения параметров; ждёт окончания запуска браузера.
+        """
+        return self.tools_future.result()
 
-        computation_thread = threading.Thread(target=self.tools.match_params,
-                                              args=(self.citilink_characters, goszakupki_ref))
-        computation_thread.daemon = True  # Поток завершится при закрытии приложения
-        computation_thread.start()
+    def load_embedder(self, embedding_backend):
+        """
+        Загрузка модели векторизации в фоновом потоке (импорт torch / onnxruntime - самая долгая часть).
+        """
+        with tracing.span('startup:model'):
+            try:
+                from tools import create_embedder
+                embedder = create_embedder(embedding_backend)
+            except Exception as e:
+                self.result_queue.put(('error', 'model', str(e)))
+                raise
+        self.result_queue.put(('ready', 'model', round(time.perf_counter() - PROCESS_START, 3)))
+        return embedder
+
+    def load_tools(self, speculative, **tools_kwargs):
+        """
+        Запуск браузера в фоновом потоке. Модель передаётся как Future и дожидается первым этапом, которому нужна.
+        """
+        with tracing.span('startup:browser'):
+            try:
+                from tools import Tools
+                # у Tools своя очередь: её читают этапы планировщика, а в очередь окна приходят их итоги
+                tools = Tools(queue.Queue(), self.cancel_flag, embedder=self.embedder_future, **tools_kwargs)
+            except Exception as e:
+                self.result_queue.put(('error', 'browser', str(e)))
+                raise
+
+            if speculative:
+                from speculation import SpeculativeLookup
+                self.speculation = SpeculativeLookup(self.cancel_flag, self.embedder_future, **tools_kwargs)
+                self.stage_context.speculation = self.speculation
+
+        self.result_queue.put(('ready', 'browser', round(time.perf_counter() - PROCESS_START, 3)))
+        return tools
+
+    def on_interactive(self):
+        self.startup_times['interactive'] = round(time.perf_counter() - PROCESS_START, 3)
+        logger.info('Окно готово через %.2f с после старта' % self.startup_times['interactive'])
+
+    def finish_startup_measure(self):
+        """
+        Вывод времени запуска одной строкой JSON и выход (см. --measure-startup).
+        """
+        print(json.dumps(self.startup_times), flush=True)
+        if self.tools_future.done() and self.tools_future.exception() is None:
+            self.tools.close()
+        self.root.destroy()
 
+    def show_readiness(self):
+        """
+        Строка готовности браузера и модели; скрывается, когда всё запущено.
+        :return: None
+        """
+        names = {'browser': 'Браузер', 'model': 'Модель'}
+        states = []
+        for component, state in self.components.items():
+            if state is None:
+                states.append('%s: запускается…' % names[component])
+            elif state is not True:
+                states.append('%s: ошибка - %s' % (names[component], state))
+        self.readiness_label.configure(text='   '.join(states))
+
+    @tracing.traced('render:citilink_result')
     def show_search_result(self, model_name, price, url):
         """
         Вывод результатов парсинга сайта ситилинк.
@@ -379,6 +532,7 @@ class App:
         input_frame.delete(0, "end")  # Очищаем текущее содержимое
         input_frame.insert(0, clipboard_text)  # Вставляем текст из буфера
 
+    @tracing.traced('render:goszakupki_result')
     def show_gu_search_result(self, page_name, link):
         """
         Выводим результат парсинга Госзакупок в едином стиле со Citilink
@@ -474,6 +628,7 @@ class App:
             self.start_goszakupki_parsing(correct_ref)
             self.gu_buttons_deactivate = True
 
+    @tracing.traced('render:gz_links')
     def show_gz_links(self, category):
         """
         Показываем неукрупнённые позиция товара, чтобы пользователь сам выбрал необходимую.
@@ -519,6 +674,7 @@ class App:
 
         self.frames['goszakupki_links'] = goszakupki_links
 
+    @tracing.traced('render:columns')
     def show_columns_container(self):
         """
         Вывод характеристик с сайта ситилинк и с сайта госзакупки.
@@ -538,41 +694,45 @@ class App:
 
         columns_container.pack(fill='x')
 
-        # Создаем первый фрейм (СИТИЛИК)
-        citilink_container = ctk.CTkScrollableFrame(
+        # Связи характеристик в обе стороны для ссылок "🔗"
+        self.citilink_items = list(self.citilink_characters.items())
+        self.links_from_citilink = {citilink_id: gz_id for citilink_id, gz_id in self.matches}
+        self.links_from_goszakupki = {gz_id: citilink_id for citilink_id, gz_id in self.matches}
+
+        # Столбцы виртуальные: виджеты создаются только для видимых строк и переиспользуются при прокрутке,
+        # поэтому карточки КТРУ с сотнями значений отрисовываются так же быстро, как короткие
+        citilink_container = VirtualList(
             master=columns_container,
+            count=len(self.citilink_items),
+            row_height=CITILINK_ROW_HEIGHT,
+            make_row=self.new_citilink_params,
+            bind_row=self.fill_citilink_params,
+            title="СИТИЛИК",
             corner_radius=0,
             height=600,
             fg_color="#2B2B2B"
         )
-
         citilink_container.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
-        label1 = ctk.CTkLabel(master=citilink_container, text="СИТИЛИК", font=("Arial", 16))
-        label1.pack(pady=10, padx=10, fill="x", expand=False)
 
-        # Создаем второй фрейм (ГОСЗАКУПКИ)
-        goszakupki_container = ctk.CTkScrollableFrame(
+        goszakupki_container = VirtualList(
+            master=columns_container,
+            count=len(self.goszakupki_characters),
+            row_height=GOSZAKUPKI_ROW_HEIGHT,
+            make_row=self.new_goszakupki_params,
+            bind_row=self.fill_goszakupki_params,
+            title="ГОСЗАКУПКИ",
             corner_radius=0,
             height=600,
-            master=columns_container,
             fg_color="#2B2B2B"
         )
         goszakupki_container.grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
-        label2 = ctk.CTkLabel(master=goszakupki_container, text="ГОСЗАКУПКИ", font=("Arial", 16))
-        label2.pack(pady=20)
 
         columns_container.grid_columnconfigure(0, weight=3)
         columns_container.grid_columnconfigure(1, weight=4)
 
         self.frames['columns_container'] = columns_container
-
-        # Отображаем все характеристики Ситилинка
-        for i, char in enumerate(self.citilink_characters.items()):
-            self.new_citilink_params(citilink_container, {'name': char[0], 'value': char[1]}, i, goszakupki_container)
-
-        # Отображаем все характеристики Госзакупок
-        for i, char in enumerate(self.goszakupki_characters):
-            self.new_goszakupki_params(goszakupki_container, char, i, citilink_container)
+        self.citilink_list = citilink_container
+        self.goszakupki_list = goszakupki_container
 
         self.current_text = "Поиск завершён!"
         self.main_button.configure(text="Поиск")
@@ -605,7 +765,17 @@ class App:
         Обработка нажатия на кнопку "Копировать"
         :return: None
         """
-        self.tools.copy_chars()
+        def done(future):
+            if future.cancelled():
+                return
+            if future.exception() is None:
+                self.result_queue.put(('success', 'copy_chars', ''))
+            else:
+                self.result_queue.put(('error', 'copy_chars', str(future.exception())))
+
+        self.scheduler.call(self.stage_context, 'copy_chars').add_done_callback(done)
+
+    def show_copied(self):
         self.frames['copy_text'].configure(text='Характеристики скопированы')
         self.frames['copy_text'].configure(text_color=("black", "white"))
         self.root.after(2000, self.fade_text, self.frames['copy_text'])
@@ -628,14 +798,19 @@ class App:
 
         step(0)
 
-    def new_citilink_params(self, main_frame, char, idx, neighbour_frame):
+    @staticmethod
+    def set_textbox(textbox, text):
+        textbox.configure(state="normal")
+        textbox.delete("0.0", "end")
+        textbox.insert("0.0", text)
+        textbox.configure(state="disabled")
+
+    @tracing.traced('render:citilink_row')
+    def new_citilink_params(self, main_frame):
         """
-        Добавляем строку в столбец с характеристиками ситилинка
-        :param main_frame: Фрейм, куда вставляется характеристика
-        :param char: str - Название характеристики
-        :param idx: int - Индекс характеристики
-        :param neighbour_frame: Фрейм с характеристиками с сайта госзакупки
-        :return: None
+        Пустая строка столбца с характеристиками ситилинка, заполняется в fill_citilink_params
+        :param main_frame: Родитель строки (canvas виртуального столбца)
+        :return: CTkFrame
         """
         # Создаем дочерний фрейм
         child_frame = ctk.CTkFrame(
@@ -643,57 +818,38 @@ class App:
             fg_color="#222222",
             corner_radius=10,
         )
-        child_frame.pack(pady=10, padx=10, fill="x", expand=False)  # expand=False предотвращает растяжение
 
         # Название характеристики
-        name_label = ctk.CTkTextbox(
+        child_frame.name_label = ctk.CTkTextbox(
             master=child_frame,
             font=("Arial", 14, "bold"),
             fg_color="transparent",
             wrap="none",
             height=20,  # Минимальная высота
         )
-        name_label.grid(row=0, column=0, padx=10, pady=5, sticky="w")
-        name_label.insert("0.0", char["name"])
-        name_label.configure(state="disabled")
+        child_frame.name_label.grid(row=0, column=0, padx=10, pady=5, sticky="w")
 
         # Значение характеристики
-        value_label = ctk.CTkTextbox(
+        child_frame.value_label = ctk.CTkTextbox(
             master=child_frame,
             font=("Arial", 14),
             fg_color="transparent",
             wrap="none",
             height=20,  # Минимальная высота
         )
-        value_label.grid(row=0, column=1, padx=10, pady=5, sticky="w")
-        value_label.insert("0.0", char["value"])
-        value_label.configure(state="disabled")
-
-        gz_category = None
-        command = None
-
-        for match in self.matches:
-            if match[0] == idx:
-                gz_category_id = match[1]
-                gz_category = self.goszakupki_characters[gz_category_id]['name']
-                fraction = max((gz_category_id - 1) / len(self.goszakupki_characters), 0)
-
-                def command(fraction_=fraction):
-                    self.scroll_to(neighbour_frame, fraction_)
+        child_frame.value_label.grid(row=0, column=1, padx=10, pady=5, sticky="w")
 
-        # Вторая строка: текстовое поле
-        textbox = ctk.CTkButton(
+        # Вторая строка: ссылка на связанную характеристику госзакупок
+        child_frame.link_button = ctk.CTkButton(
             master=child_frame,
-            text='🔗 ' + gz_category if gz_category is not None else ' '*10,
-            state='normal' if gz_category is not None else 'disabled',
+            text=' '*10,
             height=20,
             anchor="w",
-            command=command if command is not None else lambda: ...,
             fg_color=('white', '#151515'),
             hover=False,
             font=("Arial", 12)
         )
-        textbox.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        child_frame.link_button.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
 
         # Настраиваем вес столбцов для адаптивности по горизонтали
         child_frame.grid_columnconfigure(0, weight=1)
@@ -703,77 +859,74 @@ class App:
         child_frame.grid_rowconfigure(0, weight=0)
         child_frame.grid_rowconfigure(1, weight=0)
 
-    def new_goszakupki_params(self, main_frame, char, idx, neighbour_frame):
+        return child_frame
+
+    def fill_citilink_params(self, child_frame, idx):
         """
-        Добавляем строку в столбец с характеристиками госзакупок
-        :param main_frame: Фрейм, куда вставляется характеристика
-        :param char: str - Название характеристики
+        Заполнение строки столбца ситилинка характеристикой с индексом idx
+        :param child_frame: строка из new_citilink_params
         :param idx: int - Индекс характеристики
-        :param neighbour_frame: Фрейм с характеристиками с сайта ситилинк
         :return: None
         """
+        name, value = self.citilink_items[idx]
+        self.set_textbox(child_frame.name_label, name)
+        self.set_textbox(child_frame.value_label, value)
+
+        gz_category_id = self.links_from_citilink.get(idx)
+        if gz_category_id is None:
+            child_frame.link_button.configure(text=' '*10, state='disabled', command=lambda: ...)
+        else:
+            child_frame.link_button.configure(
+                text='🔗 ' + self.goszakupki_characters[gz_category_id]['name'],
+                state='normal',
+                command=lambda gz_id=gz_category_id: self.scroll_to(self.goszakupki_list, gz_id)
+            )
+
+    @tracing.traced('render:goszakupki_row')
+    def new_goszakupki_params(self, main_frame):
+        """
+        Пустая строка столбца с характеристиками госзакупок, заполняется в fill_goszakupki_params
+        :param main_frame: Родитель строки (canvas виртуального столбца)
+        :return: CTkFrame
+        """
         child_frame = ctk.CTkFrame(
             master=main_frame,
             fg_color="#222222",
             height=60,
         )
-        child_frame.pack(pady=10, padx=10, fill="x")
 
-        name_label = ctk.CTkTextbox(
+        child_frame.name_label = ctk.CTkTextbox(
             master=child_frame,
             font=("Arial", 14),
             fg_color="transparent",
             wrap="none",
             height=40
         )
-        name_label.grid(row=0, column=0, padx=10, pady=5, sticky="nsew")
-        name_label.insert("0.0", char["name"])
-        name_label.configure(state="disabled")
+        child_frame.name_label.grid(row=0, column=0, padx=10, pady=5, sticky="nsew")
 
-        button_frame = ctk.CTkScrollableFrame(
+        child_frame.button_frame = ctk.CTkScrollableFrame(
             master=child_frame,  # Родительский фрейм
             fg_color="transparent",  # Прозрачный фон
-            orientation="horizontal",  # Вертикальная прокрутка
+            orientation="horizontal",  # Горизонтальная прокрутка
             corner_radius=0,
             height=40  # Высота фрейма (можно настроить)
         )
-        button_frame.grid(row=0, column=1, padx=10, pady=5, sticky="nsew")
+        child_frame.button_frame.grid(row=0, column=1, padx=10, pady=5, sticky="nsew")
 
-        # Добавляем радиокнопки
-        for i, value in enumerate(char["values"]):
-            radio_button = ctk.CTkRadioButton(
-                master=button_frame,
-                text=value,
-                value=value,
-                variable=self.selected_values[char["name"]],
-                command=lambda c=char["name"]: self.update_selection(c)
-            )
-            radio_button.grid(row=0, column=i, padx=10, pady=5, sticky="nsew")
-
-        command = None
-
-        for match in self.matches:
-            if match[1] == idx:
-                citilink_category_id = match[0]
-                fraction = max((citilink_category_id - 1) / len(self.citilink_characters), 0)
+        # Радиокнопки создаются по мере надобности и переиспользуются строками с меньшим числом значений
+        child_frame.radio_buttons = []
 
-                def command(fraction_=fraction):
-                    self.scroll_to(neighbour_frame, fraction_)
-
-        # Вторая строка: текстовое поле
-        textbox = ctk.CTkButton(
+        # Вторая строка: ссылка на связанную характеристику ситилинка
+        child_frame.link_button = ctk.CTkButton(
             master=child_frame,
-            text='🔗 ' + char["description"] if command is not None else ' '*10,
+            text=' '*10,
             height=20,
             anchor="w",
             fg_color=('white', '#151515'),
             hover=False,
-            command=command if command is not None else lambda: ...,
-            state='normal' if command is not None else 'disabled',
             font=("Arial", 12)
         )
-
-        textbox.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky="nsew")
+        child_frame.link_button.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky="nsew")
 
         child_frame.grid_columnconfigure(0, weight=1)
         child_frame.grid_columnconfigure(1, weight=3)
@@ -781,16 +934,83 @@ class App:
         child_frame.grid_rowconfigure(0, weight=2)
         child_frame.grid_rowconfigure(1, weight=1)
 
-    def get_url(self, char_name, char_value):
+        return child_frame
+
+    def fill_goszakupki_params(self, child_frame, idx):
+        """
+        Заполнение строки столбца госзакупок характеристикой с индексом idx
+        :param child_frame: строка из new_goszakupki_params
+        :param idx: int - Индекс характеристики
+        :return: None
+        """
+        char = self.goszakupki_characters[idx]
+        self.set_textbox(child_frame.name_label, char["name"])
+
+        for i, value in enumerate(char["values"]):
+            if i == len(child_frame.radio_buttons):
+                child_frame.radio_buttons.append(ctk.CTkRadioButton(master=child_frame.button_frame))
+            radio_button = child_frame.radio_buttons[i]
+            # значение задаётся до переменной: при смене переменной кнопка сверяет с ним отметку
+            radio_button.configure(text=value, value=value)
+            radio_button.configure(
+                variable=self.selected_values[char["name"]],
+                command=lambda c=char["name"]: self.update_selection(c)
+            )
+            radio_button.grid(row=0, column=i, padx=10, pady=5, sticky="nsew")
+
+        for radio_button in child_frame.radio_buttons[len(char["values"]):]:
+            radio_button.grid_remove()
+
+        citilink_category_id = self.links_from_goszakupki.get(idx)
+        if citilink_category_id is None:
+            child_frame.link_button.configure(text=' '*10, state='disabled', command=lambda: ...)
+        else:
+            child_frame.link_button.configure(
+                text='🔗 ' + char["description"],
+                state='normal',
+                command=lambda citilink_id=citilink_category_id: self.scroll_to(self.citilink_list, citilink_id)
+            )
+
+    def get_option(self, char_name, char_value):
+        """
+        Поиск строки таблицы госзакупок и индекса значения характеристики.
+        :return: (row, option_idx)
+        """
         for char in self.goszakupki_characters:
             if char['name'] == char_name:
-                return char['refs'][char_value]
+                return char['row'], char['values'].index(char_value)
 
     def update_selection(self, char_name):
         """Обновляет выбор при смене радиокнопки"""
-        url = self.get_url(char_name, self.selected_values[char_name].get())
-        self.tools.click_url(url)
-        logger.debug("Выбрано для %s значение %s" % (char_name, self.selected_values[char_name].get()))
+        value = self.selected_values[char_name].get()
+        row, option_idx = self.get_option(char_name, value)
+
+        def done(future):
+            if future.cancelled():
+                error = 'выбор отменён'
+            elif future.exception() is not None:
+                error = str(future.exception())
+            elif not future.result():
+                error = 'значение не удалось выбрать на странице'
+            else:
+                self.result_queue.put(('success', 'select_option', [char_name, value]))
+                return
+            self.result_queue.put(('fail', 'select_option', [char_name, value, error]))
+
+        self.scheduler.call(self.stage_context, 'select_option', row, option_idx).add_done_callback(done)
+        logger.debug("Выбрано для %s значение %s" % (char_name, value))
+
+    def handle_selection(self, status, results):
+        """
+        Итог выбора значения из окна: при неудаче отметка возвращается к значению, выбранному на странице.
+        """
+        char_name, value = results[:2]
+        if status == 'success':
+            self.applied_values[char_name] = value
+            return
+        logger.warning('Не удалось выбрать для %s значение %s: %s' % (char_name, value, results[2]))
+        if char_name in self.selected_values and self.selected_values[char_name].get() == value:
+            self.selected_values[char_name].set(self.applied_values.get(char_name, ''))
 
     def get_match(self):
         """
@@ -808,109 +1028,233 @@ class App:
                 self.matches.append((citilink_id, gz_id))
 
     @staticmethod
-    def scroll_to(parent_scrollable_frame, fraction):
+    def scroll_to(virtual_list, idx):
         """
-        Функция для прокрутки фрейма до выбранной характеристики.
-        :param parent_scrollable_frame: Фрейм, который нужно прокрутить.
-        :param fraction: Позиция, до которой нужно прокрутить фрейм.
+        Функция для прокрутки столбца до выбранной характеристики.
+        :param virtual_list: VirtualList - Столбец, который нужно прокрутить.
+        :param idx: int - Индекс характеристики, до которой нужно прокрутить столбец.
         :return:
         """
-        canvas: tk.Canvas = parent_scrollable_frame.parent_canvas
-        canvas.yview_moveto(min(fraction, 1))
+        virtual_list.scroll_to_index(idx)
 
-    def check_queue(self):
+    def animate_status(self):
         """
-        Функция проверяет очередь, в которую приходят результаты вычислений, и запускает следующие
-        вычисления и отрисовки результатов.
+        Анимация строки статуса на собственном таймере, независимо от прихода результатов.
         :return: None
         """
-        try:
-            if self.in_work and self.current_text != '':
-                if type(self.current_text) is str:
-                    self.current_text = self.current_text.split('\n')
-
-                text = self.wave[self.current_state] + '\t' + self.current_text[0] + '\t' + self.wave[self.current_state] \
-                       + '\n' + self.current_text[1]
-                self.current_operation.configure(text=text)
-                self.current_state = (self.current_state + 1) % len(self.wave)
-            elif not self.in_work and self.current_text != '':
-                self.current_operation.configure(text='')
-                self.current_state = 0
-
-            # Проверка очереди на наличие результата
-            status, stage, results = self.result_queue.get_nowait()
-            logger.debug('%s, %s, %s' % (status, stage, results))
+        if self.in_work and self.current_text != '':
+            if type(self.current_text) is str:
+                self.current_text = self.current_text.split('\n')
 
-            # Нажатие на кнопку "Остановить"
-            if self.cancel_flag and self.cancel_flag.is_set():
-                self.current_text = ""
-                self.main_button.configure(text="Поиск")
+            text = self.wave[self.current_state] + '\t' + self.current_text[0] + '\t' + self.wave[self.current_state] \
+                   + '\n' + self.current_text[1]
+            self.current_operation.configure(text=text)
+            self.current_state = (self.current_state + 1) % len(self.wave)
+        elif not self.in_work and self.current_text != '':
+            self.current_operation.configure(text='')
+            self.current_state = 0
 
-            elif status == 'success':
+        self.root.after(SPINNER_INTERVAL_MS, self.animate_status)
 
-                # Найдена ссылка на товар на сайте ситилинк
-                if stage == 'citilink_search':
-                    self.start_citilink_parsing(results)
+    def notify_result(self):
+        """
+        Вызывается из рабочих потоков после помещения результата в очередь:
+        будит главный цикл Tk, чтобы следующий этап запускался без ожидания опроса.
+        """
+        try:
+            self.root.event_generate(RESULT_EVENT, when='tail')
+        except (tk.TclError, RuntimeError):
+            # окно закрыто или Tcl собран без поддержки потоков - результат заберёт резервный опрос
+            pass
 
-                # Найдены характеристики на сайте ситилинк
-                if stage == 'citilink_parsing':
-                    product_name, product_price, characters = results
+    def check_queue(self, event=None):
+        """
+        Функция забирает из очереди все накопившиеся результаты вычислений и для каждого запускает
+        следующие вычисления и отрисовки результатов.
+        Вызывается по событию RESULT_EVENT и редким резервным опросом.
+        :return: None
+        """
+        if event is None:
+            self.root.after(QUEUE_FALLBACK_MS, self.check_queue)
+
+        while True:
+            try:
+                status, stage, results = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            logger.debug('%s, %s, %s' % (status, stage, results))
 
-                    goszakupki_search = re.findall(r'[а-я ]+', product_name.lower())[0].strip()
-                    self.steps['goszakupki_query'] = goszakupki_search
+            with tracing.span('ui:' + stage, status=status):
+                self.handle_result(status, stage, results)
 
-                    self.citilink_characters = characters
-                    self.show_search_result(product_name, product_price, self.steps['citilink_url'])
+    def handle_result(self, status, stage, results):
+        """
+        Обработка одного результата из очереди.
+        :return: None
+        """
+        # Браузер или модель запустились в фоне
+        if status == 'ready':
+            logger.info('Готов компонент %s через %.2f с после старта' % (stage, results))
+            self.components[stage] = True
+            self.startup_times[stage] = results
+            self.show_readiness()
+            if self.measure_startup and all(state is True for state in self.components.values()):
+                self.finish_startup_measure()
+
+        # Выбор значения из окна - не этап поиска, флаг остановки на него не влияет
+        elif stage == 'select_option':
+            self.handle_selection(status, results)
+
+        # Не удалось запустить браузер или модель, этап упал или не уложился во время
+        elif status in ('error', 'timeout'):
+            logger.error(results)
+            if stage in self.components:
+                self.components[stage] = results
+                self.show_readiness()
+                if self.measure_startup:
+                    self.startup_times['error'] = results
+                    self.finish_startup_measure()
+                    return
+            self.in_work = False
+            self.current_text = ''
+            self.main_button.configure(text="Поиск")
+
+        # Нажатие на кнопку "Остановить"
+        elif self.cancel_flag and self.cancel_flag.is_set():
+            self.current_text = ""
+            self.main_button.configure(text="Поиск")
+            if status == 'stopped':
+                self.in_work = False
+
+        # Планировщик запустил следующий этап
+        elif status == 'started':
+            self.current_text = STAGE_STATUS.get(stage, self.current_text)
+
+        # Этапы запускает планировщик, здесь только отрисовка их результатов
+        elif status == 'success':
+
+            # Найдена ссылка на товар на сайте ситилинк
+            if stage == 'citilink_search':
+                self.steps['citilink_url'] = results['citilink_url']
+
+            # Найдены характеристики на сайте ситилинк
+            elif stage == 'citilink_parsing':
+                self.citilink_characters = results['characteristics']
+                self.show_search_result(results['name'], results['price'], self.steps['citilink_url'])
+
+            elif stage == 'goszakupki_query':
+                self.steps['goszakupki_query'] = results['goszakupki_query']
+
+            # Найдена ссылка на неукрупнённую позицию на сайте госзакупки
+            elif stage == 'goszakupki_search':
+                self.steps['goszakupki_url'] = results['goszakupki_url']
+                self.show_gu_search_result(results['goszakupki_name'], results['goszakupki_url'])
+
+            # Найдены характеристики на сайте госзакупки
+            elif stage == 'goszakupki_parsing':
+                self.goszakupki_characters = results['rows']
+                self.get_match()
+
+                self.selected_values = {
+                    char["name"]: ctk.StringVar(value=char["default_value"])
+                    for char in results['rows']
+                }
+                self.applied_values = {char["name"]: char["default_value"] for char in results['rows']}
+
+                self.show_columns_container()
+
+            # Характеристики скопированы со страницы госзакупок
+            elif stage == 'copy_chars':
+                self.show_copied()
+
+        elif status == 'fail':
+
+            # Найти укрупнённую позицию не удалось -> пользователь должен её выбрать сам
+            if stage == 'goszakupki_search':
+                category, exact_products_dict = results
+
+                self.gz_links = exact_products_dict
+
+                self.show_gz_links(category)
 
-                    self.start_goszakupki_search(goszakupki_search)
 
-                # Найдена ссылка на неукрупнённую позицию на сайте госзакупки
-                elif stage == 'goszakupki_search':
-                    correct_ref, correct_name = results
-                    self.steps['goszakupki_url'] = correct_ref
+if __name__ == "__main__":
+    imports_time = round(time.perf_counter() - PROCESS_START, 3)
 
-                    self.show_gu_search_result(correct_name, correct_ref)
-                    self.start_goszakupki_parsing(correct_ref)
+    root = ctk.CTk()
+    root.geometry("800x700")
 
-                # Найдены характеристики на сайте госзакупки
-                elif stage == 'goszakupki_parsing':
-                    self.goszakupki_characters = results
-                    self.get_match()
+    parser = argparse.ArgumentParser(description='Данная программа создана для автоматизации работы с госзакупками')
 
-                    self.selected_values = {
-                        char["name"]: ctk.StringVar(value=char["default_value"])
-                        for char in results
-                    }
+    parser.add_argument('-v', '--view-browser',
+                        action='store_true',
+                        help='Если аргумент задан, то будет открыт браузер для просмотра результатов работы. Иначе браузер будет работать в фоновом режиме')
 
-                    self.show_columns_container()
+    parser.add_argument('--embedding-backend',
+                        choices=['torch', 'onnx'],
+                        default='torch',
+                        help='Бэкенд модели векторизации: torch или квантизованная int8-модель в ONNX Runtime (быстрее на слабых CPU)')
 
-            elif status == 'fail':
+    parser.add_argument('--speculative',
+                        action='store_true',
+                        help='Искать позицию на госзакупках во втором браузере параллельно со сбором характеристик Ситилинка')
 
-                # Найти укрупнённую позицию не удалось -> пользователь должен её выбрать сам
-                if stage == 'goszakupki_search':
-                    category, exact_products_dict = results
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help='Не брать характеристики из локального кэша страниц и зеркала КТРУ, а собирать их с сайтов заново')
 
-                    self.gz_links = exact_products_dict
+    parser.add_argument('--load-all-resources',
+                        action='store_true',
+                        help='Не блокировать картинки, шрифты и счётчики на страницах')
 
-                    self.show_gz_links(category)
+    parser.add_argument('--matching',
+                        choices=['assignment', 'nearest'],
+                        default='assignment',
+                        help='Сопоставление характеристик: один к одному по общей матрице близости или ближайшая для каждой строки отдельно')
 
-        except queue.Empty:
-            pass
-        # Периодический вызов через 500 мс
-        self.root.after(500, self.check_queue)
+    parser.add_argument('--citilink-fetch',
+                        choices=['browser', 'http'],
+                        default='browser',
+                        help='Получать страницы Ситилинка через браузер или HTTP-запросом без браузера (при неудаче - через браузер)')
 
+    parser.add_argument('--trace',
+                        metavar='PATH',
+                        help='Записать трассу этапов (Chrome Trace Event JSON) в файл для chrome://tracing или Perfetto')
 
-if __name__ == "__main__":
-    root = ctk.CTk()
-    root.geometry("800x700")
+    parser.add_argument('--resource-report',
+                        action='store_true',
+                        help='Писать в лог (уровень DEBUG), сколько запросов и байт сэкономлено на каждой странице')
 
-    parser = argparse.ArgumentParser(description='Данная программа создана для автоматизации работы с госзакупками')
+    parser.add_argument('--chrome-profile',
+                        nargs='?',
+                        const=True,
+                        metavar='DIR',
+                        help='Постоянный профиль Chrome с HTTP-кэшем на диске (по умолчанию .cache/chrome-profile)')
 
-    parser.add_argument('-v', '--view-browser',
+    parser.add_argument('--attach',
+                        nargs='?',
+                        const='127.0.0.1:%d' % DEFAULT_PORT,
+                        metavar='HOST:PORT',
+                        help='Подключиться к постоянному Chrome по адресу отладки; локальный запускается, если ещё не запущен')
+
+    parser.add_argument('--measure-startup',
                         action='store_true',
-                        help='Если аргумент задан, то будет открыт браузер для просмотра результатов работы. Иначе браузер будет работать в фоновом режиме')
+                        help='Вывести время запуска (импорты, готовность окна, браузера и модели) строкой JSON и выйти')
 
     args = parser.parse_args()
 
-    app = App(root, view_browser=True)
+    if args.trace:
+        tracing.enable(args.trace)
+
+    policy = False if args.load_all_resources else ResourcePolicy(report=args.resource_report)
+
+    app = App(root, view_browser=True, embedding_backend=args.embedding_backend, speculative=args.speculative,
+              cache_bypass=args.no_cache, resource_policy=policy, matching=args.matching,
+              measure_startup=args.measure_startup, profile_dir=args.chrome_profile, debugger_address=args.attach,
+              citilink_fetch=args.citilink_fetch)
+    app.startup_times['imports'] = imports_time
     root.mainloop()
+    # идущий этап остановится на ближайшей проверке флага
+    app.cancel_flag.set()
+    app.scheduler.close()
+    tracing.save()
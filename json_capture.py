@@ -0,0 +1,179 @@
+"""
+Данные госзакупок из ответов JSON, которые страница сама запрашивает (XHR / fetch).
+
+Сайт рисует список уточнений КТРУ и таблицу характеристик на клиенте по ответам своего API.
+Эти ответы перехватываются по событиям DevTools Network.responseReceived / Network.loadingFinished
+из общего NetworkLog, тело забирается через Network.getResponseBody, а нужные структуры
+ищутся в нём по форме данных, без привязки к конкретным адресам API.
+Если подходящего ответа нет, этапы Tools собирают данные со страницы, как раньше.
+"""
+import base64
+import json
+from urllib.parse import urlparse
+
+from ktru_mirror import REFINEMENT_RE
+from logging_config import logger
+
+# Ключи, под которыми в ответах встречаются название и список значений
+NAME_KEYS = ('name', 'title', 'label', 'characteristicName', 'text')
+VALUES_KEYS = ('values', 'options', 'variants', 'items', 'valueList')
+# Ключи текста значения, если значение - объект
+VALUE_TEXT_KEYS = ('value', 'name', 'title', 'label', 'text')
+# Ключи ссылки и кода позиции КТРУ
+LINK_KEYS = ('url', 'href', 'link')
+CODE_KEYS = ('code', 'ktru', 'ktruCode')
+
+JSON_RESOURCE_TYPES = ('XHR', 'Fetch')
+
+
+def _first(item, keys, kind):
+    for key in keys:
+        if isinstance(item.get(key), kind) and item[key]:
+            return item[key]
+    return None
+
+
+def _lists(data):
+    """
+    Все списки внутри ответа, в порядке обхода.
+    """
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            yield node
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            stack.extend(reversed(list(node.values())))
+
+
+def _value_text(value):
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return str(value).strip()
+    if isinstance(value, dict):
+        text = _first(value, VALUE_TEXT_KEYS, (str, int, float))
+        return None if text is None else str(text).strip()
+    return None
+
+
+def extract_characteristics(data):
+    """
+    Таблица характеристик КТРУ из ответа: самый длинный список объектов,
+    у каждого из которых есть название и список значений.
+    :return: list[dict] - [{'name': str, 'values': list[str]}, ...] или None
+    """
+    best = None
+    for items in _lists(data):
+        rows = []
+        for item in items:
+            if not isinstance(item, dict):
+                break
+            name = _first(item, NAME_KEYS, str)
+            values = _first(item, VALUES_KEYS, list)
+            if name is None or values is None:
+                break
+            texts = [_value_text(value) for value in values]
+            if None in texts:
+                break
+            rows.append({'name': name.strip(), 'values': texts})
+        else:
+            if rows and (best is None or len(rows) > len(best)):
+                best = rows
+    return best
+
+
+def extract_refinements(data, base_url):
+    """
+    Уточнения укрупнённой позиции из ответа: список объектов с названием вида
+    "Позиция (характеристика: значение)" и ссылкой или кодом КТРУ.
+    :return: (category, {значение: [ссылка, название]}) или None
+    """
+    best = None
+    for items in _lists(data):
+        category = None
+        refinements = {}
+        for item in items:
+            if not isinstance(item, dict):
+                break
+            name = _first(item, NAME_KEYS, str)
+            match = REFINEMENT_RE.search(name or '')
+            link = _first(item, LINK_KEYS, str)
+            if link is None and (code := _first(item, CODE_KEYS, str)) is not None:
+                link = '%s/ktru/%s/' % (base_url, code)
+            if match is None or link is None:
+                continue
+            if link.startswith('/'):
+                link = base_url + link
+            refinements[match[2]] = [link, name]
+            if category is None:
+                category = match[1]
+        if refinements and (best is None or len(refinements) > len(best[1])):
+            best = (category, refinements)
+    return best
+
+
+class JsonCapture:
+    """
+    Ответы JSON страницы, накопленные с последнего reset().
+    События приходят из общего NetworkLog, поэтому ему нужен лог performance в capabilities.
+    """
+    def __init__(self, driver, network_log, host=None):
+        """
+        :param host: str | None - учитывать только ответы с этого хоста и его поддоменов (api., zakupki. и т. п.)
+        """
+        self.driver = driver
+        self.network_log = network_log
+        self.host = host[4:] if host and host.startswith('www.') else host
+        self._pending = {}
+        self._finished = []
+        self._bodies = []
+        driver.execute_cdp_cmd('Network.enable', {})
+        network_log.listen(self.on_event)
+
+    def reset(self):
+        self._pending = {}
+        self._finished = []
+        self._bodies = []
+
+    def on_event(self, method, params):
+        if method == 'Network.responseReceived':
+            response = params.get('response', {})
+            if params.get('type') not in JSON_RESOURCE_TYPES or 'json' not in response.get('mimeType', ''):
+                return
+            hostname = urlparse(response.get('url', '')).hostname or ''
+            if self.host is not None and hostname != self.host and not hostname.endswith('.' + self.host):
+                return
+            self._pending[params['requestId']] = response['url']
+        elif method == 'Network.loadingFinished' and params['requestId'] in self._pending:
+            self._finished.append(params['requestId'])
+
+    def bodies(self):
+        """
+        Забирает новые события и тела полностью загруженных ответов.
+        :return: list[(url, data)] - все разобранные ответы с последнего reset()
+        """
+        self.network_log.drain()
+        while self._finished:
+            request_id = self._finished.pop(0)
+            url = self._pending.pop(request_id)
+            try:
+                body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+                text = body['body']
+                if body.get('base64Encoded'):
+                    text = base64.b64decode(text).decode('utf-8')
+                self._bodies.append((url, json.loads(text)))
+            except Exception as e:
+                logger.debug('Не удалось прочитать ответ %s: %s' % (url, e))
+        return self._bodies
+
+    def find(self, extractor):
+        """
+        Последний полученный ответ, из которого extractor(data) что-то извлёк.
+        :return: результат extractor или None
+        """
+        for url, data in reversed(self.bodies()):
+            result = extractor(data)
+            if result:
+                logger.debug('Данные взяты из ответа %s' % url)
+                return result
+        return None
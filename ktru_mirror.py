@@ -0,0 +1,265 @@
+"""
+Локальное зеркало каталога КТРУ в SQLite.
+
+Хранит иерархию позиций, уточнения вида "(атрибут: значение)" и таблицы характеристик позиций.
+Заполняется импортом выгрузки (JSONL) или записью того, что Tools находит в браузере.
+
+Формат строки выгрузки:
+    {"code": "26.20.11.110", "name": "Компьютер портативный", "url": "...", "parent": null,
+     "refinements": [{"code": "26.20.11.110-00000141", "label": "... (Тип процессора: Intel)", "url": "..."}],
+     "characteristics": [{"name": "Объем оперативной памяти, Гб", "values": ["≥ 8", "≥ 16"]}]}
+
+Пример:
+    python ktru_mirror.py import ktru_dump.jsonl
+    python ktru_mirror.py search "ноутбук"
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from logging_config import logger
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS positions (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    url TEXT,
+    parent_code TEXT,
+    depth INTEGER NOT NULL DEFAULT 0,
+    -- подпись "(атрибут: значение)" для уточнённых позиций
+    attribute TEXT,
+    value TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS positions_name ON positions (name_lower);
+CREATE INDEX IF NOT EXISTS positions_parent ON positions (parent_code);
+
+CREATE TABLE IF NOT EXISTS characteristics (
+    code TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    "values" TEXT NOT NULL,
+    PRIMARY KEY (code, row)
+);
+
+-- когда таблица характеристик позиции записана в последний раз
+CREATE TABLE IF NOT EXISTS tables (
+    code TEXT PRIMARY KEY,
+    updated REAL NOT NULL
+);
+
+-- запросы, по которым позиция была найдена на сайте
+CREATE TABLE IF NOT EXISTS search_terms (
+    query TEXT PRIMARY KEY,
+    code TEXT NOT NULL
+);
+'''
+
+REFINEMENT_RE = re.compile(r'\((.*):(.*)\)')
+
+# Сколько записи зеркала считаются актуальными, с; более старые берутся с сайта заново
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+
+def escape_like(text):
+    """
+    Экранирование % и _ для LIKE ... ESCAPE '\\': в названиях товаров это обычные символы.
+    """
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def code_from_url(url):
+    """
+    Код позиции из ссылки вида https://moy-zakupki.ru/ktru/26.20.11.110-00000141/
+    """
+    match = re.search(r'/ktru/([^/?#]+)', url or '')
+    return match[1] if match else url
+
+
+class KtruMirror:
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        """
+        :param path: str - путь к файлу базы
+        :param max_age: float | None - время жизни уточнений и таблиц, с; None - без ограничения
+        """
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _upsert_position(self, code, name, url=None, parent_code=None, depth=0):
+        match = REFINEMENT_RE.search(name)
+        attribute, value = (match[1], match[2]) if match else (None, None)
+        # уже известные ссылка и родитель не затираются пустыми значениями
+        self._conn.execute('''
+            INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (code) DO UPDATE SET
+                name = excluded.name,
+                name_lower = excluded.name_lower,
+                url = COALESCE(excluded.url, url),
+                parent_code = COALESCE(excluded.parent_code, parent_code),
+                depth = CASE WHEN excluded.parent_code IS NULL THEN depth ELSE excluded.depth END,
+                attribute = excluded.attribute,
+                value = excluded.value,
+                updated = excluded.updated
+        ''', (code, name, name.lower(), url, parent_code, depth, attribute, value, time.time()))
+
+    def _replace_table(self, code, rows):
+        self._conn.execute('DELETE FROM characteristics WHERE code = ?', (code,))
+        self._conn.executemany(
+            'INSERT INTO characteristics VALUES (?, ?, ?, ?)',
+            [(code, i, row['name'], json.dumps(row['values'], ensure_ascii=False)) for i, row in enumerate(rows)]
+        )
+        self._conn.execute('INSERT OR REPLACE INTO tables VALUES (?, ?)', (code, time.time()))
+
+    def _oldest(self):
+        return 0 if self.max_age is None else time.time() - self.max_age
+
+    # --- заполнение ---
+
+    def import_jsonl(self, path):
+        """
+        Импорт выгрузки каталога.
+        :return: int - число импортированных позиций
+        """
+        count = 0
+        with self._lock, open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                depth = item.get('depth', 0)
+                # строка может содержать только таблицу характеристик уже известной позиции
+                if 'name' in item:
+                    self._upsert_position(item['code'], item['name'], item.get('url'), item.get('parent'), depth)
+                for refinement in item.get('refinements', []):
+                    self._upsert_position(refinement['code'], refinement['label'], refinement.get('url'),
+                                          item['code'], depth + 1)
+                if item.get('characteristics'):
+                    self._replace_table(item['code'], item['characteristics'])
+                count += 1
+            self._conn.commit()
+        logger.info('Импортировано позиций КТРУ: %d' % count)
+        return count
+
+    def record_refinements(self, query, position_url, position_name, exact_products_dict):
+        """
+        Запись результата поиска укрупнённой позиции в браузере.
+        :param exact_products_dict: dict {значение: [ссылка, название]} - см. Tools.find_ktru_refinements
+        """
+        code = code_from_url(position_url)
+        with self._lock:
+            self._upsert_position(code, position_name or code, position_url)
+            for ref, name in exact_products_dict.values():
+                self._upsert_position(code_from_url(ref), name, ref, code, 1)
+            self._conn.execute('INSERT OR REPLACE INTO search_terms VALUES (?, ?)', (query.lower(), code))
+            self._conn.commit()
+
+    def record_table(self, url, rows):
+        """
+        Запись таблицы характеристик позиции (см. Tools.goszakupki_rows_script).
+        """
+        with self._lock:
+            self._replace_table(code_from_url(url), rows)
+            self._conn.commit()
+
+    # --- поиск ---
+
+    def find_position(self, query):
+        """
+        Укрупнённая позиция по запросу: сначала среди запомненных запросов,
+        затем по вхождению запроса в название среди позиций, у которых есть уточнения.
+        :return: str | None - код позиции
+        """
+        query = query.lower().strip()
+        with self._lock:
+            row = self._conn.execute('SELECT code FROM search_terms WHERE query = ?', (query,)).fetchone()
+            if row is None:
+                row = self._conn.execute('''
+                    SELECT p.code FROM positions p
+                    WHERE p.name_lower LIKE ? ESCAPE '\\' AND p.attribute IS NULL
+                      AND EXISTS (SELECT 1 FROM positions c WHERE c.parent_code = p.code)
+                    ORDER BY length(p.name) LIMIT 1
+                ''', ('%' + escape_like(query) + '%',)).fetchone()
+        return row[0] if row else None
+
+    def find_refinements(self, query):
+        """
+        Аналог Tools.find_ktru_refinements без браузера.
+        Уточнения позиции могут быть по разным атрибутам; берётся атрибут, по которому их больше всего,
+        как в списке уточнений на сайте.
+        :return: (category, {значение: [ссылка, название]}) или None, если позиции нет в зеркале или она устарела
+        """
+        code = self.find_position(query)
+        if code is None:
+            return None
+
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT url, name, attribute, value FROM positions
+                WHERE parent_code = ? AND attribute IS NOT NULL AND updated >= ? ORDER BY code
+            ''', (code, self._oldest())).fetchall()
+
+        if not rows:
+            return None
+
+        groups = {}
+        for url, name, attribute, value in rows:
+            groups.setdefault(attribute, {})[value] = [url, name]
+        category = max(groups, key=lambda attribute: len(groups[attribute]))
+        return category, groups[category]
+
+    def table(self, url):
+        """
+        Таблица характеристик позиции.
+        :return: list[dict] | None - [{'name': str, 'values': list[str]}, ...]; None, если её нет или она устарела
+        """
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT c.name, c."values" FROM characteristics c JOIN tables t ON t.code = c.code
+                WHERE c.code = ? AND t.updated >= ? ORDER BY c.row
+            ''', (code_from_url(url), self._oldest())).fetchall()
+        if not rows:
+            return None
+        return [{'name': name, 'values': json.loads(values)} for name, values in rows]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'positions': self._conn.execute('SELECT COUNT(*) FROM positions').fetchone()[0],
+                'tables': self._conn.execute('SELECT COUNT(DISTINCT code) FROM characteristics').fetchone()[0],
+                'search_terms': self._conn.execute('SELECT COUNT(*) FROM search_terms').fetchone()[0],
+            }
+
+
+def main():
+    from tools import CACHE_DIR
+
+    parser = argparse.ArgumentParser(description='Локальное зеркало каталога КТРУ')
+    parser.add_argument('--db', default=os.path.join(CACHE_DIR, 'ktru.sqlite'), help='Путь к базе зеркала')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='Импорт выгрузки JSONL')
+    import_parser.add_argument('path')
+    search_parser = commands.add_parser('search', help='Поиск уточнений КТРУ по запросу')
+    search_parser.add_argument('query')
+    commands.add_parser('stats', help='Размер зеркала')
+    args = parser.parse_args()
+
+    mirror = KtruMirror(args.db)
+    if args.command == 'import':
+        mirror.import_jsonl(args.path)
+    elif args.command == 'search':
+        print(json.dumps(mirror.find_refinements(args.query), ensure_ascii=False, indent=2))
+    print(mirror.stats())
+
+
+if __name__ == '__main__':
+    main()
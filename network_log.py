@@ -0,0 +1,42 @@
+import json
+
+# Capability, при которой chromedriver собирает события DevTools (Network.*, Page.*) в лог performance
+LOGGING_PREFS = {'performance': 'ALL'}
+
+
+class NetworkLog:
+    """
+    Чтение событий DevTools из лога performance.
+    Лог при чтении очищается, поэтому все потребители получают события через один экземпляр.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+        self.listeners = []
+
+    def listen(self, callback):
+        """
+        :param callback: callable(method, params) - вызывается для каждого события
+        """
+        self.listeners.append(callback)
+
+    def drain(self):
+        """
+        Забирает накопившиеся события и передаёт их подписчикам.
+        :return: list[(method, params)]
+        """
+        try:
+            entries = self.driver.get_log('performance')
+        except Exception as e:
+            # лог не включён в capabilities или браузер подключён без него
+            return []
+
+        events = []
+        for entry in entries:
+            message = json.loads(entry['message'])['message']
+            events.append((message.get('method'), message.get('params', {})))
+
+        for method, params in events:
+            for callback in self.listeners:
+                callback(method, params)
+
+        return events
@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+
+from logging_config import logger
+
+
+def export_onnx_model(model_name, output_dir, quantize=True):
+    """
+    Экспорт модели HuggingFace в ONNX и динамическая int8-квантизация весов.
+    Нужен torch + transformers (есть вместе с langchain_huggingface) и onnxruntime.
+    :param model_name: str - имя модели HuggingFace
+    :param output_dir: str - каталог, куда сохраняются model.onnx / model_int8.onnx и токенизатор
+    :param quantize: bool - выполнять ли квантизацию
+    :return: str - путь к итоговой модели
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(['пример текста'], return_tensors='pt')
+    fp32_path = os.path.join(output_dir, 'model.onnx')
+
+    # входы модели берутся у токенизатора: у XLM-R (e5) нет token_type_ids, у BERT они есть
+    input_names = [name for name in tokenizer.model_input_names if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+
+    logger.info('Экспортирую %s в %s (входы: %s)' % (model_name, fp32_path, ', '.join(input_names)))
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            # входы передаются по именам, а не по порядку аргументов forward
+            ({name: sample[name] for name in input_names},),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    if not quantize:
+        return fp32_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = os.path.join(output_dir, 'model_int8.onnx')
+    logger.info('Квантизую модель в %s' % int8_path)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    return int8_path
+
+
+class OnnxEmbeddings:
+    """
+    Векторизация через ONNX Runtime на CPU.
+    Повторяет пайплайн sentence-transformers для e5: mean pooling по маске + L2-нормировка.
+    Интерфейс совпадает с HuggingFaceEmbeddings.embed_documents.
+    """
+    def __init__(self, model_dir, model_file='model_int8.onnx', batch_size=100, max_length=512, threads=None):
+        """
+        :param model_dir: str - каталог, подготовленный export_onnx_model
+        :param model_file: str - имя файла модели в каталоге
+        :param batch_size: int - размер батча
+        :param max_length: int - максимальная длина последовательности в токенах
+        :param threads: int | None - число потоков ONNX Runtime; None - по умолчанию
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads is not None:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def embed_documents(self, texts):
+        result = []
+        for start in range(0, len(texts), self.batch_size):
+            result.extend(self._embed_batch(texts[start:start + self.batch_size]))
+        return result
+
+    def _embed_batch(self, texts):
+        encoded = self.tokenizer(
+            list(texts),
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors='np'
+        )
+        inputs = {name: encoded[name].astype(np.int64) for name in encoded if name in self.input_names}
+        if 'token_type_ids' in self.input_names and 'token_type_ids' not in inputs:
+            inputs['token_type_ids'] = np.zeros_like(inputs['input_ids'])
+
+        hidden = self.session.run(None, inputs)[0]
+
+        mask = encoded['attention_mask'][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+        return pooled.tolist()
@@ -0,0 +1,119 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from logging_config import logger
+
+# Время жизни записей по источникам, с
+DEFAULT_TTL = {
+    'citilink': 24 * 3600,        # характеристики товара на ситилинке
+    'ktru_search': 7 * 24 * 3600,  # укрупнённая позиция и уточнения КТРУ по запросу
+    'ktru_table': 7 * 24 * 3600,   # таблица характеристик позиции КТРУ
+}
+
+
+class PageCache:
+    """
+    Кэш разобранных страниц на диске (SQLite): обычные данные, сериализованные в JSON,
+    по ключу (источник, URL или запрос). У каждого источника своё время жизни,
+    при превышении max_bytes удаляются записи, к которым дольше всего не обращались.
+    """
+    def __init__(self, path, ttl=None, max_bytes=50 * 1024 * 1024):
+        """
+        :param path: str - путь к файлу базы
+        :param ttl: dict | None - время жизни по источникам, дополняет DEFAULT_TTL
+        :param max_bytes: int - предельный суммарный размер значений
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                source TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (source, key)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self._conn.commit()
+
+    def get(self, source, key):
+        """
+        :return: сохранённое значение или None, если записи нет или она устарела
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, created FROM entries WHERE source = ? AND key = ?', (source, key)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl.get(source, 0):
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                'UPDATE entries SET accessed = ? WHERE source = ? AND key = ?', (now, source, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        logger.debug('Кэш страниц: %s %s' % (source, key))
+        return json.loads(row[0])
+
+    def put(self, source, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                (source, key, data, len(data.encode('utf-8')), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        now = time.time()
+        for source, ttl in self.ttl.items():
+            self._conn.execute('DELETE FROM entries WHERE source = ? AND created < ?', (source, now - ttl))
+
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute('SELECT source, key, size FROM entries ORDER BY accessed').fetchall()
+        for source, key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute('DELETE FROM entries WHERE source = ? AND key = ?', (source, key))
+            total -= size
+
+    def invalidate(self, source=None, key=None):
+        """
+        Удаление записей: одной (source + key), всех записей источника или всего кэша.
+        """
+        with self._lock:
+            if source is None:
+                self._conn.execute('DELETE FROM entries')
+            elif key is None:
+                self._conn.execute('DELETE FROM entries WHERE source = ?', (source,))
+            else:
+                self._conn.execute('DELETE FROM entries WHERE source = ? AND key = ?', (source, key))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            items, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'items': items, 'bytes': size, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,82 @@
+"""
+JavaScript, выполняемый в браузере через execute_script.
+Каждый скрипт собирает данные страницы за один запрос к драйверу.
+"""
+
+# Ссылка на первый товар в выдаче поиска ситилинка
+CITILINK_SEARCH_LINK_XPATH = '//div[@data-meta-name="SnippetProductVerticalLayout"]/a[1]'
+
+# Списки характеристик на странице товара ситилинка
+CITILINK_PARAMS_XPATH = "//ul[li/div/div and li/div/span]"
+
+# Кнопка или ссылка «Все характеристики»: на странице товара показана только часть характеристик
+CITILINK_ALL_CHARS_XPATH = "//button[.//text()='Все характеристики'] | //a[.//text()='Все характеристики']"
+
+# Сбор названия, цены и пар (название, значение) по каждому <li> за один запрос к драйверу
+CITILINK_EXTRACT_JS = """
+const paramsXpath = arguments[0];
+const snapshot = (xpath, context) => document.evaluate(
+    xpath, context, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const firstText = (xpath, context) => {
+    const nodes = snapshot(xpath, context);
+    for (let i = 0; i < nodes.snapshotLength; i++) {
+        const text = nodes.snapshotItem(i).innerText.trim();
+        if (text) return text;
+    }
+    return '';
+};
+
+const result = {
+    name: firstText('//h1', document),
+    price: firstText('//div[@data-meta-name="PriceBlock__price"]', document),
+    params: []
+};
+
+const uls = snapshot(paramsXpath, document);
+for (let i = 0; i < uls.snapshotLength; i++) {
+    const lis = snapshot('.//li', uls.snapshotItem(i));
+    for (let j = 0; j < lis.snapshotLength; j++) {
+        const li = lis.snapshotItem(j);
+        const name = firstText('.//div/div', li);
+        const value = firstText('./div/span', li);
+        if (name && value) result.params.push([name, value]);
+    }
+}
+return JSON.stringify(result);
+"""
+
+# Строки таблицы характеристик КТРУ: название + варианты значения
+GOSZAKUPKI_ROWS_XPATH = '//tr[count(td) = 2 and count(*) = 2]'
+
+# Сбор всех строк таблицы характеристик КТРУ
+GOSZAKUPKI_ROWS_JS = """
+const rows = document.evaluate(
+    arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const result = [];
+for (let i = 0; i < rows.snapshotLength; i++) {
+    const cells = rows.snapshotItem(i).querySelectorAll(':scope > td');
+    result.push({
+        name: cells[0].innerText.trim(),
+        values: cells[1].innerText.trim().split('\\n').map(value => value.trim())
+    });
+}
+return JSON.stringify(result);
+"""
+
+# Клик по выбранным значениям: arguments[1] = [[номер строки, индекс значения], ...]
+# Возвращает {номер строки: true/false}
+GOSZAKUPKI_APPLY_JS = """
+const rows = document.evaluate(
+    arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const result = {};
+for (const [row, option] of arguments[1]) {
+    try {
+        const cells = rows.snapshotItem(row).querySelectorAll(':scope > td');
+        cells[1].querySelectorAll('span')[option].click();
+        result[row] = true;
+    } catch (e) {
+        result[row] = false;
+    }
+}
+return JSON.stringify(result);
+"""
@@ -0,0 +1,372 @@
+"""
+Планировщик этапов поиска: этапы - граф с именованными типизированными входами и выходами.
+
+Этап запускается, как только готовы все его входы, в исполнителе своего этапа с ограниченным числом
+потоков. Следующий этап запускается из обработчика завершения предыдущего, поэтому ни один поток
+не ждёт другой этап. Этапы, которым нужен браузер, выполняются под блокировкой контекста:
+в один браузер одновременно обращается только один этап.
+
+Одним и тем же планировщиком пользуются окно приложения (gossy_start.py) и пакетный режим (gossy_batch.py).
+Модуль не импортирует tools, чтобы окно открывалось до загрузки Selenium.
+"""
+import queue
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import tracing
+from logging_config import logger
+
+
+class StageError(Exception):
+    """
+    Этап завершился не успешно: остановлен ('stopped'), не нашёл результат ('fail'),
+    не уложился во время ('timeout') или упал ('error').
+    """
+    def __init__(self, stage, status, results):
+        super().__init__('%s: %s' % (stage, status))
+        self.stage = stage
+        self.status = status
+        self.results = results
+
+
+class Stage:
+    """
+    Этап пайплайна.
+    """
+    def __init__(self, name, call, inputs, outputs, timeout=None, workers=1, driver=True):
+        """
+        :param name: str - название этапа, совпадает с этапом в сообщениях Tools
+        :param call: callable(context, *входы) - значение выхода, при нескольких выходах - кортеж по порядку
+        :param inputs: dict {имя: тип} - входы в порядке аргументов call
+        :param outputs: dict {имя: тип} - выходы
+        :param timeout: float | None - предельное время этапа с момента, когда он получил браузер, с
+        :param workers: int - число потоков исполнителя этапа
+        :param driver: bool - этапу нужен браузер контекста
+        """
+        self.name = name
+        self.call = call
+        self.inputs = inputs
+        self.outputs = outputs
+        self.timeout = timeout
+        self.workers = workers
+        self.driver = driver
+
+    @staticmethod
+    def check(stage, name, value, kind):
+        if not isinstance(value, kind):
+            raise TypeError('Этап %s: %s должен быть %s, получено %s'
+                            % (stage, name, getattr(kind, '__name__', kind), type(value).__name__))
+
+    def arguments(self, values):
+        args = []
+        for name, kind in self.inputs.items():
+            self.check(self.name, name, values[name], kind)
+            args.append(values[name])
+        return args
+
+    def unpack(self, result):
+        if len(self.outputs) == 1:
+            result = (result,)
+        outputs = dict(zip(self.outputs, result))
+        for name, kind in self.outputs.items():
+            self.check(self.name, name, outputs.get(name), kind)
+        return outputs
+
+
+class StageContext:
+    """
+    То, с чем работают этапы: Tools, заблаговременный поиск и блокировка браузера.
+    Один контекст на Tools на всё время его жизни (см. stage_context): этап, остановленный по времени,
+    продолжает держать блокировку, пока не вернётся, и следующий этап в этом браузере его дождётся.
+    """
+    def __init__(self, tools, speculation=None):
+        """
+        :param tools: Tools | Future - Future, пока браузер запускается; этапы дождутся его сами
+        :param speculation: SpeculativeLookup | None
+        """
+        self._tools = tools
+        self.speculation = speculation
+        self.driver_lock = threading.Lock()
+
+    @property
+    def tools(self):
+        if isinstance(self._tools, Future):
+            with tracing.span('wait:browser'):
+                self._tools = self._tools.result()
+        return self._tools
+
+    def interrupt(self):
+        """
+        Прерывание загрузки страницы, если браузер уже запущен; блокировку браузера не ждёт.
+        """
+        if isinstance(self._tools, Future) and not self._tools.done():
+            return
+        self.tools.interrupt()
+
+    def wait_idle(self, timeout=None):
+        """
+        Ожидание, пока браузером не перестанет пользоваться этап (в том числе остановленный по времени).
+        :return: bool - браузер свободен
+        """
+        if not self.driver_lock.acquire(timeout=-1 if timeout is None else timeout):
+            return False
+        self.driver_lock.release()
+        return True
+
+
+# Контексты экземпляров Tools: блокировка браузера должна жить столько же, сколько сам браузер
+_contexts = weakref.WeakKeyDictionary()
+_contexts_lock = threading.Lock()
+
+
+def stage_context(tools, speculation=None):
+    """
+    Контекст этапов для Tools; при повторных вызовах - тот же самый.
+    :param speculation: SpeculativeLookup | None - заменяет заблаговременный поиск контекста, если задан
+    """
+    with _contexts_lock:
+        context = _contexts.get(tools)
+        if context is None:
+            context = _contexts[tools] = StageContext(tools)
+    if speculation is not None:
+        context.speculation = speculation
+    return context
+
+
+def tools_stage(method):
+    """
+    Этап из метода Tools, который сообщает результат в tools.results_queue.
+    Под блокировкой браузера в очереди бывает только результат текущего этапа.
+    """
+    def call(context, *args):
+        tools = context.tools
+        # результат этапа, который вернулся уже после остановки по времени, к этому этапу не относится
+        while not tools.results_queue.empty():
+            tools.results_queue.get_nowait()
+        getattr(tools, method)(*args)
+        try:
+            status, stage, results = tools.results_queue.get_nowait()
+        except queue.Empty:
+            raise StageError(method, 'error', 'Этап не сообщил результат')
+        if status != 'success':
+            raise StageError(stage, status, results)
+        return results
+    return call
+
+
+def goszakupki_query(context, name):
+    return context.tools.goszakupki_query(name)
+
+
+def goszakupki_search(context, query, characteristics):
+    prefetched = context.speculation.take(query) if context.speculation is not None else None
+    return tools_stage('get_goszakupki_links')(context, query, characteristics, prefetched)
+
+
+# Этапы поиска товара: ситилинк -> характеристики -> позиция КТРУ -> значения характеристик
+PRODUCT_STAGES = [
+    Stage('citilink_search', tools_stage('get_citilink_url'),
+          {'query': str}, {'citilink_url': str}, timeout=60),
+    Stage('citilink_parsing', tools_stage('citilink_parsing'),
+          {'citilink_url': str}, {'name': str, 'price': str, 'characteristics': dict}, timeout=60),
+    Stage('goszakupki_query', goszakupki_query,
+          {'name': str}, {'goszakupki_query': str}, driver=False),
+    Stage('goszakupki_search', goszakupki_search,
+          {'goszakupki_query': str, 'characteristics': dict}, {'goszakupki_url': str, 'goszakupki_name': str},
+          timeout=120),
+    # сюда входит и ожидание модели векторизации, если она ещё загружается
+    Stage('goszakupki_parsing', tools_stage('match_params'),
+          {'characteristics': dict, 'goszakupki_url': str}, {'rows': list}, timeout=180),
+]
+
+
+class PipelineRun:
+    """
+    Один запуск пайплайна: значения, оставшиеся этапы и Future с итогом.
+    """
+    def __init__(self, scheduler, context, values, stages, on_event):
+        self.scheduler = scheduler
+        self.context = context
+        self.values = values
+        self.pending = list(stages)
+        self.running = set()
+        self.on_event = on_event
+        self.future = Future()
+        self._lock = threading.Lock()
+
+    def emit(self, status, stage, results):
+        if self.on_event is not None:
+            self.on_event(status, stage, results)
+
+    def advance(self):
+        with self._lock:
+            if self.future.done():
+                return
+            ready = [stage for stage in self.pending if all(name in self.values for name in stage.inputs)]
+            for stage in ready:
+                self.pending.remove(stage)
+                self.running.add(stage.name)
+            finished = not self.pending and not self.running
+
+        if finished:
+            self.future.set_result(self.values)
+        for stage in ready:
+            try:
+                args = stage.arguments(self.values)
+            except TypeError as e:
+                self.fail(StageError(stage.name, 'error', str(e)))
+                return
+            self.scheduler.executors[stage.name].submit(self.execute, stage, args).add_done_callback(
+                lambda future, stage_=stage: self.finish(stage_, future)
+            )
+
+    def execute(self, stage, args):
+        if not stage.driver:
+            return stage.unpack(stage.call(self.context, *args))
+
+        with tracing.span('wait:driver', stage=stage.name):
+            self.context.driver_lock.acquire()
+        try:
+            # пока этап ждал браузер, запуск мог быть остановлен другим этапом
+            if self.future.done():
+                return None
+            self.context.tools
+            timer = None
+            if stage.timeout:
+                timer = threading.Timer(stage.timeout, self.time_out, (stage,))
+                timer.daemon = True
+                timer.start()
+            self.emit('started', stage.name, '')
+            try:
+                return stage.unpack(stage.call(self.context, *args))
+            finally:
+                if timer is not None:
+                    timer.cancel()
+        finally:
+            self.context.driver_lock.release()
+
+    def finish(self, stage, future):
+        try:
+            outputs = future.result()
+        except StageError as e:
+            self.fail(e)
+            return
+        except Exception as e:
+            logger.exception('Ошибка на этапе %s' % stage.name)
+            self.fail(StageError(stage.name, 'error', '%s: %s' % (type(e).__name__, e)))
+            return
+
+        with self._lock:
+            # результат после остановки по времени или ошибки другого этапа не нужен
+            if self.future.done() or outputs is None:
+                return
+            self.values.update(outputs)
+            self.running.discard(stage.name)
+
+        self.emit('success', stage.name, outputs)
+        self.advance()
+
+    def fail(self, error):
+        with self._lock:
+            if self.future.done():
+                return
+            self.future.set_exception(error)
+        self.emit(error.status, error.stage, error.results)
+
+    def time_out(self, stage):
+        logger.warning('Этап %s не завершился за %s с' % (stage.name, stage.timeout))
+        self.fail(StageError(stage.name, 'timeout', 'Этап не завершился за %s с' % stage.timeout))
+        self.context.interrupt()
+
+
+class Scheduler:
+    """
+    Запуск этапов по графу их входов и выходов, у каждого этапа свой исполнитель.
+    """
+    def __init__(self, stages=None, workers=None):
+        """
+        :param stages: list[Stage] | None - граф этапов; None - PRODUCT_STAGES
+        :param workers: int | None - потоков у каждого этапа вместо Stage.workers
+                        (например, по числу браузеров в пакетном режиме)
+        """
+        stages = PRODUCT_STAGES if stages is None else stages
+        self.stages = {stage.name: stage for stage in stages}
+
+        # у каждого значения один этап, который его даёт
+        self.producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError('%s даёт и этап %s, и этап %s' % (output, self.producers[output].name, stage.name))
+                self.producers[output] = stage
+
+        self.executors = {
+            stage.name: ThreadPoolExecutor(max_workers=workers or stage.workers, thread_name_prefix=stage.name)
+            for stage in stages
+        }
+        # вызовы Tools вне графа (выбор значения из интерфейса) под той же блокировкой браузера
+        self._calls = ThreadPoolExecutor(max_workers=1, thread_name_prefix='driver_call')
+
+    def plan(self, values, targets):
+        """
+        Этапы, нужные, чтобы получить targets из values, в порядке зависимостей.
+        """
+        stages = []
+        visiting = set()
+
+        def need(name):
+            if name in values:
+                return
+            stage = self.producers.get(name)
+            if stage is None:
+                raise ValueError('Нет ни значения, ни этапа для %s' % name)
+            if stage in stages:
+                return
+            if stage.name in visiting:
+                raise ValueError('Этапы зацикливаются на %s' % stage.name)
+            visiting.add(stage.name)
+            for input_name in stage.inputs:
+                need(input_name)
+            visiting.discard(stage.name)
+            stages.append(stage)
+
+        for target in targets:
+            need(target)
+        return stages
+
+    def submit(self, context, values, targets, on_event=None):
+        """
+        Запуск этапов, нужных для targets.
+        :param context: StageContext
+        :param values: dict - известные значения, например {'query': 'ноутбук'}
+        :param targets: list[str] - значения, которые нужно получить
+        :param on_event: callable(status, stage, results) | None - вызывается из рабочих потоков:
+                         'started' перед этапом, 'success' с его выходами {имя: значение};
+                         'stopped' / 'fail' / 'timeout' / 'error' с результатом этапа, после чего запуск завершается
+        :return: Future - все значения запуска или StageError
+        """
+        run = PipelineRun(self, context, dict(values), self.plan(values, targets), on_event)
+        run.advance()
+        return run.future
+
+    def run(self, context, values, targets, on_event=None):
+        """
+        Синхронный запуск, см. submit.
+        :return: dict - все значения запуска
+        """
+        return self.submit(context, values, targets, on_event).result()
+
+    def call(self, context, method, *args):
+        """
+        Вызов метода Tools вне графа этапов, когда браузер не занят этапом.
+        :return: Future
+        """
+        def target():
+            with context.driver_lock:
+                return getattr(context.tools, method)(*args)
+        return self._calls.submit(target)
+
+    def close(self):
+        for executor in list(self.executors.values()) + [self._calls]:
+            executor.shutdown(wait=False)
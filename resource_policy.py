@@ -0,0 +1,121 @@
+from collections import Counter
+from urllib.parse import urlparse
+
+from logging_config import logger
+
+
+def by_extension(*extensions):
+    """
+    Шаблоны для файлов с расширениями: и с параметрами в адресе (/img/x.png?v=3 - так отдают картинки CDN),
+    и без них - шаблон '*.png' адрес с параметрами не покрывает.
+    """
+    return [pattern for extension in extensions for pattern in ('*.' + extension, '*.' + extension + '?*')]
+
+
+IMAGES = by_extension('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'ico', 'bmp')
+FONTS = by_extension('woff', 'woff2', 'ttf', 'otf', 'eot')
+MEDIA = by_extension('mp4', 'webm', 'mp3')
+TRACKERS = [
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*googlesyndication.com*',
+    '*mc.yandex.ru*', '*an.yandex.ru*', '*yandex.ru/ads*', '*top-fwz1.mail.ru*', '*vk.com/rtrg*',
+    '*criteo.*', '*adriver.ru*', '*mindbox.ru*', '*flocktory.com*', '*retailrocket.ru*',
+    '*gdeslon.ru*', '*admitad.com*', '*hotjar.com*', '*sentry.io*',
+]
+
+# Что блокировать по умолчанию
+DEFAULT_BLOCKED = IMAGES + FONTS + MEDIA + TRACKERS
+
+# Шаблоны, которые нельзя блокировать на конкретном сайте.
+# На госзакупках иконки кнопок (в т.ч. «Копировать характеристики») - svg, svg в список блокировки не входят;
+# шрифты оставлены, потому что от них зависит раскладка и кликабельность n-button.
+DEFAULT_ALLOW = {
+    'moy-zakupki.ru': FONTS,
+}
+
+# Типичный размер заблокированных ресурсов, байт - для оценки сэкономленного трафика,
+# пока не измерены реальные размеры на незаблокированных загрузках
+TYPICAL_SIZE = {
+    'Image': 40_000,
+    'Font': 60_000,
+    'Media': 500_000,
+    'Script': 60_000,
+    'XHR': 2_000,
+    'Fetch': 2_000,
+    'Other': 5_000,
+}
+
+
+def site_of(url):
+    host = urlparse(url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+
+class ResourcePolicy:
+    """
+    Блокировка ненужных для парсинга ресурсов через CDP Network.setBlockedURLs.
+    Список шаблонов выставляется перед каждым переходом на другой сайт с учётом его allowlist.
+    """
+    def __init__(self, blocked=None, allow=None, report=False):
+        """
+        :param blocked: list[str] | None - шаблоны URL для блокировки (* - любая подстрока)
+        :param allow: dict | None - {сайт: [шаблоны, которые на нём не блокируются]}
+        :param report: bool - собирать отчёт о заблокированных запросах (нужен лог performance)
+        """
+        self.blocked = list(DEFAULT_BLOCKED if blocked is None else blocked)
+        self.allow = DEFAULT_ALLOW if allow is None else allow
+        self.report_enabled = report
+
+        # выставленные шаблоны по браузерам: одна политика может обслуживать несколько браузеров
+        self._applied = {}
+        self._requests = {}
+        self._page = Counter()
+        self._observed_size = {}
+
+    def patterns_for(self, url):
+        allowed = set(self.allow.get(site_of(url), []))
+        return [pattern for pattern in self.blocked if pattern not in allowed]
+
+    def attach(self, driver, network_log=None):
+        driver.execute_cdp_cmd('Network.enable', {})
+        if network_log is not None and self.report_enabled:
+            network_log.listen(self.on_event)
+
+    def apply(self, driver, url):
+        """
+        Выставление шаблонов блокировки для сайта перед переходом на url.
+        """
+        patterns = self.patterns_for(url)
+        if patterns != self._applied.get(driver.session_id):
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+            self._applied[driver.session_id] = patterns
+        self._page = Counter()
+        self._requests = {}
+
+    def on_event(self, method, params):
+        if method == 'Network.requestWillBeSent':
+            self._requests[params['requestId']] = params.get('type', 'Other')
+            self._page['requests'] += 1
+        elif method == 'Network.loadingFinished':
+            size = params.get('encodedDataLength', 0)
+            resource_type = self._requests.get(params['requestId'], 'Other')
+            self._page['bytes_loaded'] += size
+            # скользящая оценка размера ресурса этого типа
+            previous = self._observed_size.get(resource_type, size)
+            self._observed_size[resource_type] = 0.9 * previous + 0.1 * size
+        elif method == 'Network.loadingFailed' and params.get('blockedReason') == 'inspector':
+            resource_type = params.get('type') or self._requests.get(params['requestId'], 'Other')
+            self._page['blocked'] += 1
+            self._page['blocked_' + resource_type] += 1
+            self._page['bytes_saved_estimate'] += int(
+                self._observed_size.get(resource_type, TYPICAL_SIZE.get(resource_type, 5_000))
+            )
+
+    def page_report(self, url=''):
+        """
+        Отчёт по последней странице: всего запросов, заблокировано (по типам), загружено байт
+        и оценка сэкономленных байт.
+        """
+        report = dict(self._page)
+        if report:
+            logger.debug('Ресурсы %s: %s' % (url, report))
+        return report
@@ -0,0 +1,92 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from logging_config import logger
+from resource_policy import ResourcePolicy
+from tools import Tools
+
+
+class SpeculativeLookup:
+    """
+    Заблаговременный поиск позиции на госзакупках во втором браузере.
+
+    Укрупнённая позиция и список уточнений КТРУ зависят только от типа товара, который обычно
+    известен уже из запроса пользователя. Поиск запускается параллельно со сбором характеристик
+    на ситилинке, а когда характеристики пришли, результат либо подтверждается (тип товара совпал),
+    либо отбрасывается.
+    """
+    def __init__(self, cancel_flag, embedder, **tools_kwargs):
+        """
+        :param cancel_flag: threading.Event - флаг остановки
+        :param embedder: EmbedChunks | Future - общая модель векторизации (или её загрузка в фоне)
+        :param tools_kwargs: параметры Tools для второго браузера - те же, что у основного
+        """
+        self.cancel_flag = cancel_flag
+        self.embedder = embedder
+        policy = tools_kwargs.get('resource_policy')
+        if isinstance(policy, ResourcePolicy):
+            # политика хранит состояние текущей страницы, поэтому у второго браузера своя - с теми же правилами
+            tools_kwargs['resource_policy'] = ResourcePolicy(policy.blocked, policy.allow)
+        self.tools_kwargs = tools_kwargs
+
+        self.tools = None
+        # один поток - второй браузер выполняет поиски по очереди
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.query = None
+        self.future = None
+
+    @staticmethod
+    def guess_query(text):
+        """
+        Предполагаемый тип товара по запросу пользователя, например "Ноутбук ASUS X543" -> "ноутбук".
+        :return: str | None - None, если в запросе нет русских слов
+        """
+        try:
+            return Tools.goszakupki_query(text)
+        except IndexError:
+            return None
+
+    def _find(self, query):
+        # браузер запускается в фоне при первом поиске, чтобы не задерживать основной
+        if self.tools is None:
+            self.tools = Tools(queue.Queue(), self.cancel_flag, embedder=self.embedder, **self.tools_kwargs)
+        return self.tools.find_ktru_refinements(query)
+
+    def start(self, query):
+        """
+        Запуск поиска по предполагаемому типу товара.
+        """
+        self.discard()
+        if not query:
+            return
+        logger.debug('Заранее ищу позицию на госзакупках по запросу %s' % query)
+        self.query = query
+        self.future = self.executor.submit(self._find, query)
+
+    def take(self, query):
+        """
+        Результат заблаговременного поиска, если он запускался по тому же запросу.
+        :param query: str - тип товара, полученный из характеристик ситилинка
+        :return: Future | None - None, если предположение не подтвердилось
+        """
+        future, expected = self.future, self.query
+        self.future, self.query = None, None
+
+        if future is None:
+            return None
+        if expected != query:
+            logger.debug('Предположение "%s" не подтвердилось (нужно "%s"), результат отброшен' % (expected, query))
+            future.cancel()
+            return None
+        return future
+
+    def discard(self):
+        if self.future is not None:
+            self.future.cancel()
+        self.future, self.query = None, None
+
+    def close(self):
+        self.discard()
+        self.executor.shutdown(wait=False)
+        if self.tools is not None:
+            self.tools.close()
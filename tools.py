@@ -1,6 +1,5 @@
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-import time
 from selenium.webdriver.chrome.options import Options
 import re
 import numpy as np
@@ -8,25 +7,178 @@ from selenium.webdriver import ActionChains
 
 import queue
 from embeddings_model import EmbedChunks
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from logging_config import logger
+from waits import PageWaiter, Cancelled
+from page_cache import PageCache
+from ktru_mirror import KtruMirror
+from network_log import NetworkLog, LOGGING_PREFS
+from json_capture import JsonCapture, extract_characteristics, extract_refinements
+from resource_policy import ResourcePolicy
+import tracing
+from value_index import ValueIndex, normalize_value
+import chrome_launcher
+import os
+import json
+import functools
+import http.client
+from urllib.parse import urlparse
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from citilink_http import CitilinkHttp, CitilinkFetchError
+from page_scripts import CITILINK_SEARCH_LINK_XPATH, CITILINK_PARAMS_XPATH, CITILINK_EXTRACT_JS, \
+    GOSZAKUPKI_ROWS_XPATH, GOSZAKUPKI_ROWS_JS, GOSZAKUPKI_APPLY_JS
+
+# Каталог для локальных кэшей приложения
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+# Способы сопоставления характеристик КТРУ с характеристиками ситилинка:
+# 'assignment' - один к одному по общей матрице близости, 'nearest' - ближайшая для каждой строки отдельно
+MATCHING_MODES = ('assignment', 'nearest')
+
+# Способы получения страниц ситилинка: 'browser' - через Chrome, 'http' - HTTP-запросом без браузера
+# (при защите от ботов или незнакомой разметке - через Chrome)
+CITILINK_FETCH_MODES = ('browser', 'http')
+
+# Минимальная косинусная близость названий для пары в режиме assignment. Порог не откалиброван:
+# у e5 близость почти любых названий характеристик выше 0.75, поэтому он отсекает лишь явный мусор.
+# Подбирать по размеченному набору: bench_matching.py --min-similarity 0.75,0.8,0.85,0.9
+ASSIGNMENT_MIN_SIMILARITY = 0.75
+
+# Как часто проверяется флаг остановки при ожидании модели или заблаговременного поиска, с
+FUTURE_POLL_INTERVAL = 0.2
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 11.0; Win64; x64) " \
+             "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Адреса сайтов; бенчмарки подменяют их адресами локального сервера с сохранёнными страницами
+BASE_URLS = {
+    'citilink': 'https://www.citilink.ru',
+    'goszakupki': 'https://moy-zakupki.ru',
+}
+
+
+def cancellable_stage(stage):
+    """
+    Этап, остановленный посреди ожидания (waits.Cancelled), прерывает загрузку страницы
+    и сообщает в очередь 'stopped', как и при остановке между этапами.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                with tracing.span(stage):
+                    return method(self, *args, **kwargs)
+            except Cancelled:
+                logger.info('Этап %s остановлен' % stage)
+                self.interrupt()
+                self.results_queue.put(('stopped', stage, ''))
+        return wrapper
+    return decorator
+
+
+def create_embedder(backend='torch'):
+    """
+    Модель векторизации, которую используют этапы Tools.
+    Одну модель можно разделить между несколькими экземплярами Tools.
+    """
+    return EmbedChunks('intfloat/multilingual-e5-small',
+                       cache_dir=os.path.join(CACHE_DIR, 'embeddings'),
+                       backend=backend)
 
 
 class Tools:
-    def __init__(self, results_queue, cancel_flag, browser_window=False):
-        options = Options()
-        if not browser_window:
-            options.add_argument("--headless")  # работа без открытия браузера
-            options.add_argument("--window-size=1920,1080")
-            options.add_argument("--enable-experimental-web-platform-features")
-
-        options.add_argument(
-            "user-agent=Mozilla/5.0 (Windows NT 11.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        )
+    def __init__(self, results_queue, cancel_flag, browser_window=False, embedding_backend='torch',
+                 extraction_mode='script', embedder=None, page_cache=True, cache_bypass=False, ktru_mirror=True,
+                 resource_policy=True, page_load_strategy='none', base_urls=None, matching='assignment',
+                 profile_dir=None, debugger_address=None, json_capture=True, citilink_fetch='browser'):
+        """
+        :param results_queue: queue.Queue - очередь для результатов этапов
+        :param cancel_flag: threading.Event - флаг остановки
+        :param browser_window: bool - показывать окно браузера
+        :param embedding_backend: str - бэкенд модели векторизации ('torch' / 'onnx')
+        :param extraction_mode: str - 'script' или 'selenium', см. citilink_extract_script
+        :param embedder: EmbedChunks | Future | None - общая модель векторизации; None - создаётся своя;
+                         Future - модель ещё загружается в фоне, её дождётся первый этап, которому она нужна
+        :param page_cache: bool | PageCache - кэш разобранных страниц; True - общий файл в CACHE_DIR
+        :param cache_bypass: bool - не читать из кэша страниц и зеркала КТРУ (свежие результаты всё равно сохраняются)
+        :param ktru_mirror: bool | KtruMirror - локальное зеркало КТРУ; True - файл в CACHE_DIR, False - без зеркала
+        :param resource_policy: bool | ResourcePolicy - блокировка картинок, шрифтов и трекеров;
+                                True - ResourcePolicy по умолчанию, False - загружать всё
+        :param page_load_strategy: str - стратегия загрузки страниц WebDriver ('none', 'eager', 'normal')
+        :param base_urls: dict | None - адреса сайтов, дополняет BASE_URLS
+        :param matching: str - способ сопоставления характеристик, см. MATCHING_MODES
+        :param profile_dir: bool | str | None - постоянный профиль Chrome с HTTP-кэшем на диске;
+                            True - CACHE_DIR/chrome-profile, None - временный профиль на каждый запуск
+        :param debugger_address: str | None - адрес отладки уже запущенного Chrome ('127.0.0.1:9222');
+                                 локальный Chrome запускается через chrome_launcher, если ещё не запущен
+        :param json_capture: bool - брать уточнения и таблицы КТРУ из ответов API госзакупок (события DevTools);
+                             без подходящего ответа данные собираются со страницы
+        :param citilink_fetch: str - способ получения страниц ситилинка, см. CITILINK_FETCH_MODES
+        """
+        if matching not in MATCHING_MODES:
+            raise ValueError('Неизвестный способ сопоставления %s, доступны: %s'
+                             % (matching, ', '.join(MATCHING_MODES)))
+        if citilink_fetch not in CITILINK_FETCH_MODES:
+            raise ValueError('Неизвестный способ получения страниц ситилинка %s, доступны: %s'
+                             % (citilink_fetch, ', '.join(CITILINK_FETCH_MODES)))
+        self.matching = matching
+        self.base_urls = dict(BASE_URLS, **(base_urls or {}))
+        self.resource_policy = ResourcePolicy() if resource_policy is True else resource_policy or None
+
+        if profile_dir is True:
+            profile_dir = os.path.join(CACHE_DIR, 'chrome-profile')
 
-        self.driver = webdriver.Chrome(options=options)
+        options = Options()
+        # driver.get не ждёт подресурсов, готовность страниц проверяется в PageWaiter с учётом флага остановки
+        options.page_load_strategy = page_load_strategy
+
+        self.attached = debugger_address is not None
+        if self.attached:
+            # подключение к постоянному Chrome: аргументы командной строки уже заданы при его запуске
+            if debugger_address.split(':')[0] in ('127.0.0.1', 'localhost'):
+                chrome_launcher.launch(profile_dir or os.path.join(CACHE_DIR, 'chrome-profile'),
+                                       int(debugger_address.split(':')[1]), headless=not browser_window)
+            options.debugger_address = debugger_address
+        else:
+            if not browser_window:
+                options.add_argument("--headless")  # работа без открытия браузера
+                options.add_argument("--window-size=1920,1080")
+                options.add_argument("--enable-experimental-web-platform-features")
+
+            options.add_argument("user-agent=" + USER_AGENT)
+
+            # постоянный профиль: DNS, TLS-сессии и HTTP-кэш сайтов сохраняются между запусками
+            if profile_dir:
+                profile_dir = chrome_launcher.reserve_profile_dir(profile_dir)
+                options.add_argument("--user-data-dir=" + os.path.abspath(profile_dir))
+                options.add_argument("--disk-cache-size=%d" % chrome_launcher.DISK_CACHE_SIZE)
+
+        # отчёт о заблокированных ресурсах и ответы API строятся по событиям DevTools из лога performance
+        if json_capture or self.resource_policy is not None and self.resource_policy.report_enabled:
+            options.set_capability('goog:loggingPrefs', LOGGING_PREFS)
+
+        # занятый каталог профиля освобождается в close()
+        self.profile_dir = profile_dir if profile_dir and not self.attached else None
+        try:
+            self.driver = webdriver.Chrome(options=options)
+        except Exception:
+            if self.profile_dir:
+                chrome_launcher.release_profile_dir(self.profile_dir)
+            raise
+        if self.attached:
+            # у каждого подключения своя вкладка, чтобы пул и второй браузер не мешали друг другу
+            self.driver.switch_to.new_window('tab')
+            self.driver.execute_cdp_cmd('Network.setUserAgentOverride', {'userAgent': USER_AGENT})
+        self.network_log = NetworkLog(self.driver)
+
+        if self.resource_policy is not None:
+            self.resource_policy.attach(self.driver, self.network_log)
+
+        # Ответы API госзакупок, из которых берутся уточнения и таблицы КТРУ
+        self.json_capture = None
+        if json_capture:
+            self.json_capture = JsonCapture(self.driver, self.network_log, urlparse(self.base_urls['goszakupki']).hostname)
 
         # уходим от флага --disable-features=IsolateOrigins, если он где-то добавлен
         self.driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
@@ -39,25 +191,134 @@ class Tools:
         self.driver.execute_cdp_cmd(
             "Browser.grantPermissions",
             {
-                "origin": "https://moy-zakupki.ru",
+                "origin": self.base_urls['goszakupki'],
                 "permissions": [
                     "clipboardReadWrite",
                     "clipboardSanitizedWrite"
                 ]
             }
         )
+        # 'script' - сбор данных со страницы одним execute_script, 'selenium' - обход элементов
+        self.extraction_mode = extraction_mode
+
+        # Ожидание готовности страниц с замером фактического времени ожиданий
+        self.waiter = PageWaiter(self.driver, cancel_flag=cancel_flag)
+
+        # Кэш разобранных страниц ситилинка и КТРУ
+        self.page_cache = PageCache(os.path.join(CACHE_DIR, 'pages.sqlite')) if page_cache is True \
+            else page_cache or None
+        self.cache_bypass = cache_bypass
+
+        # Локальное зеркало КТРУ: позиции и таблицы берутся из него без браузера и пополняются из браузера
+        self.ktru_mirror = KtruMirror(os.path.join(CACHE_DIR, 'ktru.sqlite')) if ktru_mirror is True \
+            else ktru_mirror or None
+
+        # Получение страниц ситилинка без браузера; None - только через браузер
+        self.citilink_http = None
+        if citilink_fetch == 'http':
+            try:
+                self.citilink_http = CitilinkHttp(self.base_urls['citilink'], USER_AGENT)
+            except ImportError as e:
+                logger.warning('Для получения страниц ситилинка без браузера нужен lxml, использую браузер: %s' % e)
+
+        # Обратный индекс значений характеристик текущего товара, см. value_index_for
+        self._value_index = None
+
         self.results_queue: queue.Queue = results_queue
         self.cancel_flag = cancel_flag
-        self.get_embedding = EmbedChunks('intfloat/multilingual-e5-small')
+        self._embedder = embedder if embedder is not None else create_embedder(embedding_backend)
+
+    @property
+    def get_embedding(self):
+        if isinstance(self._embedder, Future):
+            self._embedder = self.wait_future(self._embedder, 'embedder')
+        return self._embedder
+
+    def wait_future(self, future, name):
+        """
+        Результат Future (загрузка модели, заблаговременный поиск) с проверкой флага остановки.
+        :raise Cancelled: поиск остановлен, пока результата ещё нет
+        """
+        with tracing.span('wait:' + name):
+            while True:
+                try:
+                    return future.result(timeout=FUTURE_POLL_INTERVAL)
+                except FutureTimeoutError:
+                    if self.check_cancelled():
+                        raise Cancelled(name)
+
+    def cache_get(self, source, key):
+        if self.page_cache is None or self.cache_bypass:
+            return None
+        return self.page_cache.get(source, key)
+
+    def cache_put(self, source, key, value):
+        if self.page_cache is not None:
+            self.page_cache.put(source, key, value)
+
+    def open(self, url):
+        """
+        Переход на страницу с политикой загрузки ресурсов для её сайта.
+        """
+        with tracing.span('navigation', url=url):
+            if self.resource_policy is not None:
+                self.resource_policy.apply(self.driver, url)
+            if self.json_capture is not None:
+                # события прошлой страницы не должны попасть в ответы новой
+                self.network_log.drain()
+                self.json_capture.reset()
+
+            # при стратегии none driver.get не ждёт загрузки - ждём сами, проверяя флаг остановки
+            token = self.waiter.mark_document()
+            self.driver.get(url)
+            self.waiter.navigation(token)
+
+        if self.resource_policy is not None and self.resource_policy.report_enabled:
+            self.network_log.drain()
+            self.resource_policy.page_report(url)
+
+    def close(self):
+        """
+        Закрытие браузера; у постоянного Chrome закрывается только своя вкладка, сам он продолжает работать.
+        """
+        if self.citilink_http is not None:
+            self.citilink_http.close()
+        try:
+            if self.attached:
+                self.driver.close()
+            self.driver.quit()
+        except Exception as e:
+            pass
+        if self.profile_dir:
+            chrome_launcher.release_profile_dir(self.profile_dir)
+
+    def interrupt(self):
+        """
+        Прерывание загрузки страницы и её запросов при нажатии "Остановить".
+        """
+        try:
+            self.driver.execute_script('window.stop();')
+        except Exception as e:
+            pass
 
     def check_cancelled(self):
         if self.cancel_flag and self.cancel_flag.is_set():
             return True
         return False
 
+    @staticmethod
+    def goszakupki_query(product_name):
+        """
+        Запрос для поиска на госзакупках: тип товара из его названия на ситилинке,
+        например "Ноутбук ASUS X543, 15.6" -> "ноутбук"
+        """
+        return re.findall(r'[а-я ]+', product_name.lower())[0].strip()
+
+    @tracing.traced('click')
     def click_url(self, url):
         self.driver.execute_script("arguments[0].click();", url)
 
+    @cancellable_stage('get_citilink_url')
     def get_citilink_url(self, product_name):
         """
         Находим URL товара на ситилинк по имени
@@ -71,15 +332,32 @@ class Tools:
 
         logger.info('Ищу url товара на citilink по запросу: %s' % product_name)
 
-        self.driver.get(f"https://www.citilink.ru/search/?text={product_name}")
+        url = None
+        if self.citilink_http is not None:
+            url = self.citilink_fetch('fetch:citilink_search', self.citilink_http.search, product_name)
 
-        product = WebDriverWait(self.driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, '//div[@data-meta-name="SnippetProductVerticalLayout"]/a[1]'))
-        )
-        url = product.get_attribute('href')
+        if url is None:
+            self.open(f"{self.base_urls['citilink']}/search/?text={product_name}")
+
+            product = self.waiter.until('citilink_search', EC.presence_of_element_located(
+                (By.XPATH, CITILINK_SEARCH_LINK_XPATH)
+            ))
+            url = product.get_attribute('href')
 
         self.results_queue.put(('success', 'citilink_search', url))
 
+    def citilink_fetch(self, stage, method, *args):
+        """
+        Вызов CitilinkHttp; при ошибке или незнакомой странице - None, и этап выполняется в браузере.
+        """
+        try:
+            with tracing.span(stage):
+                return method(*args)
+        except (CitilinkFetchError, http.client.HTTPException, OSError) as e:
+            logger.warning('Не удалось получить страницу ситилинка без браузера, перехожу на браузер: %s' % e)
+            return None
+
+    @cancellable_stage('citilink_parsing')
     def citilink_parsing(self, product_url):
         """
         Находим товар на ситилинк, парсим характеристики.
@@ -92,176 +370,299 @@ class Tools:
             self.results_queue.put(('stopped', 'citilink_parsing', ''))
             return
 
-        self.driver.get(product_url)
+        result = self.cache_get('citilink', product_url)
 
-        name = self.driver.find_element(by=By.XPATH, value="//h1").text
-        price = self.driver.find_element(by=By.XPATH, value='//div[@data-meta-name="PriceBlock__price"]').text
+        if result is None and self.citilink_http is not None:
+            result = self.citilink_fetch('fetch:citilink_product', self.citilink_http.product, product_url)
+            if result is not None:
+                self.cache_put('citilink', product_url, list(result))
 
-        search_button = self.driver.find_element(by=By.XPATH, value="//button[.//text()='Все характеристики']")
+        if result is None:
+            self.open(product_url)
 
-        while True:
-            self.driver.execute_script("window.scrollBy(0,100)", "")
-            time.sleep(0.5)
-            try:
-                search_button.click()
-            except Exception as e:
-                continue
-            break
+            self.waiter.scroll_and_click('citilink_all_chars', (By.XPATH, "//button[.//text()='Все характеристики']"))
+
+            self.waiter.until('citilink_chars', EC.presence_of_element_located((By.XPATH, CITILINK_PARAMS_XPATH)))
+
+            if self.extraction_mode == 'script':
+                result = self.citilink_extract_script()
+            if result is None:
+                result = self.citilink_extract_selenium()
+
+            if result[2]:
+                self.cache_put('citilink', product_url, list(result))
+
+        name, price, parameters = result
+
+        self.results_queue.put(('success', 'citilink_parsing', [name, price, parameters]))
+
+    @tracing.traced('extract:citilink_script')
+    def citilink_extract_script(self):
+        """
+        Сбор названия, цены и характеристик товара одним вызовом execute_script.
+        :return: (name, price, parameters) или None, если разметка не распознана
+        """
+        try:
+            data = json.loads(self.driver.execute_script(CITILINK_EXTRACT_JS, CITILINK_PARAMS_XPATH))
+        except Exception as e:
+            logger.warning('Не удалось собрать характеристики скриптом, перехожу на обход элементов: %s' % e)
+            return None
+
+        if not data['name'] or not data['params']:
+            logger.warning('Скрипт не нашёл характеристики на странице, перехожу на обход элементов')
+            return None
 
         parameters = {}
+        for name_, value in data['params']:
+            parameters[name_] = value
 
-        params_name = []
-        param_value = []
+        return data['name'], data['price'], parameters
 
-        ul_elements = WebDriverWait(self.driver, 10).until(
-            EC.presence_of_all_elements_located((By.XPATH, "//ul[li/div/div and li/div/span]"))
-        )
+    @tracing.traced('extract:citilink_selenium')
+    def citilink_extract_selenium(self):
+        """
+        Сбор названия, цены и характеристик товара обходом элементов через WebDriver.
+        Медленный путь: каждое обращение к элементу - отдельный запрос к драйверу.
+        :return: (name, price, parameters)
+        """
+        name = self.driver.find_element(by=By.XPATH, value="//h1").text
+        price = self.driver.find_element(by=By.XPATH, value='//div[@data-meta-name="PriceBlock__price"]').text
+
+        parameters = {}
 
-        # ul_elements = self.driver.find_elements(By.XPATH, "//ul[li/div/div and li/div/span]")
+        ul_elements = self.driver.find_elements(By.XPATH, CITILINK_PARAMS_XPATH)
 
         # Извлечение текста из <div> и <span> внутри каждого <li>
         for ul in ul_elements:
             # Находим все <li> внутри <ul>
             li_elements = ul.find_elements(By.XPATH, ".//li")
             for li in li_elements:
-                # Извлекаем текст из <div> внутри <div>
-                div_text = li.find_elements(By.XPATH, ".//div/div")
-                for div in div_text:
-                    if div.text:
-                        params_name.append(div.text)
-
-                # Извлекаем текст из <span> внутри <div>
-                span_text = li.find_elements(By.XPATH, "./div/span")
-                for span in span_text:
-                    if span.text:
-                        param_value.append(span.text)
-
-        for name_, value in zip(params_name, param_value):
-            parameters[name_] = value
+                # Название и значение берём из одного <li>, чтобы пары не съезжали
+                param_name = [div.text for div in li.find_elements(By.XPATH, ".//div/div") if div.text]
+                param_value = [span.text for span in li.find_elements(By.XPATH, "./div/span") if span.text]
 
-        self.results_queue.put(('success', 'citilink_parsing', [name, price, parameters]))
+                if param_name and param_value:
+                    parameters[param_name[0]] = param_value[0]
+
+        return name, price, parameters
 
-    def get_goszakupki_links(self, product_name, choice_params):
+    @cancellable_stage('get_goszakupki_links')
+    def get_goszakupki_links(self, product_name, choice_params, prefetched=None):
         """
         Поиск укрупнённой позиции + возврат не укрупнённой
         :param product_name:
         :param choice_params:
+        :param prefetched: concurrent.futures.Future | None - заранее запущенный find_ktru_refinements
+                           (см. speculation.SpeculativeLookup); при ошибке поиск повторяется здесь
         :return:
         """
         if self.check_cancelled():
             self.results_queue.put(('stopped', 'get_goszakupki_links', ''))
             return
 
+        refinements = None
+        if prefetched is not None:
+            try:
+                refinements = self.wait_future(prefetched, 'speculation')
+                logger.info('Использую заранее найденную позицию на сайте госзакупки по запросу %s' % product_name)
+            except Cancelled:
+                raise
+            except Exception as e:
+                logger.warning('Заранее запущенный поиск на госзакупках не удался: %s' % e)
+
+        if refinements is None:
+            refinements = self.cache_get('ktru_search', product_name)
+
+        if refinements is None and self.ktru_mirror is not None and not self.cache_bypass:
+            refinements = self.ktru_mirror.find_refinements(product_name)
+
+        if refinements is None:
+            # найденное в браузере (и заранее во втором браузере) сохраняет сам find_ktru_refinements
+            refinements = self.find_ktru_refinements(product_name)
+
+        if refinements is None:
+            self.results_queue.put(('stopped', 'get_goszakupki_links', ''))
+            return
+
+        category, exact_products_dict = refinements
+
+        logger.debug('choice_params:\n%s' % str(choice_params))
+
+        _, top = self.get_embedding.match_many([category], list(choice_params.keys()))
+        res = top[0][0]
+
+        category_value = choice_params[res[0]]
+        refinements_by_value = {normalize_value(value): value for value in exact_products_dict}
+
+        # сначала ищем точное совпадение
+        if (exact := refinements_by_value.get(normalize_value(category_value))) is not None:
+            correct_ref, correct_name = exact_products_dict[exact]
+            self.results_queue.put(('success', 'goszakupki_search', [correct_ref, correct_name]))
+        elif (match := re.search(r'\d+', category_value)) is not None and \
+                (idx := self.closest_bound(float(match[0]), list(exact_products_dict.keys()))) is not None:
+            _, product_data = list(exact_products_dict.items())[idx]
+            correct_ref, correct_name = product_data
+            self.results_queue.put(('success', 'goszakupki_search', [correct_ref, correct_name]))
+        else:
+            self.results_queue.put(('fail', 'goszakupki_search', [category, exact_products_dict]))
+
+    @tracing.traced('find_ktru_refinements')
+    def find_ktru_refinements(self, product_name):
+        """
+        Поиск укрупнённой позиции на госзакупках и списка её уточнений КТРУ.
+        Не зависит от характеристик ситилинка, поэтому может выполняться заранее.
+        :param product_name: str - тип товара
+        Найденное записывается в кэш страниц и зеркало КТРУ; уточнения из ответа API - только после
+        сверки со списком на странице.
+        :return: (category, {значение: [ссылка, название]}) или None, если поиск остановлен
+        """
         logger.info('Ищу укрупнённую позицию товара на сайте госзакупки по запросу %s' % product_name)
 
-        self.driver.get("https://moy-zakupki.ru//")
+        self.open(self.base_urls['goszakupki'] + "//")
 
-        search_input = self.driver.find_element(by=By.CLASS_NAME, value='n-input__input-el')
+        search_input = self.waiter.until('goszakupki_search', EC.presence_of_element_located(
+            (By.CLASS_NAME, 'n-input__input-el')
+        ))
         search_input.send_keys(product_name)
 
         search_button = self.driver.find_elements(by=By.CLASS_NAME, value='n-button')
         search_button[0].click()
 
-        product = WebDriverWait(self.driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, '//div[div[@class="sm:flex justify-between"]]//a'))
-        )
+        product = self.waiter.until('goszakupki_search', EC.presence_of_element_located(
+            (By.XPATH, '//div[div[@class="sm:flex justify-between"]]//a')
+        ))
         # product = self.driver.find_elements(by=By.XPATH, value='//div[div[@class="sm:flex justify-between"]]//a')[0]
         product_link = product.get_attribute('href')
+        product_title = product.text
 
         if self.check_cancelled():
-            self.results_queue.put(('stopped', 'get_goszakupki_links', ''))
-            return
+            return None
 
-        self.driver.get(product_link)
+        self.open(product_link)
 
-        search_button = self.driver.find_element(by=By.XPATH, value='//button[.//span[text()="Уточните код КТРУ"]]')
+        search_button = self.waiter.until('goszakupki_ktru_list', EC.element_to_be_clickable(
+            (By.XPATH, '//button[.//span[text()="Уточните код КТРУ"]]')
+        ))
         search_button.click()
 
-        time.sleep(2)
+        # уточнения приходят ответом API раньше, чем список дорисуется на странице
+        source, refinements = self.waiter.until('goszakupki_ktru_list', functools.partial(
+            self.goszakupki_data, functools.partial(extract_refinements, base_url=self.base_urls['goszakupki']),
+            '//li[@class="hover:text-sky-500 mb-2"]'
+        ))
+        verified = True
+        if source == 'json':
+            live = self.live_refinements(refinements)
+            if live is False:
+                # список на странице так и не появился - уточнения из ответа используются, но не сохраняются
+                logger.warning('Уточнения КТРУ из ответа API не сверены со страницей и не сохраняются')
+                verified = False
+            elif live is not None:
+                logger.warning('Уточнения КТРУ из ответа API не совпадают со страницей, беру их со страницы')
+                refinements = live
+            category, exact_products_dict = refinements
+        else:
+            # список уточнений дорисовывается постепенно - ждём окончания перерисовки
+            self.waiter.dom_quiet('goszakupki_ktru_list')
+            category, exact_products_dict = self.ktru_refinements_dom()
 
-        margin = self.driver.find_elements(by=By.XPATH, value='//li[@class="hover:text-sky-500 mb-2"]')[-1]
-        margin = margin.get_attribute('style')[:-1]
+        if verified and exact_products_dict:
+            self.cache_put('ktru_search', product_name, [category, exact_products_dict])
+            if self.ktru_mirror is not None:
+                self.ktru_mirror.record_refinements(product_name, product_link, product_title, exact_products_dict)
 
-        exact_products = self.driver.find_elements(by=By.XPATH, value=f'//li[@style="{margin}"]/a')
+        return category, exact_products_dict
 
-        exact_products_dict = {}
-        category = None
+    @staticmethod
+    def refinements_signature(refinements):
+        category, exact_products_dict = refinements
+        return normalize_value(category or ''), sorted(normalize_value(value) for value in exact_products_dict)
 
-        for exact_product in exact_products[1:]:
-            exact_product_ref = exact_product.get_attribute('href')
-            exact_product_name = exact_product.text
+    def live_refinements(self, refinements):
+        """
+        Сверка уточнений из ответа API со списком на странице по атрибуту и набору значений.
+        :return: None, если совпадают; уточнения со страницы, если отличаются;
+                 False, если список на странице не появился
+        """
+        xpath = '//li[@class="hover:text-sky-500 mb-2"]'
+        try:
+            self.waiter.until('goszakupki_ktru_list', EC.presence_of_element_located((By.XPATH, xpath)))
+        except TimeoutException:
+            return False
+
+        signature = self.refinements_signature(refinements)
+        for quiet in (False, True):
+            if quiet:
+                # список мог ещё дорисовываться
+                self.waiter.dom_quiet('goszakupki_ktru_list')
+            try:
+                live = self.ktru_refinements_dom()
+            except Exception as e:
+                live = None
+            if live is not None and self.refinements_signature(live) == signature:
+                return None
+        return live if live is not None and live[1] else False
 
-            cat = re.search(r'\((.*)\:(.*)\)', exact_product_name)
-            exact_products_dict[cat[2]] = [exact_product_ref, exact_product_name]
+    def goszakupki_data(self, extractor, xpath, driver=None):
+        """
+        Условие ожидания данных госзакупок: ответ API, из которого extractor что-то извлёк,
+        или появление этих данных на странице (по xpath).
+        :return: ('json', данные) | ('dom', None) | False, пока нет ни того, ни другого
+        """
+        if self.json_capture is not None and (data := self.json_capture.find(extractor)):
+            return 'json', data
+        if self.driver.find_elements(by=By.XPATH, value=xpath):
+            # страница нарисована - ответ, по которому она рисовалась, мог прийти между проверками
+            if self.json_capture is not None and (data := self.json_capture.find(extractor)):
+                return 'json', data
+            return 'dom', None
+        return False
 
-            if category is None:
-                category = cat[1]
+    def ktru_refinements_dom(self):
+        """
+        Сбор списка уточнений КТРУ со страницы.
+        :return: (category, {значение: [ссылка, название]})
+        """
+        with tracing.span('extract:ktru_refinements'):
+            margin = self.driver.find_elements(by=By.XPATH, value='//li[@class="hover:text-sky-500 mb-2"]')[-1]
+            margin = margin.get_attribute('style')[:-1]
 
-        embedded_dict = {}
+            exact_products = self.driver.find_elements(by=By.XPATH, value=f'//li[@style="{margin}"]/a')
 
-        logger.debug('choice_params:\n%s' % str(choice_params))
+            exact_products_dict = {}
+            category = None
 
-        for key in choice_params.keys():
-            embed = self.get_embedding([key])['embeddings'][0]
-            embedded_dict[key] = embed
+            for exact_product in exact_products[1:]:
+                exact_product_ref = exact_product.get_attribute('href')
+                exact_product_name = exact_product.text
 
-        res = self.get_embedding.get_nearest(category, embedded_dict)
+                cat = re.search(r'\((.*)\:(.*)\)', exact_product_name)
+                exact_products_dict[cat[2]] = [exact_product_ref, exact_product_name]
 
-        category_value = choice_params[res[0]]
+                if category is None:
+                    category = cat[1]
 
-        # сначала ищем точное совпадение
-        if category_value in list(exact_products_dict.keys()):
-            correct_ref, correct_name = exact_products_dict[category_value]
-            self.results_queue.put(('success', 'goszakupki_search', [correct_ref, correct_name]))
-        elif (match := re.search(r'\d+', category_value)) is not None:
-            category_value = float(match[0])
-
-            delta = []
-
-            for key, value in exact_products_dict.items():
-                key = key.strip().split()
-                if key[0] in ['≤', '≥', '<', '>']:
-                    sign, number = key
-                    number = float(number)
-                    category_value = float(category_value)
-
-                    if sign == '≤' and category_value <= number:
-                        delta.append(number - category_value)
-                    elif sign == '<' and category_value < number:
-                        delta.append(number - category_value)
-                    elif sign == '≥' and category_value >= number:
-                        delta.append(category_value - number)
-                    elif sign == '>' and category_value > number:
-                        delta.append(category_value - number)
-                    else:
-                        delta.append(np.inf)
-
-            _, product_data = list(exact_products_dict.items())[np.argmin(delta)]
-            correct_ref, correct_name = product_data
-            self.results_queue.put(('success', 'goszakupki_search', [correct_ref, correct_name]))
-        else:
-            self.results_queue.put(('fail', 'goszakupki_search', [category, exact_products_dict]))
+        return category, exact_products_dict
 
     def copy_chars(self):
         locator = (By.XPATH,
                    "//button[.//span[contains(normalize-space(.), 'Копировать характеристики')]]"
                    )
-        copy_button = WebDriverWait(self.driver, 10).until(
-            EC.element_to_be_clickable(locator)
-        )
+        copy_button = self.waiter.until('copy_button', EC.element_to_be_clickable(locator))
 
         actions = ActionChains(self.driver)
         actions.move_to_element(copy_button).pause(1).click().perform()
 
-        copy_button = WebDriverWait(self.driver, 10).until(
-            EC.element_to_be_clickable(locator)
-        )
+        copy_button = self.waiter.until('copy_button', EC.element_to_be_clickable(locator))
         actions = ActionChains(self.driver)
         actions.move_to_element(copy_button).pause(1).click().perform()
 
+    @cancellable_stage('match_params')
     def match_params(self, choice_params, goszakupki_ref):
         """
-        Получение параметров + связка
+        Получение параметров + связка.
+        Сначала все строки таблицы КТРУ собираются в обычные данные, затем выбранные значения
+        проставляются одним пакетным вызовом.
         :param choice_params:
         :param goszakupki_ref:
         :return:
@@ -272,110 +673,289 @@ class Tools:
 
         logger.info('Ищу характеристики товара на сайте госзакупки по адресу %s' % goszakupki_ref)
 
-        embedded_dict = {}
-        results = []
+        rows = self.cache_get('ktru_table', goszakupki_ref)
+        source = 'cache' if rows is not None else None
+        if rows is None and self.ktru_mirror is not None and not self.cache_bypass:
+            rows = self.ktru_mirror.table(goszakupki_ref)
+            source = 'mirror' if rows is not None else None
+        page_loaded = rows is None
 
-        for key in choice_params.keys():
-            embed = self.get_embedding([key])['embeddings'][0]
-            embedded_dict[key] = embed
+        if rows is None:
+            self.open(goszakupki_ref)
 
-        self.driver.get(goszakupki_ref)
+            # таблица из ответа API не ждёт отрисовки страницы; со страницей она сверяется перед выбором значений
+            source, rows = self.waiter.until('goszakupki_table', functools.partial(
+                self.goszakupki_data, extract_characteristics, GOSZAKUPKI_ROWS_XPATH
+            ))
+            if source == 'dom':
+                rows = self.goszakupki_rows()
+                self.record_table(goszakupki_ref, rows)
 
-        time.sleep(3)
-        tables = self.driver.find_elements(by=By.XPATH, value='//tr[count(td) = 2 and count(*) = 2]')
+        if self.check_cancelled():
+            self.results_queue.put(('stopped', 'match_params', ''))
+            return
 
-        # Перебираем все найденные строки
-        for row in tables:
-            # Находим все ячейки td в текущей строке
-            if self.check_cancelled():
-                self.results_queue.put(('stopped', 'match_params', ''))
-                return
+        results, selection = self.match_rows(rows, choice_params)
+
+        # при попадании в кэш страница ещё не открыта, а выбирать значения нужно на ней
+        if not page_loaded:
+            self.open(goszakupki_ref)
+        if source != 'dom':
+            self.waiter.until('goszakupki_table', EC.presence_of_element_located((By.XPATH, GOSZAKUPKI_ROWS_XPATH)))
+
+        if source in ('json', 'cache', 'mirror'):
+            # таблица на сайте могла измениться после сохранения в кэш или зеркало
+            live_rows = self.live_table(rows)
+            if live_rows is not None:
+                logger.warning('Таблица КТРУ (%s) не совпадает со страницей, беру её со страницы' % source)
+                rows = live_rows
+                results, selection = self.match_rows(rows, choice_params)
+            # в кэш и зеркало попадает только таблица, сверенная со страницей
+            if source == 'json' or live_rows is not None:
+                self.record_table(goszakupki_ref, rows)
+
+        for row_idx, applied in self.apply_selection(selection).items():
+            if not applied:
+                logger.warning('Не удалось выбрать значение характеристики %s' % results[row_idx]['name'])
+                results[row_idx]['default_value'] = ''
+                results[row_idx]['description'] = ''
+                results[row_idx]['score'] = None
+
+        self.results_queue.put(('success', 'goszakupki_parsing', results))
+
+    def goszakupki_rows(self, quiet=True):
+        """
+        Сбор таблицы характеристик КТРУ со страницы.
+        :param quiet: bool - дождаться окончания отрисовки страницы
+        """
+        if quiet:
+            self.waiter.dom_quiet('goszakupki_table')
+
+        rows = None
+        if self.extraction_mode == 'script':
+            rows = self.goszakupki_rows_script()
+        if rows is None:
+            rows = self.goszakupki_rows_selenium()
+        return rows
+
+    @staticmethod
+    def table_signature(rows):
+        return [(normalize_value(row['name']), len(row['values'])) for row in rows]
+
+    def live_table(self, rows):
+        """
+        Сверка таблицы, полученной не со страницы, с открытой страницей по названиям строк и числу вариантов:
+        значения выбираются по номерам строк и вариантов, поэтому таблицы должны совпадать.
+        :return: list[dict] | None - таблица со страницы, если она отличается; None, если совпадает
+        """
+        signature = self.table_signature(rows)
+        live_rows = self.goszakupki_rows(quiet=False)
+        if self.table_signature(live_rows) == signature:
+            return None
+
+        # страница могла ещё дорисовываться
+        live_rows = self.goszakupki_rows()
+        if self.table_signature(live_rows) == signature:
+            return None
+        return live_rows
+
+    def record_table(self, goszakupki_ref, rows):
+        if rows:
+            self.cache_put('ktru_table', goszakupki_ref, rows)
+            if self.ktru_mirror is not None:
+                self.ktru_mirror.record_table(goszakupki_ref, rows)
+
+    def match_rows(self, rows, choice_params):
+        """
+        Сопоставление строк таблицы КТРУ с характеристиками ситилинка и выбор значений.
+        :return: (results, {номер строки: индекс значения})
+        """
+        param_names = [row['name'].split(',')[0] for row in rows]
+        pairs = self.match_names(param_names, list(choice_params.keys()))
+        value_index = self.value_index_for(choice_params)
+
+        results = []
+        selection = {}
+
+        for row_idx, (row, pair) in enumerate(zip(rows, pairs)):
+            param_name = param_names[row_idx]
+            values = [value.lower() for value in row['values']]
 
             current_result = {
                 'description': '',
-                'default_value': ''
+                'default_value': '',
+                'name': row['name'],
+                'values': values,
+                # номер строки таблицы - по нему значение выбирается повторно из интерфейса
+                'row': row_idx,
+                # близость названий строки и выбранной характеристики ситилинка
+                'score': None
             }
+            results.append(current_result)
 
-            cells = row.find_elements(by=By.XPATH, value='./td')
+            if pair is None:
+                continue
+
+            res, score = pair
+            category_value = choice_params[res]
+
+            try:
+                option_idx = self.choose_option(category_value, values, value_index)
+            except Exception as e:
+                option_idx = None
+
+            if option_idx is not None:
+                logger.debug('%s -> %s \t %s -> %s' % (param_name, res, score, values[option_idx]))
+                selection[row_idx] = option_idx
+                current_result['default_value'] = values[option_idx]
+                current_result['description'] = res
+                current_result['score'] = round(score, 4)
+
+        return results, selection
+
+    def match_names(self, param_names, keys):
+        """
+        Сопоставление названий строк КТРУ с названиями характеристик ситилинка.
+        :return: list - для каждой строки (ключ ситилинка, близость) или None
+        """
+        if self.matching == 'assignment':
+            _, pairs = self.get_embedding.assign(param_names, keys, ASSIGNMENT_MIN_SIMILARITY)
+            return pairs
+
+        _, top = self.get_embedding.match_many(param_names, keys)
+        return [nearest[0] if nearest else None for nearest in top]
+
+    def value_index_for(self, choice_params):
+        """
+        Обратный индекс значений характеристик ситилинка; строится один раз на товар
+        и используется всеми этапами, которые сравнивают значения.
+        """
+        if self._value_index is None or self._value_index.params != choice_params:
+            self._value_index = ValueIndex(dict(choice_params))
+        return self._value_index
+
+    @staticmethod
+    def choose_option(category_value, values, value_index):
+        """
+        Выбор значения характеристики госзакупок по значению характеристики ситилинка.
+        :param category_value: str - значение ближайшей характеристики ситилинка
+        :param values: list[str] - варианты значения на госзакупках (в нижнем регистре)
+        :param value_index: ValueIndex - значения всех характеристик ситилинка
+        :return: int | None - индекс выбранного варианта
+        """
+        normalized_values = [normalize_value(value) for value in values]
+        normalized_category = normalize_value(category_value)
+
+        if normalized_category in normalized_values:
+            return normalized_values.index(normalized_category)
+
+        if bool(re.search('[a-z]', values[0])) or (
+                bool(re.search('[а-я]', values[0])) and values[0] not in ['да', 'нет', 'есть']):
+            # вариант, совпадающий со значением любой характеристики товара
+            return value_index.find_normalized(normalized_values)
+
+        if (match := re.search(r'\d+', category_value)) is not None:
+            return Tools.closest_bound(float(match[0]), values)
+
+        return None
 
-            # Проверяем, что нашли ровно две ячейки
+    @staticmethod
+    def closest_bound(number, labels):
+        """
+        Поиск ближайшей подходящей границы вида "≤ 16", "> 2" для числа.
+        :param number: float - число
+        :param labels: list[str] - границы
+        :return: int | None - индекс границы в labels; None, если среди labels нет границ
+        """
+        delta = {}
+
+        for idx, label in enumerate(labels):
+            label = label.strip().split()
+            if len(label) == 2 and label[0] in ['≤', '≥', '<', '>']:
+                sign, bound = label
+                bound = float(bound)
+
+                if sign == '≤' and number <= bound:
+                    delta[idx] = bound - number
+                elif sign == '<' and number < bound:
+                    delta[idx] = bound - number
+                elif sign == '≥' and number >= bound:
+                    delta[idx] = number - bound
+                elif sign == '>' and number > bound:
+                    delta[idx] = number - bound
+                else:
+                    delta[idx] = np.inf
+
+        if len(delta) == 0:
+            return None
+
+        return min(delta, key=delta.get)
+
+    @tracing.traced('extract:goszakupki_script')
+    def goszakupki_rows_script(self):
+        """
+        Сбор всех строк таблицы характеристик КТРУ одним вызовом execute_script.
+        :return: list[dict] - [{'name': str, 'values': list[str]}, ...] или None при ошибке
+        """
+        try:
+            return json.loads(self.driver.execute_script(GOSZAKUPKI_ROWS_JS, GOSZAKUPKI_ROWS_XPATH))
+        except Exception as e:
+            logger.warning('Не удалось собрать таблицу характеристик скриптом, перехожу на обход элементов: %s' % e)
+            return None
+
+    @tracing.traced('extract:goszakupki_selenium')
+    def goszakupki_rows_selenium(self):
+        """
+        Сбор строк таблицы характеристик КТРУ обходом элементов через WebDriver.
+        :return: list[dict] - [{'name': str, 'values': list[str]}, ...]
+        """
+        rows = []
+
+        for row in self.driver.find_elements(by=By.XPATH, value=GOSZAKUPKI_ROWS_XPATH):
+            # Находим все ячейки td в текущей строке
+            cells = row.find_elements(by=By.XPATH, value='./td')
             if len(cells) == 2:
-                # Извлекаем текст из ячеек
-                param_name = cells[0].text
-                current_result['name'] = param_name
+                rows.append({'name': cells[0].text, 'values': cells[1].text.split('\n')})
+
+        return rows
 
-                if ',' in param_name:
-                    param_name = param_name.split(',')[0]
+    @tracing.traced('click:apply_selection')
+    def apply_selection(self, selection):
+        """
+        Выбор значений характеристик на странице КТРУ.
+        :param selection: dict {номер строки: индекс значения}
+        :return: dict {номер строки: True, если значение выбрано}
+        """
+        if not selection:
+            return {}
 
-                res, score = self.get_embedding.get_nearest(param_name, embedded_dict)
+        if self.extraction_mode == 'script':
+            try:
+                applied = json.loads(self.driver.execute_script(
+                    GOSZAKUPKI_APPLY_JS, GOSZAKUPKI_ROWS_XPATH, [[row, idx] for row, idx in selection.items()]
+                ))
+                return {int(row): ok for row, ok in applied.items()}
+            except Exception as e:
+                logger.warning('Не удалось выбрать значения скриптом, перехожу на клики по элементам: %s' % e)
 
-                category_value = choice_params[res].lower()
+        rows = self.driver.find_elements(by=By.XPATH, value=GOSZAKUPKI_ROWS_XPATH)
+        applied = {}
+        for row_idx, option_idx in selection.items():
+            try:
+                links = rows[row_idx].find_elements(by=By.XPATH, value='./td[2]//span')
+                links[option_idx].click()
+                applied[row_idx] = True
+            except Exception as e:
+                applied[row_idx] = False
 
-                values = [value.lower() for value in cells[1].text.split('\n')]
-                current_result['values'] = values
-                links = cells[1].find_elements(by=By.XPATH, value='.//span')
-                current_result['refs'] = {value: link for value, link in zip(values, links)}
+        return applied
 
-                try:
-                    if category_value in values:
-                        button = links[values.index(category_value)]
-                        logger.debug('%s -> %s \t %s ' % (param_name, res, score))
-
-                        button.click()
-                        current_result['default_value'] = category_value
-                        current_result['description'] = res
-
-                    elif bool(re.search('[a-z]', values[0])) or (
-                            bool(re.search('[а-я]', values[0])) and values[0] not in ['да', 'нет', 'есть']):
-                        flag = False
-                        for val_i, value in enumerate(values):
-                            for key in choice_params:
-                                if choice_params[key].lower() == value:
-                                    links[val_i].click()
-                                    current_result['default_value'] = value
-                                    current_result['description'] = res
-                                    flag = True
-                                    break
-                            if flag:
-                                break
-
-                    elif re.search(r'\d+', category_value) is not None:
-                        category_value = re.search(r'\d+', category_value)[0]
-                        category_value = float(category_value)
-
-                        delta = []
-
-                        for key, button in zip(values, links):
-                            key = key.strip().split()
-                            if key[0] in ['≤', '≥', '<', '>']:
-                                sign, number = key
-                                number = float(number)
-
-                                if sign == '≤' and category_value <= number:
-                                    delta.append(number - category_value)
-                                elif sign == '<' and category_value < number:
-                                    delta.append(number - category_value)
-                                elif sign == '≥' and category_value >= number:
-                                    delta.append(category_value - number)
-                                elif sign == '>' and category_value > number:
-                                    delta.append(category_value - number)
-                                else:
-                                    delta.append(np.inf)
-                        if len(delta) == 0:
-                            pass
-                        else:
-                            logger.debug('%s -> %s, %s' % (param_name, res, score))
-                            logger.debug('\t %s -> %s' % (category_value, values[np.argmin(delta)]))
-
-                            links[np.argmin(delta)].click()
-                            current_result['default_value'] = values[np.argmin(delta)]
-                            current_result['description'] = res
-                    else:
-                        pass
-                except Exception as e:
-                    pass
-            results.append(current_result)
-        self.results_queue.put(('success', 'goszakupki_parsing', results))
+    @tracing.traced('click:select_option')
+    def select_option(self, row_idx, option_idx):
+        """
+        Выбор значения характеристики пользователем из интерфейса.
+        """
+        return self.apply_selection({row_idx: option_idx}).get(row_idx, False)
 
     @staticmethod
     def get_effective_color(color, mode, widget):
@@ -0,0 +1,132 @@
+"""
+Вложенные замеры времени этапов с выгрузкой в формате Chrome Trace Event (JSON).
+
+Файл открывается в chrome://tracing или https://ui.perfetto.dev.
+Пока трассировка не включена, span() возвращает пустой контекст и ничего не записывает.
+В памяти хранятся последние MAX_EVENTS событий, чтобы долгий пакетный прогон не рос без ограничения.
+
+Пример:
+    with tracing.span('citilink_parsing', url=url):
+        ...
+
+    @tracing.traced('render:columns')
+    def show_columns_container(self):
+        ...
+"""
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+from logging_config import logger
+
+# Сколько последних событий хранится до save(); более старые отбрасываются
+MAX_EVENTS = 200_000
+
+
+class Tracer:
+    def __init__(self, max_events=MAX_EVENTS):
+        self.path = None
+        self.max_events = max_events
+        self.events = collections.deque(maxlen=max_events)
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._start = time.perf_counter_ns()
+        self._threads = {}
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def enable(self, path):
+        """
+        :param path: str - файл, в который save() запишет трассу
+        """
+        self.path = path
+        self.events = collections.deque(maxlen=self.max_events)
+        self.dropped = 0
+        self._start = time.perf_counter_ns()
+
+    def _now_us(self):
+        return (time.perf_counter_ns() - self._start) / 1000
+
+    @contextlib.contextmanager
+    def _span(self, name, args):
+        thread = threading.current_thread()
+        start = self._now_us()
+        try:
+            yield args
+        finally:
+            event = {'name': name, 'ph': 'X', 'ts': start, 'dur': self._now_us() - start,
+                     'pid': os.getpid(), 'tid': thread.ident}
+            if args:
+                event['args'] = {key: value if isinstance(value, (int, float, bool)) else str(value)
+                                 for key, value in args.items()}
+            with self._lock:
+                if len(self.events) == self.events.maxlen:
+                    self.dropped += 1
+                self.events.append(event)
+                self._threads.setdefault(thread.ident, thread.name)
+
+    def span(self, name, **args):
+        """
+        Замер вложенного участка. Аргументы попадают в args события;
+        внутри блока их можно дополнить через словарь, возвращаемый контекстом.
+        """
+        if self.path is None:
+            # свой словарь на каждый вызов: его можно дополнять и без включённой трассировки
+            return contextlib.nullcontext({})
+        return self._span(name, args)
+
+    def save(self):
+        """
+        Запись накопленных событий в файл. Без включённой трассировки ничего не делает.
+        """
+        if self.path is None:
+            return None
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+            dropped = self.dropped
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                    for tid, name in threads.items()]
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        logger.info('Трасса записана: %s (%d событий)' % (self.path, len(events)))
+        if dropped:
+            logger.warning('В трассу не попали %d самых ранних событий (предел %d)' % (dropped, self.max_events))
+        return self.path
+
+
+# Общий трассировщик процесса
+tracer = Tracer()
+
+
+def enable(path):
+    tracer.enable(path)
+
+
+def save():
+    return tracer.save()
+
+
+def span(name, **args):
+    return tracer.span(name, **args)
+
+
+def traced(name):
+    """
+    Декоратор: весь вызов метода - один участок трассы.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if tracer.path is None:
+                return function(*args, **kwargs)
+            with tracer.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,67 @@
+import re
+import unicodedata
+
+QUOTES_RE = re.compile(r'[«»"“”„\'’`]')
+SPACES_RE = re.compile(r'\s+')
+# число, прилипшее к единице измерения: "16гб" -> "16 гб" (но не "1920x1080")
+NUMBER_UNIT_RE = re.compile(r'(\d)\s*([a-zа-я]+)(?!\d)')
+# размеры: "1920 х 1080", "1920×1080" -> "1920x1080"
+DIMENSIONS_RE = re.compile(r'(\d)\s*[xх×*]\s*(?=\d)')
+
+# Написания единиц измерения, приводимые к одному
+UNIT_ALIASES = {
+    'gb': 'гб', 'гбайт': 'гб', 'tb': 'тб', 'тбайт': 'тб', 'mb': 'мб', 'мбайт': 'мб',
+    'ghz': 'ггц', 'mhz': 'мгц', 'hz': 'гц',
+    'mah': 'мач', 'мач.': 'мач', 'w': 'вт',
+    'дюйма': 'дюйм', 'дюймов': 'дюйм',
+    'мм.': 'мм', 'см.': 'см', 'кг.': 'кг', 'г.': 'г',
+}
+UNIT_RE = re.compile(r'\b(%s)(?=\s|$)' % '|'.join(re.escape(unit) for unit in UNIT_ALIASES))
+
+
+def normalize_value(value):
+    """
+    Значение характеристики в сравнимом виде: без регистра, кавычек и лишних пробелов,
+    с единым написанием единиц измерения и десятичной точкой.
+    """
+    value = unicodedata.normalize('NFC', str(value)).lower().replace('ё', 'е')
+    value = QUOTES_RE.sub('', value)
+    value = re.sub(r'(\d),(\d)', r'\1.\2', value)
+    value = DIMENSIONS_RE.sub(r'\1x', value)
+    value = NUMBER_UNIT_RE.sub(r'\1 \2', value)
+    value = SPACES_RE.sub(' ', value).strip()
+    return UNIT_RE.sub(lambda match: UNIT_ALIASES[match[1]], value)
+
+
+class ValueIndex:
+    """
+    Обратный индекс характеристик товара: нормализованное значение -> названия характеристик с этим значением.
+    Строится один раз на товар, поиск значения - обращение к словарю.
+    """
+    def __init__(self, params):
+        """
+        :param params: dict - {название характеристики: значение}
+        """
+        self.params = params
+        self._keys = {}
+        for key, value in params.items():
+            self._keys.setdefault(normalize_value(value), []).append(key)
+
+    def __contains__(self, value):
+        return normalize_value(value) in self._keys
+
+    def keys_for(self, value):
+        """
+        :return: list[str] - характеристики, у которых такое же значение
+        """
+        return self._keys.get(normalize_value(value), [])
+
+    def find_normalized(self, normalized_values):
+        """
+        Первое из уже нормализованных значений, которое встречается среди характеристик.
+        :return: int | None - индекс значения
+        """
+        for idx, value in enumerate(normalized_values):
+            if value in self._keys:
+                return idx
+        return None
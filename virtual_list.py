@@ -0,0 +1,130 @@
+import tkinter as tk
+
+import customtkinter as ctk
+
+
+class VirtualList(ctk.CTkFrame):
+    """
+    Прокручиваемый список строк одинаковой высоты, в котором виджеты создаются только
+    для видимых строк (плюс overscan сверху и снизу) и переиспользуются при прокрутке.
+    Время отрисовки и память не зависят от числа строк.
+    """
+    def __init__(self, master, count, row_height, make_row, bind_row, title=None, height=600, overscan=2,
+                 **kwargs):
+        """
+        :param count: int - число строк
+        :param row_height: int - высота строки вместе с отступами, px (без учёта масштаба)
+        :param make_row: callable(parent) -> widget - создание пустой строки
+        :param bind_row: callable(widget, idx) - заполнение строки данными строки idx
+        :param title: str | None - заголовок над списком
+        :param height: int - видимая высота списка, px
+        :param overscan: int - сколько строк держать готовыми за краями видимой области
+        """
+        super().__init__(master, **kwargs)
+        self.count = count
+        self.row_height = row_height
+        self.make_row = make_row
+        self.bind_row = bind_row
+        self.overscan = overscan
+
+        # {индекс строки: (виджет, элемент canvas)} и свободные виджеты для повторного использования
+        self._rows = {}
+        self._free = []
+
+        if title is not None:
+            ctk.CTkLabel(master=self, text=title, font=("Arial", 16)).pack(pady=10, padx=10, fill="x")
+
+        self.canvas = tk.Canvas(
+            master=self,
+            height=self._apply_widget_scaling(height),
+            bg=self._apply_appearance_mode(self._fg_color),
+            yscrollincrement=self._apply_widget_scaling(20),
+            highlightthickness=0,
+            bd=0
+        )
+        self.scrollbar = ctk.CTkScrollbar(master=self, command=self.yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        # колесо мыши ловится на всём окне (строки - отдельные виджеты); свои обработчики снимаются в destroy
+        self._wheel_bindings = [
+            (sequence, self.bind_all(sequence, self._on_mouse_wheel, add="+"))
+            for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>")
+        ]
+
+    def destroy(self):
+        for sequence, funcid in self._wheel_bindings:
+            self._unbind_all(sequence, funcid)
+        self._wheel_bindings = []
+        super().destroy()
+
+    def _unbind_all(self, sequence, funcid):
+        """
+        Снятие одного обработчика bind_all: unbind_all снял бы и обработчики других виджетов.
+        """
+        script = self.tk.call('bind', 'all', sequence)
+        lines = [line for line in script.split('\n') if funcid not in line]
+        self.tk.call('bind', 'all', sequence, '\n'.join(lines))
+        self.deletecommand(funcid)
+
+    def refresh(self):
+        """
+        Привязка виджетов к строкам, попавшим в видимую область.
+        """
+        row_height = self._apply_widget_scaling(self.row_height)
+        gap = self._apply_widget_scaling(10)
+        width = max(self.canvas.winfo_width() - 2 * gap, 1)
+
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), row_height * self.count))
+
+        top = self.canvas.canvasy(0)
+        first = max(int(top // row_height) - self.overscan, 0)
+        last = min(int((top + self.canvas.winfo_height()) // row_height) + self.overscan + 1, self.count)
+
+        for idx in [idx for idx in self._rows if not first <= idx < last]:
+            row, item = self._rows.pop(idx)
+            # вне области прокрутки строку не видно, виджет остаётся для следующих строк
+            self.canvas.coords(item, 0, -2 * row_height)
+            self._free.append((row, item))
+
+        for idx in range(first, last):
+            if idx not in self._rows:
+                if self._free:
+                    row, item = self._free.pop()
+                else:
+                    row = self.make_row(self.canvas)
+                    item = self.canvas.create_window(0, 0, window=row, anchor="nw")
+                self.bind_row(row, idx)
+                self.canvas.coords(item, gap, idx * row_height + gap / 2)
+                self._rows[idx] = (row, item)
+            self.canvas.itemconfigure(self._rows[idx][1], width=width, height=row_height - gap)
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def scroll_to_index(self, idx):
+        """
+        Прокрутка так, чтобы строка idx была видна (с одной строкой над ней).
+        """
+        self.canvas.yview_moveto(max(idx - 1, 0) / max(self.count, 1))
+        self.refresh()
+
+    def _contains(self, widget):
+        while isinstance(widget, tk.Misc):
+            if widget is self.canvas:
+                return True
+            widget = widget.master
+        return False
+
+    def _on_mouse_wheel(self, event):
+        if not self.winfo_exists() or not self._contains(event.widget):
+            return
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.canvas.yview_scroll(-1, "units")
+        else:
+            self.canvas.yview_scroll(1, "units")
+        self.refresh()
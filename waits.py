@@ -0,0 +1,151 @@
+import collections
+import time
+
+from selenium.common.exceptions import JavascriptException, TimeoutException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from logging_config import logger
+import tracing
+
+# Предельное время ожидания по этапам, с
+STAGE_TIMEOUTS = {
+    'citilink_search': 10,
+    'citilink_all_chars': 10,
+    'citilink_chars': 10,
+    'goszakupki_search': 10,
+    'goszakupki_ktru_list': 10,
+    'goszakupki_table': 15,
+    'copy_button': 10,
+    'navigation': 30,
+}
+
+# Частота опроса условий, с
+POLL_FREQUENCY = 0.05
+
+# Сколько последних ожиданий хранится в PageWaiter.timings
+MAX_TIMINGS = 1000
+
+# Запоминает время последнего изменения DOM (MutationObserver) в window.__gossyLastMutation
+DOM_OBSERVER_JS = """
+if (!window.__gossyObserver) {
+    window.__gossyObserver = new MutationObserver(() => { window.__gossyLastMutation = performance.now(); });
+    window.__gossyObserver.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+}
+window.__gossyLastMutation = performance.now();
+"""
+
+
+class Cancelled(Exception):
+    """
+    Ожидание прервано флагом остановки.
+    """
+
+
+class PageWaiter:
+    """
+    Ожидание готовности страницы по явным условиям вместо фиксированных пауз.
+    Каждое ожидание ограничено временем своего этапа, фактическая длительность последних MAX_TIMINGS
+    ожиданий сохраняется в timings.
+    Флаг остановки проверяется при каждом опросе условия.
+    """
+    def __init__(self, driver, timeouts=None, cancel_flag=None):
+        """
+        :param driver: WebDriver
+        :param timeouts: dict | None - предельное время по этапам, дополняет STAGE_TIMEOUTS
+        :param cancel_flag: threading.Event | None - при установке флага ожидание прерывается исключением Cancelled
+        """
+        self.driver = driver
+        self.cancel_flag = cancel_flag
+        self.timeouts = dict(STAGE_TIMEOUTS, **(timeouts or {}))
+        self.timings = collections.deque(maxlen=MAX_TIMINGS)
+
+    def _record(self, stage, start, ok, note=''):
+        elapsed = time.perf_counter() - start
+        self.timings.append({'stage': stage, 'seconds': round(elapsed, 3), 'ok': ok})
+        logger.debug('Ожидание %s: %.3f с%s' % (stage, elapsed, ' (%s)' % note if note else ''))
+
+    def until(self, stage, condition, timeout=None, ignored_exceptions=None):
+        """
+        Ожидание условия (expected_conditions или функция от драйвера).
+        :param stage: str - название этапа, по нему берётся предельное время
+        :param condition: callable - условие
+        :param timeout: float | None - предельное время, по умолчанию из STAGE_TIMEOUTS
+        :param ignored_exceptions: tuple | None - исключения условия, при которых опрос продолжается
+        :return: результат условия; TimeoutException, если время истекло; Cancelled, если поиск остановлен
+        """
+        def cancellable(driver):
+            if self.cancel_flag is not None and self.cancel_flag.is_set():
+                raise Cancelled(stage)
+            return condition(driver)
+
+        start = time.perf_counter()
+        try:
+            with tracing.span('wait:' + stage):
+                result = WebDriverWait(
+                    self.driver,
+                    timeout if timeout is not None else self.timeouts.get(stage, 10),
+                    poll_frequency=POLL_FREQUENCY,
+                    ignored_exceptions=ignored_exceptions
+                ).until(cancellable)
+        except TimeoutException:
+            self._record(stage, start, False, 'истекло время')
+            raise
+        except Cancelled:
+            self._record(stage, start, False, 'остановлено')
+            raise
+        self._record(stage, start, True)
+        return result
+
+    def dom_quiet(self, stage, quiet_ms=300, timeout=None):
+        """
+        Ожидание, пока страница перестанет перерисовываться.
+        В отличие от until, по истечении времени не бросает исключение.
+        :return: bool - дождались ли тишины
+        """
+        self.driver.execute_script(DOM_OBSERVER_JS)
+        try:
+            self.until(
+                stage + ':dom_quiet',
+                lambda driver: driver.execute_script('return performance.now() - window.__gossyLastMutation') >= quiet_ms,
+                timeout if timeout is not None else self.timeouts.get(stage, 10)
+            )
+        except TimeoutException:
+            return False
+        return True
+
+    def mark_document(self):
+        """
+        Метка текущего документа перед переходом: по её исчезновению видно, что загружается новая страница.
+        :return: str - метка
+        """
+        token = str(time.perf_counter_ns())
+        try:
+            self.driver.execute_script('window.__gossyNavToken = arguments[0];', token)
+        except Exception as e:
+            pass
+        return token
+
+    def navigation(self, token, timeout=None):
+        """
+        Ожидание, пока новый документ не будет разобран (аналог DOMContentLoaded, как у стратегии eager).
+        :param token: str - метка старого документа из mark_document
+        """
+        return self.until('navigation', lambda driver: driver.execute_script(
+            "return window.__gossyNavToken !== arguments[0] && document.readyState !== 'loading';", token
+        ), timeout, ignored_exceptions=(JavascriptException,))
+
+    def scroll_and_click(self, stage, locator, timeout=None):
+        """
+        Прокрутка к элементу и клик, как только он станет кликабельным.
+        Если обычный клик перехвачен другим элементом, кликаем через JavaScript.
+        """
+        element = self.until(stage, EC.presence_of_element_located(locator), timeout)
+        self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
+        element = self.until(stage, EC.element_to_be_clickable(locator), timeout)
+        with tracing.span('click:' + stage):
+            try:
+                element.click()
+            except Exception as e:
+                self.driver.execute_script("arguments[0].click();", element)
+        return element